@@ -0,0 +1,277 @@
+"""
+Enrutado de peticiones entre varios proveedores/modelos de IA
+
+Mide la latencia (p50/p95 de las últimas llamadas) y la tasa de errores
+reciente de cada destino, ordena los destinos del más sano al menos sano
+y pasa al siguiente si uno falla. Opcionalmente lanza una petición de
+cobertura (hedged request) al siguiente destino cuando la primera supera
+un percentil de latencia, y se queda con la primera respuesta válida.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple, TypeVar
+import asyncio
+import time
+
+from . import metrics
+
+T = TypeVar("T")
+
+SUPPORTED_PROVIDERS = ("openai", "gemini", "mock")
+
+
+@dataclass(frozen=True)
+class Target:
+    """Proveedor y modelo al que se puede enviar una petición"""
+    provider: str
+    model: str
+    
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_targets(spec: str) -> List[Target]:
+    """
+    Convierte "openai:gpt-4o-mini, gemini:gemini-1.5-flash" en una lista de destinos
+    
+    Raises:
+        ValueError: Si una entrada no tiene el formato proveedor:modelo o el
+            proveedor no está soportado
+    """
+    targets = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        
+        provider, _, model = entry.partition(":")
+        if not model:
+            raise ValueError(f"Destino de IA inválido (se espera proveedor:modelo): {entry}")
+        if provider not in SUPPORTED_PROVIDERS:
+            raise ValueError(f"Proveedor de IA no soportado: {provider}")
+        targets.append(Target(provider, model))
+    return targets
+
+
+class TargetStats:
+    """Latencias de las últimas llamadas y resultados recientes de un destino"""
+    
+    def __init__(self, window: int, error_window: float):
+        self.error_window = error_window
+        self._latencies: Deque[float] = deque(maxlen=window)
+        # (instante, éxito) de las llamadas de los últimos error_window segundos
+        self._outcomes: Deque[Tuple[float, bool]] = deque(maxlen=window)
+    
+    def record(self, latency_ms: Optional[float], ok: bool):
+        """Registra una llamada (latency_ms None = solo el resultado)"""
+        if ok and latency_ms is not None:
+            self._latencies.append(latency_ms)
+        self._outcomes.append((time.monotonic(), ok))
+    
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Percentil de latencia en ms (None sin muestras)"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+    
+    @property
+    def error_rate(self) -> float:
+        """Proporción de errores en la ventana de tiempo reciente"""
+        cutoff = time.monotonic() - self.error_window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+        if not self._outcomes:
+            return 0.0
+        return sum(not ok for _, ok in self._outcomes) / len(self._outcomes)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "samples": self.samples
+        }
+
+
+class AIRouter:
+    """Elige el destino más sano y gestiona failover y peticiones de cobertura"""
+    
+    def __init__(
+        self,
+        targets: List[Target],
+        window: int = 200,
+        error_window: float = 60.0,
+        max_error_rate: float = 0.5,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20
+    ):
+        if not targets:
+            raise ValueError("El router necesita al menos un destino de IA")
+        self.targets = targets
+        self.max_error_rate = max_error_rate
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.stats: Dict[Target, TargetStats] = {
+            target: TargetStats(window, error_window) for target in targets
+        }
+        self.failovers = 0
+        self.hedges = 0
+    
+    @property
+    def key(self) -> str:
+        """Identifica el conjunto de destinos (para claves de caché)"""
+        return ",".join(target.name for target in self.targets)
+    
+    def ranked(self) -> List[Target]:
+        """
+        Destinos del más sano al menos sano
+        
+        Primero los que no superan max_error_rate, por p50 (los que aún no
+        tienen muestras van delante para medirlos); después el resto, por
+        tasa de errores. A igualdad se respeta el orden configurado.
+        """
+        def score(target: Target):
+            stats = self.stats[target]
+            error_rate = stats.error_rate
+            if error_rate > self.max_error_rate:
+                return (1, error_rate)
+            return (0, stats.percentile(50) or 0.0)
+        
+        return sorted(self.targets, key=score)
+    
+    def record(self, target: Target, latency_ms: Optional[float], ok: bool):
+        self.stats[target].record(latency_ms, ok)
+        metrics.observe_ai_call(target.provider, target.model, latency_ms, ok)
+    
+    async def call(self, func: Callable[[Target], Awaitable[T]]) -> T:
+        """
+        Ejecuta func(target) en el destino más sano, pasando al siguiente si falla
+        
+        Raises:
+            Exception: El error del último destino si fallan todos
+        """
+        order = self.ranked()
+        error: Optional[Exception] = None
+        # Destinos ya llamados (incluida la cobertura): no se repiten como fallback
+        attempted: Set[Target] = set()
+        
+        for index, target in enumerate(order):
+            if target in attempted:
+                continue
+            if attempted:
+                self.failovers += 1
+            fallbacks = [fallback for fallback in order[index + 1:] if fallback not in attempted]
+            try:
+                return await self._attempt(target, fallbacks, func, attempted)
+            except Exception as e:
+                error = e
+        
+        raise error
+    
+    async def stream(self, func: Callable[[Target], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Emite el stream de func(target) del destino más sano
+        
+        Solo se cambia de destino si falla antes del primer fragmento: una vez
+        enviado texto al cliente no se puede mezclar con otra respuesta. Los
+        streams registran errores pero no latencia (no es comparable).
+        """
+        error: Optional[Exception] = None
+        
+        for index, target in enumerate(self.ranked()):
+            if index > 0:
+                self.failovers += 1
+            started = False
+            try:
+                async for delta in func(target):
+                    started = True
+                    yield delta
+            except Exception as e:
+                self.record(target, None, ok=False)
+                if started:
+                    raise
+                error = e
+                continue
+            
+            self.record(target, None, ok=True)
+            return
+        
+        raise error
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado de cada destino y contadores de failover y cobertura"""
+        return {
+            "targets": {target.name: self.stats[target].snapshot() for target in self.ranked()},
+            "failovers": self.failovers,
+            "hedges": self.hedges
+        }
+    
+    async def _timed(self, target: Target, func: Callable[[Target], Awaitable[T]]) -> T:
+        """Ejecuta func(target) registrando su latencia y resultado"""
+        start = time.perf_counter()
+        try:
+            result = await func(target)
+        except Exception:
+            self.record(target, None, ok=False)
+            raise
+        
+        self.record(target, (time.perf_counter() - start) * 1000, ok=True)
+        return result
+    
+    def _hedge_delay(self, target: Target) -> Optional[float]:
+        """Segundos a esperar antes de la petición de cobertura (None = no cubrir)"""
+        if self.hedge_percentile is None:
+            return None
+        
+        stats = self.stats[target]
+        if stats.samples < self.hedge_min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile) / 1000
+    
+    async def _attempt(
+        self,
+        target: Target,
+        fallbacks: List[Target],
+        func: Callable[[Target], Awaitable[T]],
+        attempted: Set[Target]
+    ) -> T:
+        """
+        Llamada a un destino, con petición de cobertura si tarda más de lo normal
+        
+        Añade a attempted los destinos a los que llama.
+        """
+        attempted.add(target)
+        delay = self._hedge_delay(target)
+        if delay is None:
+            return await self._timed(target, func)
+        
+        tasks = {asyncio.ensure_future(self._timed(target, func))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # Cubrir con el siguiente destino (o el mismo si es el único)
+                self.hedges += 1
+                hedge_target = fallbacks[0] if fallbacks else target
+                attempted.add(hedge_target)
+                tasks.add(asyncio.ensure_future(self._timed(hedge_target, func)))
+            
+            error: Optional[BaseException] = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -1,10 +1,17 @@
 """
 Servicio de integración con APIs de IA
-Soporta OpenAI (ChatGPT) y Google Gemini
+Soporta OpenAI (ChatGPT), Google Gemini y un proveedor simulado (mock)
 """
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional
+from . import metrics
+from .ai_router import AIRouter, Target, parse_targets
+from .cache import TTLCache
 from .config import settings
-import requests
+from .history_cache import ChatHistory, to_gemini_message
+from .mock_provider import MockProvider
+from .singleflight import SingleFlight
+import hashlib
+import httpx
 import json
 
 
@@ -12,104 +19,393 @@ class AIService:
     """Servicio para interactuar con APIs de IA"""
     
     def __init__(self):
-        self.provider = settings.AI_PROVIDER
+        # Destinos (proveedor:modelo) entre los que se reparten las peticiones
+        targets = parse_targets(settings.AI_PROVIDERS) or [Target(settings.AI_PROVIDER, settings.AI_MODEL)]
+        self.router = AIRouter(
+            targets,
+            window=settings.AI_ROUTER_WINDOW,
+            error_window=settings.AI_ROUTER_ERROR_WINDOW,
+            max_error_rate=settings.AI_ROUTER_MAX_ERROR_RATE,
+            hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+            hedge_min_samples=settings.AI_HEDGE_MIN_SAMPLES
+        )
         self.system_prompt = settings.SYSTEM_PROMPT
+        # Un cliente HTTP asíncrono (con su pool keep-alive) por proveedor
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # Proveedor simulado (sin red), usado por los destinos "mock"
+        self.mock = MockProvider.from_settings()
+        # Caché de respuestas idénticas (opcional, por despliegue)
+        self.response_cache: Optional[TTLCache] = None
+        if settings.RESPONSE_CACHE_ENABLED:
+            self.response_cache = TTLCache(
+                max_size=settings.RESPONSE_CACHE_MAX_SIZE,
+                ttl=settings.RESPONSE_CACHE_TTL
+            )
+        # Peticiones idénticas simultáneas comparten una llamada al proveedor
+        self.singleflight: Optional[SingleFlight] = SingleFlight() if settings.SINGLEFLIGHT_ENABLED else None
+    
+    def _get_client(self, provider: str) -> httpx.AsyncClient:
+        """
+        Devuelve el cliente HTTP compartido del proveedor, creándolo si hace falta
+        
+        Cada proveedor apunta a un único host, así que los límites del pool
+        actúan como límites por host.
+        """
+        client = self._clients.get(provider)
+        
+        if client is None or client.is_closed:
+            base_urls = {
+                "openai": settings.OPENAI_BASE_URL,
+                "gemini": settings.GEMINI_BASE_URL,
+            }
+            client = httpx.AsyncClient(
+                base_url=base_urls[provider],
+                limits=httpx.Limits(
+                    max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    settings.AI_HTTP_TIMEOUT,
+                    pool=settings.AI_HTTP_POOL_TIMEOUT
+                )
+            )
+            self._clients[provider] = client
+        
+        return client
     
-    async def generate_response(self, messages: List[Dict[str, str]]) -> str:
+    async def aclose(self):
+        """Cierra los clientes HTTP y sus conexiones abiertas"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+    
+    async def generate_response(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> str:
         """
-        Genera respuesta usando el proveedor de IA configurado
+        Genera respuesta usando el proveedor de IA más sano del router
         
         Args:
             messages: Lista de mensajes en formato [{"role": "user/assistant", "content": "..."}]
+            context: Texto adicional para el system prompt (p. ej. resumen de turnos antiguos)
         
         Returns:
             str: Respuesta generada por la IA
         """
-        if self.provider == "openai":
-            return await self._openai_generate(messages)
-        elif self.provider == "gemini":
-            return await self._gemini_generate(messages)
+        cache_key = self._response_cache_key(messages, context)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if self.singleflight is not None:
+            response = await self.singleflight.do(
+                self._request_key(messages, context),
+                lambda: self._generate(messages, context)
+            )
         else:
-            raise ValueError(f"Proveedor de IA no soportado: {self.provider}")
+            response = await self._generate(messages, context)
+        
+        if cache_key:
+            self.response_cache.set(cache_key, response)
+        
+        return response
     
-    async def _openai_generate(self, messages: List[Dict[str, str]]) -> str:
-        """Genera respuesta usando OpenAI API"""
+    async def _generate(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> str:
+        """Llama a los proveedores a través del router (sin caché ni agrupación)"""
+        async def call(target: Target) -> str:
+            if target.provider == "openai":
+                return await self._openai_generate(messages, context, target.model)
+            elif target.provider == "gemini":
+                return await self._gemini_generate(messages, context, target.model)
+            elif target.provider == "mock":
+                return await self.mock.generate(messages, self._build_system_prompt(context), target.model)
+            else:
+                raise ValueError(f"Proveedor de IA no soportado: {target.provider}")
+        
+        return await self.router.call(call)
+    
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Genera respuesta en streaming usando el proveedor de IA más sano del router
+        
+        Args:
+            messages: Lista de mensajes en formato [{"role": "user/assistant", "content": "..."}]
+            context: Texto adicional para el system prompt (p. ej. resumen de turnos antiguos)
+        
+        Yields:
+            str: Fragmentos (deltas) de texto a medida que llegan del proveedor
+        """
+        cache_key = self._response_cache_key(messages, context)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        def open_stream(target: Target) -> AsyncIterator[str]:
+            if target.provider == "openai":
+                return self._openai_stream(messages, context, target.model)
+            elif target.provider == "gemini":
+                return self._gemini_stream(messages, context, target.model)
+            elif target.provider == "mock":
+                return self.mock.stream(messages, self._build_system_prompt(context), target.model)
+            else:
+                raise ValueError(f"Proveedor de IA no soportado: {target.provider}")
+        
+        parts = []
+        async for delta in self.router.stream(open_stream):
+            parts.append(delta)
+            yield delta
+        
+        # Solo se guarda la respuesta si el stream terminó completo
+        if cache_key:
+            self.response_cache.set(cache_key, "".join(parts))
+    
+    def _response_cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Clave de la caché de respuestas (None si la caché está desactivada)
+        
+        Incluye destinos, system prompt e historial normalizado
+        (espacios colapsados y sin distinguir mayúsculas).
+        """
+        if self.response_cache is None:
+            return None
+        return self._request_key(messages, context, normalize=True)
+    
+    def _request_key(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        normalize: bool = False
+    ) -> str:
+        """Hash de destinos (proveedor:modelo), system prompt e historial de una petición"""
+        if normalize:
+            history = [[msg["role"], " ".join(msg["content"].split()).casefold()] for msg in messages]
+        else:
+            history = [[msg["role"], msg["content"]] for msg in messages]
+        
+        payload = json.dumps(
+            [self.router.key, self._build_system_prompt(context), history],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _build_system_prompt(self, context: Optional[str] = None) -> str:
+        """System prompt configurado más el contexto adicional del turno"""
+        if not context:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n{context}"
+    
+    def _openai_request(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        stream: bool = False,
+        model: Optional[str] = None
+    ) -> Dict:
+        """Prepara cabeceras y cuerpo de la petición a OpenAI"""
         if not settings.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY no configurada")
         
         # Preparar mensajes con system prompt
-        full_messages = [{"role": "system", "content": self.system_prompt}] + messages
+        full_messages = [{"role": "system", "content": self._build_system_prompt(context)}, *messages]
+        
+        payload = {
+            "model": model or settings.AI_MODEL,
+            "messages": full_messages,
+            "temperature": 0.7,
+            "max_tokens": 1000
+        }
+        if stream:
+            payload["stream"] = True
+            # El último fragmento trae el uso de tokens
+            payload["stream_options"] = {"include_usage": True}
+        
+        return {
+            "headers": {
+                "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+                "Content-Type": "application/json"
+            },
+            "json": payload
+        }
+    
+    async def _openai_generate(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """Genera respuesta usando OpenAI API"""
+        request = self._openai_request(messages, context, model=model)
         
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": settings.AI_MODEL,
-                    "messages": full_messages,
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                },
-                timeout=30
-            )
+            response = await self._get_client("openai").post("/v1/chat/completions", **request)
             response.raise_for_status()
             
             data = response.json()
+            usage = data.get("usage") or {}
+            metrics.record_tokens(
+                "openai", model or settings.AI_MODEL,
+                usage.get("prompt_tokens"), usage.get("completion_tokens")
+            )
             return data["choices"][0]["message"]["content"]
             
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             raise Exception(f"Error al comunicarse con OpenAI: {str(e)}")
     
-    async def _gemini_generate(self, messages: List[Dict[str, str]]) -> str:
-        """Genera respuesta usando Google Gemini API"""
+    async def _openai_stream(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Genera respuesta en streaming usando OpenAI API (SSE)"""
+        request = self._openai_request(messages, context, stream=True, model=model)
+        
+        try:
+            async with self._get_client("openai").stream(
+                "POST", "/v1/chat/completions", **request
+            ) as response:
+                response.raise_for_status()
+                
+                async for data in self._iter_sse_data(response):
+                    if data == "[DONE]":
+                        break
+                    
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        metrics.record_tokens(
+                            "openai", model or settings.AI_MODEL,
+                            chunk["usage"].get("prompt_tokens"), chunk["usage"].get("completion_tokens")
+                        )
+                    if not chunk.get("choices"):
+                        continue
+                    
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+                        
+        except httpx.HTTPError as e:
+            raise Exception(f"Error al comunicarse con OpenAI: {str(e)}")
+    
+    def _gemini_request(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None
+    ) -> Dict:
+        """Prepara parámetros y cuerpo de la petición a Gemini"""
         if not settings.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY no configurada")
         
         # Convertir mensajes al formato de Gemini
         gemini_messages = self._convert_to_gemini_format(messages)
         
+        return {
+            "headers": {"Content-Type": "application/json"},
+            "params": {"key": settings.GEMINI_API_KEY},
+            "json": {
+                "contents": gemini_messages,
+                "generationConfig": {
+                    "temperature": 0.7,
+                    "maxOutputTokens": 1000
+                },
+                "systemInstruction": {
+                    "parts": [{"text": self._build_system_prompt(context)}]
+                }
+            }
+        }
+    
+    async def _gemini_generate(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """Genera respuesta usando Google Gemini API"""
+        request = self._gemini_request(messages, context)
+        
         try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/{settings.AI_MODEL}:generateContent"
+            url = f"/v1beta/models/{model or settings.AI_MODEL}:generateContent"
             
-            response = requests.post(
-                url,
-                headers={"Content-Type": "application/json"},
-                params={"key": settings.GEMINI_API_KEY},
-                json={
-                    "contents": gemini_messages,
-                    "generationConfig": {
-                        "temperature": 0.7,
-                        "maxOutputTokens": 1000
-                    },
-                    "systemInstruction": {
-                        "parts": [{"text": self.system_prompt}]
-                    }
-                },
-                timeout=30
-            )
+            response = await self._get_client("gemini").post(url, **request)
             response.raise_for_status()
             
             data = response.json()
+            usage = data.get("usageMetadata") or {}
+            metrics.record_tokens(
+                "gemini", model or settings.AI_MODEL,
+                usage.get("promptTokenCount"), usage.get("candidatesTokenCount")
+            )
             return data["candidates"][0]["content"]["parts"][0]["text"]
             
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             raise Exception(f"Error al comunicarse con Gemini: {str(e)}")
     
+    async def _gemini_stream(
+        self,
+        messages: List[Dict[str, str]],
+        context: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Genera respuesta en streaming usando Google Gemini API (SSE)"""
+        request = self._gemini_request(messages, context)
+        request["params"]["alt"] = "sse"
+        
+        try:
+            url = f"/v1beta/models/{model or settings.AI_MODEL}:streamGenerateContent"
+            
+            async with self._get_client("gemini").stream("POST", url, **request) as response:
+                response.raise_for_status()
+                
+                usage = {}
+                async for data in self._iter_sse_data(response):
+                    chunk = json.loads(data)
+                    # Cada fragmento trae el uso acumulado: vale el último
+                    usage = chunk.get("usageMetadata") or usage
+                    
+                    for candidate in chunk.get("candidates", []):
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                yield part["text"]
+                
+                metrics.record_tokens(
+                    "gemini", model or settings.AI_MODEL,
+                    usage.get("promptTokenCount"), usage.get("candidatesTokenCount")
+                )
+                                
+        except httpx.HTTPError as e:
+            raise Exception(f"Error al comunicarse con Gemini: {str(e)}")
+    
+    @staticmethod
+    async def _iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+        """Extrae el campo data de cada evento SSE de una respuesta en streaming"""
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                yield line[5:].strip()
+    
     def _convert_to_gemini_format(self, messages: List[Dict[str, str]]) -> List[Dict]:
         """Convierte mensajes de formato OpenAI a formato Gemini"""
-        gemini_messages = []
-        
-        for msg in messages:
-            role = "user" if msg["role"] == "user" else "model"
-            gemini_messages.append({
-                "role": role,
-                "parts": [{"text": msg["content"]}]
-            })
+        # El historial en caché ya guarda cada mensaje convertido
+        if isinstance(messages, ChatHistory):
+            return messages.gemini
         
-        return gemini_messages
+        return [to_gemini_message(msg["role"], msg["content"]) for msg in messages]
     
     def generate_conversation_title(self, first_message: str) -> str:
         """
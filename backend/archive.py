@@ -0,0 +1,380 @@
+"""
+Archivo en frío de las conversaciones inactivas
+
+Las conversaciones sin actividad (updated_at) desde hace ARCHIVE_AFTER_DAYS
+días se mueven a un fichero JSON comprimido con gzip por conversación, en
+ARCHIVE_PATH. En la base de datos queda la fila de la conversación (título,
+contadores y último mensaje, así que el listado no cambia) con el nombre
+del fichero en archive_file; sus mensajes salen de la tabla messages y, con
+ellos, del índice de búsqueda.
+
+Al abrir una conversación archivada o escribir en ella, restore() devuelve
+sus mensajes a la tabla (con sus IDs originales si siguen libres) antes de
+continuar. Tras restaurarla, no se vuelve a archivar hasta que pasen otros
+ARCHIVE_AFTER_DAYS días.
+
+Consistencia:
+- Archivar: el fichero se escribe y sincroniza antes de borrar los mensajes,
+  y solo se borran los mensajes que contiene. Si la transacción no llega a
+  confirmarse, el fichero se elimina.
+- Restaurar: los mensajes se insertan y archive_file se limpia en la misma
+  transacción; el fichero se borra después. Cada archivado usa un nombre de
+  fichero nuevo, así que borrar el restaurado nunca afecta a uno posterior.
+- Ambas operaciones se reclaman con un UPDATE condicional sobre la
+  conversación: dos peticiones (o dos workers) no restauran ni archivan la
+  misma conversación dos veces.
+
+Uso:
+    python -m backend.archive run [--days 90]   # archivar ahora las inactivas
+    python -m backend.archive restore --all     # restaurar todas (o por ID)
+    python -m backend.archive stats
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import uuid
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .history_cache import history_cache
+from .metrics import background_context
+from .models import Conversation, Message
+
+ARCHIVE_FORMAT = 1
+# IDs por sentencia al borrar o comprobar mensajes (límite de parámetros de SQLite)
+_ID_CHUNK = 500
+
+
+def _chunks(values: Sequence[int], size: int = _ID_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class ConversationArchive:
+    """Archivado en segundo plano y restauración bajo demanda"""
+    
+    def __init__(
+        self,
+        directory: str,
+        after_days: float,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        batch_size: int = 100,
+        interval: float = 3600.0
+    ):
+        self.directory = directory
+        self.after_days = after_days
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.restored = 0
+    
+    # --- Ficheros ---
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    def _write(self, name: str, document: Dict[str, Any]):
+        """Escribe el fichero de forma atómica (temporal + fsync + rename)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as compressed:
+                compressed.write(json.dumps(document, ensure_ascii=False).encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temporary, path)
+    
+    def _read(self, name: str) -> Dict[str, Any]:
+        with gzip.open(self._path(name), "rb") as compressed:
+            return json.loads(compressed.read().decode("utf-8"))
+    
+    def discard(self, name: str):
+        """Borra un fichero de archivo (si existe)"""
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+    
+    # --- Archivar ---
+    
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """Conversaciones sin actividad desde antes de esta fecha se archivan"""
+        return (now or datetime.utcnow()) - timedelta(days=self.after_days)
+    
+    @staticmethod
+    def _idle(cutoff: datetime):
+        return (
+            Conversation.archive_file.is_(None),
+            Conversation.updated_at < cutoff,
+            or_(Conversation.rehydrated_at.is_(None), Conversation.rehydrated_at < cutoff),
+        )
+    
+    async def archive_conversation(self, conversation_id: int, cutoff: datetime) -> bool:
+        """
+        Archiva una conversación si sigue inactiva desde antes de `cutoff`
+        
+        Returns:
+            bool: True si se archivó
+        """
+        async with self.session_factory() as db:
+            conversation = (await db.execute(
+                select(Conversation.id, Conversation.user_id, Conversation.title)
+                .where(Conversation.id == conversation_id, *self._idle(cutoff))
+            )).one_or_none()
+            if conversation is None:
+                return False
+            
+            rows = (await db.execute(
+                select(Message.id, Message.role, Message.content, Message.created_at)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+            )).all()
+            if not rows:
+                return False
+            await db.rollback()
+            
+            name = f"{conversation_id}-{uuid.uuid4().hex[:12]}.json.gz"
+            await asyncio.to_thread(self._write, name, {
+                "format": ARCHIVE_FORMAT,
+                "conversation_id": conversation.id,
+                "user_id": conversation.user_id,
+                "title": conversation.title,
+                "archived_at": datetime.utcnow().isoformat(),
+                "messages": [
+                    {
+                        "id": row.id,
+                        "role": row.role,
+                        "content": row.content,
+                        "created_at": row.created_at.isoformat() if row.created_at else None
+                    }
+                    for row in rows
+                ]
+            })
+            
+            try:
+                # Reclamar la conversación (sin tocar updated_at) solo si sus
+                # mensajes siguen siendo los del fichero: el stream guarda el
+                # mensaje del usuario antes de actualizar la conversación
+                hot = select(Message.id).where(Message.conversation_id == conversation_id)
+                last_id = max(row.id for row in rows)
+                claimed = await db.execute(
+                    update(Conversation)
+                    .where(
+                        Conversation.id == conversation_id,
+                        *self._idle(cutoff),
+                        ~hot.where(Message.id > last_id).exists(),
+                        hot.with_only_columns(func.count()).scalar_subquery() == len(rows)
+                    )
+                    .values(archive_file=name, updated_at=Conversation.updated_at)
+                )
+                if claimed.rowcount != 1:
+                    await db.rollback()
+                    await asyncio.to_thread(self.discard, name)
+                    return False
+                
+                for ids in _chunks([row.id for row in rows]):
+                    await db.execute(delete(Message).where(Message.id.in_(ids)))
+                await db.commit()
+            except BaseException:
+                self.discard(name)
+                raise
+        
+        history_cache.invalidate(conversation_id)
+        self.archived += 1
+        return True
+    
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Archiva todas las conversaciones inactivas; devuelve cuántas"""
+        cutoff = self.cutoff(now)
+        total = 0
+        after_id = 0
+        while True:
+            async with self.session_factory() as db:
+                candidates = (await db.execute(
+                    select(Conversation.id)
+                    .where(Conversation.id > after_id, *self._idle(cutoff))
+                    .order_by(Conversation.id)
+                    .limit(self.batch_size)
+                )).scalars().all()
+            if not candidates:
+                return total
+            
+            for conversation_id in candidates:
+                if await self.archive_conversation(conversation_id, cutoff):
+                    total += 1
+            after_id = candidates[-1]
+    
+    # --- Restaurar ---
+    
+    async def restore(self, conversation: Conversation) -> int:
+        """Restaura la conversación si está archivada (no-op si no lo está)"""
+        if conversation.archive_file is None:
+            return 0
+        return await self.restore_conversation(conversation.id)
+    
+    async def restore_conversation(self, conversation_id: int) -> int:
+        """
+        Devuelve a la tabla messages los mensajes archivados de una conversación
+        
+        Returns:
+            int: Mensajes restaurados (0 si no estaba archivada o ya la restauró otro)
+        """
+        async with self.session_factory() as db:
+            name = await db.scalar(
+                select(Conversation.archive_file).where(Conversation.id == conversation_id)
+            )
+            if name is None:
+                return 0
+            
+            claimed = await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id, Conversation.archive_file == name)
+                .values(archive_file=None, rehydrated_at=datetime.utcnow(), updated_at=Conversation.updated_at)
+            )
+            if claimed.rowcount != 1:
+                await db.rollback()
+                return 0
+            
+            document = await asyncio.to_thread(self._read, name)
+            archived = document["messages"]
+            
+            # Los IDs que haya reutilizado SQLite (máximo borrado) se renumeran,
+            # después de insertar los que conservan el suyo
+            taken = set()
+            for ids in _chunks([message["id"] for message in archived]):
+                taken.update((await db.execute(select(Message.id).where(Message.id.in_(ids)))).scalars())
+            
+            for keep_id in (True, False):
+                db.add_all([
+                    Message(
+                        id=message["id"] if keep_id else None,
+                        conversation_id=conversation_id,
+                        role=message["role"],
+                        content=message["content"],
+                        created_at=datetime.fromisoformat(message["created_at"]) if message["created_at"] else None
+                    )
+                    for message in archived if (message["id"] not in taken) == keep_id
+                ])
+                await db.flush()
+            await db.commit()
+        
+        await asyncio.to_thread(self.discard, name)
+        history_cache.invalidate(conversation_id)
+        self.restored += 1
+        return len(archived)
+    
+    async def restore_all(self) -> int:
+        """Restaura todas las conversaciones archivadas; devuelve cuántas"""
+        async with self.session_factory() as db:
+            archived = (await db.execute(
+                select(Conversation.id).where(Conversation.archive_file.is_not(None))
+            )).scalars().all()
+        
+        for conversation_id in archived:
+            await self.restore_conversation(conversation_id)
+        return len(archived)
+    
+    # --- Tarea en segundo plano ---
+    
+    def start(self):
+        """Arranca el archivador periódico en el event loop actual (una vez por loop)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        
+        self._loop = loop
+        self._task = loop.create_task(self._archiver(), context=background_context())
+    
+    async def _archiver(self):
+        while True:
+            try:
+                archived = await self.run_once()
+                if archived:
+                    print(f"[INFO] Conversaciones archivadas: {archived}")
+            except Exception as e:
+                print(f"[WARN] Error al archivar conversaciones: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def shutdown(self):
+        """Detiene el archivador"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._loop = None
+    
+    async def counts(self) -> Dict[str, int]:
+        """Conversaciones archivadas y pendientes de archivar ahora mismo"""
+        async with self.session_factory() as db:
+            archived = await db.scalar(
+                select(func.count()).select_from(Conversation).where(Conversation.archive_file.is_not(None))
+            )
+            idle = await db.scalar(
+                select(func.count()).select_from(Conversation).where(*self._idle(self.cutoff()))
+            )
+        return {"archived": archived, "idle": idle}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "archived": self.archived,
+            "restored": self.restored,
+            "running": self._task is not None and not self._task.done()
+        }
+
+
+# Instancia global: la restauración funciona aunque el archivador esté desactivado
+conversation_archive = ConversationArchive(
+    directory=settings.ARCHIVE_PATH,
+    after_days=settings.ARCHIVE_AFTER_DAYS,
+    batch_size=settings.ARCHIVE_BATCH,
+    interval=settings.ARCHIVE_INTERVAL
+)
+
+
+async def _main(args) -> Dict[str, Any]:
+    if args.days is not None:
+        conversation_archive.after_days = args.days
+    if args.command == "run":
+        return {"archived": await conversation_archive.run_once()}
+    if args.command == "restore":
+        if args.all:
+            return {"restored": await conversation_archive.restore_all()}
+        return {
+            "restored_messages": {
+                conversation_id: await conversation_archive.restore_conversation(conversation_id)
+                for conversation_id in args.ids
+            }
+        }
+    return await conversation_archive.counts()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Archivo en frío de conversaciones inactivas")
+    parser.add_argument("--days", type=float, default=None, help="Días sin actividad (por defecto ARCHIVE_AFTER_DAYS)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    subparsers.add_parser("run", help="Archivar ahora las conversaciones inactivas")
+    restore_parser = subparsers.add_parser("restore", help="Restaurar conversaciones archivadas")
+    restore_parser.add_argument("ids", type=int, nargs="*", help="IDs de conversación")
+    restore_parser.add_argument("--all", action="store_true", help="Restaurar todas")
+    subparsers.add_parser("stats", help="Conversaciones archivadas e inactivas")
+    args = parser.parse_args(argv)
+    
+    if args.command == "restore" and not (args.all or args.ids):
+        parser.error("indica IDs de conversación o --all")
+    print(json.dumps(asyncio.run(_main(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,19 @@
 Utilidades de seguridad y autenticación
 """
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import TTLCache
 from .config import settings
 from .database import get_db
+from .hashing import HashingBusyError, hash_password_async, pwd_context, verify_password_async
 from .models import User
 from .schemas import TokenData
 
-# Configuración de password hashing
-# Usar argon2 para compatibilidad con Python 3.14
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -33,6 +31,31 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _hashing_busy_exception() -> HTTPException:
+    """Respuesta cuando el pool de hashing está saturado"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def verify_password_pooled(plain_password: str, hashed_password: str) -> bool:
+    """Verifica la contraseña en el pool de hashing (sin bloquear el event loop)"""
+    try:
+        return await verify_password_async(plain_password, hashed_password)
+    except HashingBusyError:
+        raise _hashing_busy_exception()
+
+
+async def get_password_hash_pooled(password: str) -> str:
+    """Genera el hash en el pool de hashing (sin bloquear el event loop)"""
+    try:
+        return await hash_password_async(password)
+    except HashingBusyError:
+        raise _hashing_busy_exception()
+
+
 # ===== JWT UTILITIES =====
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -59,18 +82,85 @@ def verify_token(token: str, credentials_exception) -> TokenData:
         if user_id is None:
             raise credentials_exception
             
-        token_data = TokenData(user_id=int(user_id))
+        expires_at = payload.get("exp")
+        token_data = TokenData(
+            user_id=int(user_id),
+            expires_at=datetime.utcfromtimestamp(expires_at) if expires_at else None
+        )
         return token_data
         
     except JWTError:
         raise credentials_exception
 
 
+# ===== PRINCIPAL CACHE =====
+
+class PrincipalCache:
+    """
+    Caché del usuario autenticado
+    
+    - tokens: token -> claims ya verificados (evita jwt.decode)
+    - users: user_id -> usuario desvinculado de la sesión (evita el SELECT)
+    
+    Invalidar un usuario basta para que sus tokens vuelvan a consultar la
+    base de datos. La caché es local a cada proceso: en otros workers un
+    cambio se ve como muy tarde al caducar la entrada (PRINCIPAL_CACHE_TTL).
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.tokens = TTLCache(max_size=max_size, ttl=ttl)
+        self.users = TTLCache(max_size=max_size, ttl=ttl)
+    
+    def get_token(self, token: str) -> Optional[TokenData]:
+        return self.tokens.get(token)
+    
+    def set_token(self, token: str, token_data: TokenData):
+        """Guarda los claims sin superar la caducidad del propio token"""
+        ttl = self.tokens.ttl
+        if token_data.expires_at:
+            ttl = min(ttl, (token_data.expires_at - datetime.utcnow()).total_seconds())
+        if ttl > 0:
+            self.tokens.set(token, token_data, ttl=ttl)
+    
+    def get_user(self, user_id: int) -> Optional[User]:
+        return self.users.get(user_id)
+    
+    def set_user(self, user: User):
+        self.users.set(user.id, user)
+    
+    def invalidate_user(self, user_id: int):
+        """Descarta el usuario cacheado (desactivado, modificado o eliminado)"""
+        self.users.pop(user_id)
+    
+    def clear(self):
+        self.tokens.clear()
+        self.users.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"tokens": self.tokens.stats(), "users": self.users.stats()}
+
+
+principal_cache: Optional[PrincipalCache] = None
+if settings.PRINCIPAL_CACHE_ENABLED:
+    principal_cache = PrincipalCache(
+        max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+        ttl=settings.PRINCIPAL_CACHE_TTL
+    )
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: User):
+    """Cualquier cambio de un usuario vía ORM invalida su entrada en caché"""
+    if principal_cache is not None:
+        principal_cache.invalidate_user(target.id)
+
+
 # ===== CURRENT USER DEPENDENCY =====
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Obtiene el usuario actual desde el token JWT"""
     credentials_exception = HTTPException(
@@ -79,12 +169,23 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token_data = verify_token(token, credentials_exception)
-    
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    token_data = principal_cache.get_token(token) if principal_cache else None
+    if token_data is None:
+        token_data = verify_token(token, credentials_exception)
+        if principal_cache:
+            principal_cache.set_token(token, token_data)
     
+    user = principal_cache.get_user(token_data.user_id) if principal_cache else None
     if user is None:
-        raise credentials_exception
+        user = await db.get(User, token_data.user_id)
+        
+        if user is None:
+            raise credentials_exception
+        
+        if principal_cache:
+            # Desvincular de la sesión: solo se leen sus columnas ya cargadas
+            db.expunge(user)
+            principal_cache.set_user(user)
         
     if not user.is_active:
         raise HTTPException(
@@ -97,14 +198,14 @@ async def get_current_user(
 
 # ===== AUTHENTICATION =====
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     """Autentica un usuario"""
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     
     if not user:
         return None
     
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_pooled(password, user.hashed_password):
         return None
     
     return user
@@ -0,0 +1,103 @@
+"""
+Cachés en memoria del proceso
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import time
+
+
+class LRUCache:
+    """Caché acotada que expulsa la entrada usada hace más tiempo"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor y lo marca como usado recientemente"""
+        if key not in self._data:
+            return default
+        
+        self._data.move_to_end(key)
+        return self._data[key]
+    
+    def set(self, key: Hashable, value: Any):
+        """Guarda un valor, expulsando el menos reciente si se supera el tamaño"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        """Elimina una entrada (invalidación)"""
+        return self._data.pop(key, default)
+    
+    def clear(self):
+        """Vacía la caché"""
+        self._data.clear()
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache:
+    """Caché LRU acotada cuyas entradas caducan tras `ttl` segundos"""
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Devuelve el valor si existe y no ha caducado (cuenta acierto/fallo)"""
+        item = self._data.get(key)
+        
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Guarda un valor con caducidad, expulsando el menos reciente si hace falta"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Optional[Any]:
+        """Elimina una entrada (invalidación)"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+    
+    def clear(self):
+        """Vacía la caché y reinicia los contadores"""
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso de la caché"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+    
+    def __len__(self) -> int:
+        return len(self._data)
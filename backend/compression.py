@@ -0,0 +1,103 @@
+"""
+Compresión del contenido de los mensajes
+
+Los cuerpos a partir de MESSAGE_BLOB_THRESHOLD bytes se guardan una sola vez
+en message_blobs, direccionados por el SHA-256 del texto y comprimidos con
+MESSAGE_COMPRESSION (ver models.py). Los datos de cada blob empiezan por un
+byte que identifica el codec, así que cambiar el algoritmo no impide leer
+los blobs ya guardados.
+
+- CompressedText: tipo de las columnas que pueden devolver un blob
+  (bytes) o el texto en línea (str); siempre entrega el texto.
+- stored_content: COALESCE(blob, texto en línea) en SQLite; en PostgreSQL
+  el contenido va siempre en línea (TOAST ya comprime los valores grandes y
+  el tsvector generado necesita el texto en la fila).
+
+El esquema no depende de funciones SQL propias: la descompresión se hace
+siempre en Python y el índice de búsqueda guarda su propia copia del texto
+(ver models.py).
+"""
+from typing import Optional, Tuple
+import bz2
+import hashlib
+import lzma
+import zlib
+
+from sqlalchemy import Text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator
+
+# Nombre del codec -> (cabecera, compresión con nivel opcional, descompresión)
+CODECS = {
+    "zlib": (b"z", lambda data, level: zlib.compress(data, -1 if level is None else level), zlib.decompress),
+    "lzma": (b"x", lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    "bz2": (b"b", lambda data, level: bz2.compress(data, 9 if level is None else level), bz2.decompress),
+}
+# Datos que no se reducen al comprimirlos se guardan tal cual (solo se deduplican)
+RAW_CODEC = "raw"
+RAW_HEADER = b"r"
+
+_DECOMPRESSORS = {header: decompress for header, _, decompress in CODECS.values()}
+_DECOMPRESSORS[RAW_HEADER] = bytes
+
+
+def content_hash(data: bytes) -> str:
+    """Dirección del blob: SHA-256 del texto en UTF-8"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress(data: bytes, codec: str = "zlib", level: Optional[int] = None) -> Tuple[str, bytes]:
+    """
+    Comprime el texto (en UTF-8) con el codec indicado
+    
+    Returns:
+        Tuple[str, bytes]: Codec usado ("raw" si no compensa) y datos con su cabecera
+    
+    Raises:
+        ValueError: Si el codec no existe
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Algoritmo de compresión no soportado: {codec}")
+    
+    header, compress_func, _ = CODECS[codec]
+    compressed = compress_func(data, level)
+    if len(compressed) >= len(data):
+        return RAW_CODEC, RAW_HEADER + data
+    return codec, header + compressed
+
+
+def decompress(data: bytes) -> str:
+    """Texto de un blob (cualquier codec)"""
+    data = bytes(data)
+    return _DECOMPRESSORS[data[:1]](data[1:]).decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """Texto que puede llegar en línea (str) o como blob comprimido (bytes)"""
+    impl = Text
+    cache_ok = True
+    
+    def process_result_value(self, value, dialect):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress(value)
+        return value
+
+
+class stored_content(FunctionElement):
+    """stored_content(blob, en_linea): el cuerpo del blob si existe, si no el texto en línea"""
+    type = CompressedText()
+    name = "stored_content"
+    inherit_cache = True
+
+
+@compiles(stored_content)
+def _compile_stored_content(element, compiler, **kw):
+    blob, inline = element.clauses
+    return f"coalesce({compiler.process(blob, **kw)}, {compiler.process(inline, **kw)})"
+
+
+@compiles(stored_content, "postgresql")
+def _compile_stored_content_inline(element, compiler, **kw):
+    _, inline = element.clauses
+    return compiler.process(inline, **kw)
@@ -0,0 +1,222 @@
+"""
+Gestión de la ventana de contexto enviada a la IA
+
+Ajusta el historial a un presupuesto de tokens: los turnos recientes se
+envían literalmente y los antiguos se sustituyen por un resumen acumulado
+que se guarda en caché y se actualiza de forma incremental.
+
+El resumen se actualiza en segundo plano (una tarea por conversación), para
+no añadir una llamada al modelo a la latencia del turno: mientras tanto se
+usa el resumen anterior y solo los mensajes recientes que caben.
+"""
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+import asyncio
+
+from .ai_service import ai_service
+from .cache import LRUCache
+from .config import settings
+from .history_cache import ChatHistory, MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+from .metrics import background_context
+
+# Resumen previo + mensajes nuevos a resumir -> resumen actualizado
+Summarizer = Callable[[str, Sequence[Dict[str, str]]], Awaitable[str]]
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """Tokens estimados de un mensaje, incluido su overhead"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ContextWindow:
+    """Contexto listo para enviar a la IA"""
+    messages: ChatHistory
+    summary: Optional[str]
+    tokens_original: int
+    tokens_sent: int
+    
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_original - self.tokens_sent, 0)
+    
+    @property
+    def system_context(self) -> Optional[str]:
+        """Texto a añadir al system prompt con el resumen de turnos antiguos"""
+        if not self.summary:
+            return None
+        return f"Resumen de la parte anterior de esta conversación:\n{self.summary}"
+
+
+@dataclass
+class _SummaryEntry:
+    """Resumen de los primeros `message_count` mensajes de una conversación"""
+    message_count: int
+    summary: str
+
+
+async def ai_summarizer(previous_summary: str, messages: Sequence[Dict[str, str]]) -> str:
+    """Actualiza el resumen con los mensajes nuevos usando el proveedor de IA"""
+    transcript = "\n".join(
+        f"{'Usuario' if msg['role'] == 'user' else 'Asistente'}: {msg['content']}"
+        for msg in messages
+    )
+    max_words = settings.CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4
+    
+    prompt = (
+        "Actualiza el resumen de una conversación con los mensajes nuevos. "
+        "Conserva datos, decisiones, código y preguntas pendientes relevantes. "
+        f"Responde solo con el resumen, en un máximo de {max_words} palabras.\n\n"
+        f"Resumen actual:\n{previous_summary or '(vacío)'}\n\n"
+        f"Mensajes nuevos:\n{transcript}"
+    )
+    return await ai_service.generate_response([{"role": "user", "content": prompt}])
+
+
+class ContextManager:
+    """Construye el contexto de cada turno dentro de un presupuesto de tokens"""
+    
+    def __init__(
+        self,
+        max_tokens: int,
+        summary_max_tokens: int,
+        cache_size: int,
+        summarizer: Summarizer = ai_summarizer
+    ):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer
+        self._summaries = LRUCache(cache_size)
+        # Actualizaciones del resumen en curso por conversación
+        self._refreshes: Dict[int, asyncio.Task] = {}
+    
+    async def build(self, conversation_id: int, messages: Sequence[Dict[str, str]]) -> ContextWindow:
+        """
+        Ajusta el historial de una conversación al presupuesto de tokens
+        
+        Args:
+            conversation_id: ID de la conversación (clave del resumen en caché)
+            messages: Historial completo en orden cronológico (idealmente un
+                ChatHistory de la caché, cuyos tokens ya están calculados)
+        
+        Returns:
+            ContextWindow: Mensajes recientes literales + resumen de los antiguos
+        """
+        history = messages if isinstance(messages, ChatHistory) else ChatHistory.from_messages(messages)
+        tokens_original = history.token_sum()
+        
+        if self.max_tokens <= 0 or tokens_original <= self.max_tokens:
+            return ContextWindow(history, None, tokens_original, tokens_original)
+        
+        entry: Optional[_SummaryEntry] = self._summaries.get(conversation_id)
+        if entry and entry.message_count >= len(history):
+            # El historial cambió por debajo del resumen: recalcular
+            entry = None
+        summarized = entry.message_count if entry else 0
+        
+        recent_budget = self.max_tokens - self.summary_max_tokens
+        
+        if history.token_sum(summarized) > recent_budget:
+            # Resumir hasta dejar los recientes en la mitad del presupuesto,
+            # así los turnos siguientes no necesitan volver a resumir
+            split = self._split_index(history, recent_budget // 2, summarized)
+            if split > summarized:
+                self._refresh_summary(conversation_id, entry, history, split)
+                # Hasta que termine: resumen anterior + los recientes que caben
+                summarized = self._split_index(history, recent_budget, summarized)
+        
+        summary = entry.summary if entry else None
+        
+        tokens_sent = history.token_sum(summarized)
+        if summary:
+            tokens_sent += estimate_tokens(summary)
+        
+        return ContextWindow(history[summarized:], summary, tokens_original, tokens_sent)
+    
+    def invalidate(self, conversation_id: int):
+        """Descarta el resumen de una conversación (p. ej. al eliminarla)"""
+        refresh = self._refreshes.pop(conversation_id, None)
+        if refresh is not None:
+            refresh.cancel()
+        self._summaries.pop(conversation_id)
+    
+    async def wait_refresh(self, conversation_id: int):
+        """Espera a que termine la actualización en curso del resumen, si la hay"""
+        refresh = self._refreshes.get(conversation_id)
+        if refresh is not None:
+            await asyncio.wait({refresh})
+    
+    def _split_index(self, history: ChatHistory, budget: int, start: int) -> int:
+        """Primer mensaje que se conserva literal (siempre al menos el último)"""
+        split = len(history) - 1
+        used = history.message_tokens(split)
+        
+        while split > start and used + history.message_tokens(split - 1) <= budget:
+            split -= 1
+            used += history.message_tokens(split)
+        
+        # Empezar la parte literal en un mensaje del usuario (alternancia de roles)
+        while split < len(history) - 1 and history[split]["role"] != "user":
+            split += 1
+        
+        return split
+    
+    def _refresh_summary(
+        self,
+        conversation_id: int,
+        entry: Optional[_SummaryEntry],
+        history: ChatHistory,
+        split: int
+    ):
+        """Arranca la actualización del resumen si no hay ya una en curso"""
+        if conversation_id in self._refreshes:
+            return
+        
+        start = entry.message_count if entry else 0
+        task = asyncio.get_running_loop().create_task(
+            self._update_summary(conversation_id, entry, history[start:split], split),
+            context=background_context()
+        )
+        self._refreshes[conversation_id] = task
+        
+        def forget(done: asyncio.Task):
+            if self._refreshes.get(conversation_id) is done:
+                del self._refreshes[conversation_id]
+        
+        task.add_done_callback(forget)
+    
+    async def _update_summary(
+        self,
+        conversation_id: int,
+        entry: Optional[_SummaryEntry],
+        messages: Sequence[Dict[str, str]],
+        split: int
+    ) -> Optional[_SummaryEntry]:
+        """
+        Incorpora al resumen solo los mensajes que aún no estaban resumidos
+        
+        Si el resumidor falla se conserva el resumen anterior sin avanzar
+        message_count: el siguiente turno vuelve a intentarlo con esos mensajes.
+        """
+        previous_summary = entry.summary if entry else ""
+        
+        try:
+            summary = await self.summarizer(previous_summary, messages)
+        except Exception:
+            return entry
+        
+        max_chars = self.summary_max_tokens * 4
+        if len(summary) > max_chars:
+            summary = summary[:max_chars - 3] + "..."
+        
+        entry = _SummaryEntry(message_count=split, summary=summary)
+        self._summaries.set(conversation_id, entry)
+        return entry
+
+
+# Instancia global del gestor de contexto
+context_manager = ContextManager(
+    max_tokens=settings.CONTEXT_MAX_TOKENS,
+    summary_max_tokens=settings.CONTEXT_SUMMARY_MAX_TOKENS,
+    cache_size=settings.CONTEXT_SUMMARY_CACHE_SIZE
+)
@@ -1,30 +1,155 @@
 """
 Configuración de base de datos
+
+Las rutas usan un engine asíncrono (aiosqlite o asyncpg, según DATABASE_URL);
+el engine síncrono se mantiene para init_db y los scripts de mantenimiento.
+Los listados y el historial leen de un pool aparte de solo lectura, para que
+las lecturas no compitan por conexiones con las escrituras del chat.
 """
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from typing import AsyncIterator, List
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, Engine, URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from .config import settings
-from .models import Base
+from .models import Base  # noqa: F401 (reexportado para scripts y tests)
+from . import metrics, migrations
+
+# Drivers síncronos y asíncronos admitidos por backend (el primero es el de por defecto)
+SYNC_DRIVERS = {"sqlite": ("pysqlite",), "postgresql": ("psycopg2", "psycopg", "pg8000")}
+ASYNC_DRIVERS = {"sqlite": ("aiosqlite",), "postgresql": ("asyncpg", "psycopg")}
+
+
+def _database_url(url: str, drivers: dict) -> URL:
+    """Ajusta DATABASE_URL a un driver del tipo pedido (síncrono o asíncrono)"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    
+    # Respetar el driver explícito si ya es del tipo pedido
+    if backend not in drivers or parsed.get_driver_name() in drivers[backend]:
+        return parsed
+    
+    return parsed.set(drivername=f"{backend}+{drivers[backend][0]}")
+
+
+def sqlite_pragmas(profile: str, read_only: bool = False) -> List[str]:
+    """
+    Pragmas que se aplican a cada conexión SQLite nueva
+    
+    El modo WAL se guarda en el fichero, así que solo lo activan las
+    conexiones de escritura; las de lectura se marcan como query_only.
+    """
+    pragmas = []
+    if profile == "production":
+        if not read_only:
+            pragmas.append("journal_mode=WAL")
+        pragmas += [
+            f"busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+            f"synchronous={settings.SQLITE_SYNCHRONOUS}",
+            f"cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+            f"mmap_size={settings.SQLITE_MMAP_SIZE}",
+            "temp_store=MEMORY",
+        ]
+    if read_only:
+        pragmas.append("query_only=ON")
+    return pragmas
 
-# Crear engine
+
+def configure_connections(engine: Engine, profile: str = settings.SQLITE_PROFILE, read_only: bool = False):
+    """Registra los ajustes por conexión (pragmas de SQLite o sesión de solo lectura)"""
+    if engine.dialect.name == "sqlite":
+        statements = [f"PRAGMA {pragma}" for pragma in sqlite_pragmas(profile, read_only)]
+    elif read_only and engine.dialect.name == "postgresql":
+        statements = ["SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY"]
+    else:
+        statements = []
+    
+    if not statements:
+        return
+    
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+IS_SQLITE = make_url(settings.DATABASE_URL).get_backend_name() == "sqlite"
+CONNECT_ARGS = {"check_same_thread": False} if IS_SQLITE else {}
+# Una base de datos SQLite en memoria es distinta en cada conexión: no admite pool de lectura
+IS_MEMORY = IS_SQLITE and make_url(settings.DATABASE_URL).database in (None, "", ":memory:")
+
+# Crear engine (síncrono)
 engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    _database_url(settings.DATABASE_URL, SYNC_DRIVERS),
+    connect_args=CONNECT_ARGS
 )
+configure_connections(engine)
 
 # Crear session local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine y sesiones asíncronas para las rutas
+async_engine = create_async_engine(
+    _database_url(settings.DATABASE_URL, ASYNC_DRIVERS),
+    connect_args=CONNECT_ARGS
+)
+configure_connections(async_engine.sync_engine)
+
+# Pool de solo lectura (réplica si DATABASE_READ_URL está definida)
+if IS_MEMORY:
+    async_read_engine = async_engine
+else:
+    async_read_engine = create_async_engine(
+        _database_url(settings.DATABASE_READ_URL or settings.DATABASE_URL, ASYNC_DRIVERS),
+        connect_args=CONNECT_ARGS,
+        pool_size=settings.DB_READ_POOL_SIZE
+    )
+    configure_connections(async_read_engine.sync_engine, read_only=True)
+
+# expire_on_commit=False: los objetos siguen legibles tras el commit sin
+# volver a consultar la base de datos (no hay lazy loads implícitos)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Número y duración de las consultas (por petición y en total)
+if settings.METRICS_ENABLED:
+    metrics.instrument_engine(async_engine.sync_engine)
+    if async_read_engine is not async_engine:
+        metrics.instrument_engine(async_read_engine.sync_engine)
+
 
 def init_db():
-    """Inicializa la base de datos"""
-    Base.metadata.create_all(bind=engine)
+    """
+    Verifica la versión del esquema al arrancar
+    
+    Con DB_AUTO_MIGRATE aplica antes las migraciones pendientes; si no,
+    una base de datos desactualizada impide arrancar.
+    """
+    if settings.DB_AUTO_MIGRATE:
+        migrations.upgrade(engine)
+    return migrations.check(engine)
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency para obtener sesión asíncrona de DB"""
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
-def get_db() -> Session:
-    """Dependency para obtener sesión de DB"""
-    db = SessionLocal()
-    try:
+async def get_read_db() -> AsyncIterator[AsyncSession]:
+    """Dependency para obtener sesión del pool de solo lectura"""
+    async with AsyncReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
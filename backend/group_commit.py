@@ -0,0 +1,158 @@
+"""
+Escritura agrupada (group commit) de unidades de trabajo
+
+Cada turno de chat se escribe como una unidad de trabajo: una función que
+añade objetos y ejecuta sentencias en una sesión, sin hacer commit. Sin
+agrupar, la unidad se confirma en la sesión de la petición. Con
+GROUP_COMMIT_ENABLED, un único escritor reúne las unidades que llegan a la
+vez (hasta GROUP_COMMIT_MAX_BATCH o GROUP_COMMIT_MAX_DELAY_MS) y las
+confirma en una sola transacción: un fsync para muchos turnos.
+
+Si la transacción del lote falla, cada unidad se reintenta en su propia
+transacción para que el error solo afecte a la que lo provocó.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .metrics import background_context
+
+T = TypeVar("T")
+UnitOfWork = Callable[[AsyncSession], Awaitable[T]]
+
+
+class GroupCommitWriter:
+    """Escritor único que confirma lotes de unidades de trabajo"""
+    
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int, max_delay: float):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.units = 0
+    
+    def _ensure_writer(self):
+        """Arranca el escritor en el event loop actual la primera vez"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._writer(), context=background_context())
+    
+    async def submit(self, work: UnitOfWork) -> T:
+        """Encola la unidad de trabajo y espera a que su lote se confirme"""
+        self._ensure_writer()
+        future = self._loop.create_future()
+        await self._queue.put((work, future))
+        return await future
+    
+    async def _next_batch(self) -> List[Tuple[UnitOfWork, asyncio.Future]]:
+        """Primera unidad pendiente más las que lleguen en max_delay segundos"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_delay
+        
+        while len(batch) < self.max_batch:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        # Las unidades cuyo llamante ya se canceló no se escriben
+        return [(work, future) for work, future in batch if not future.done()]
+    
+    async def _writer(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            
+            try:
+                results = await self._commit(batch)
+            except Exception:
+                await self._commit_one_by_one(batch)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            
+            self.batches += 1
+            self.units += len(batch)
+    
+    async def _commit(self, batch: List[Tuple[UnitOfWork, asyncio.Future]]) -> List[Any]:
+        """Ejecuta todo el lote en una transacción"""
+        async with self.session_factory() as db:
+            results = [await work(db) for work, _ in batch]
+            await db.commit()
+        return results
+    
+    async def _commit_one_by_one(self, batch: List[Tuple[UnitOfWork, asyncio.Future]]):
+        """Reintenta cada unidad en su propia transacción tras un fallo del lote"""
+        for work, future in batch:
+            try:
+                async with self.session_factory() as db:
+                    result = await work(db)
+                    await db.commit()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+    
+    async def shutdown(self):
+        """Detiene el escritor (las unidades pendientes fallan)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Escritor detenido"))
+        
+        self._task = None
+        self._loop = None
+        self._queue = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "units": self.units,
+            "avg_batch": round(self.units / self.batches, 2) if self.batches else 0.0
+        }
+
+
+# Instancia global del escritor agrupado (None = desactivado)
+group_commit: Optional[GroupCommitWriter] = None
+if settings.GROUP_COMMIT_ENABLED:
+    group_commit = GroupCommitWriter(
+        AsyncSessionLocal,
+        max_batch=settings.GROUP_COMMIT_MAX_BATCH,
+        max_delay=settings.GROUP_COMMIT_MAX_DELAY_MS / 1000
+    )
+
+
+async def commit_unit(db: AsyncSession, work: UnitOfWork) -> T:
+    """
+    Ejecuta una unidad de trabajo y la confirma en una sola transacción
+    
+    Con group commit activado se escribe en el lote del escritor (con su
+    propia sesión); si no, en la sesión `db` de la petición.
+    """
+    if group_commit is not None:
+        return await group_commit.submit(work)
+    
+    result = await work(db)
+    await db.commit()
+    return result
@@ -0,0 +1,186 @@
+"""
+Hashing de contraseñas con Argon2 fuera del event loop
+
+Argon2 consume decenas o cientos de milisegundos de CPU por llamada. Las
+rutas lo ejecutan en un pool de hilos acotado (argon2-cffi libera el GIL
+durante el cálculo) con un límite de peticiones en cola; si se supera,
+se rechaza la petición en lugar de acumular latencia.
+
+Calibrar los parámetros de coste para este host:
+    python -m backend.hashing --target-ms 250
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+from passlib.context import CryptContext
+from .config import settings
+
+
+def _argon2_options() -> Dict[str, int]:
+    """Parámetros de coste configurados (los no definidos usan los de passlib)"""
+    options = {
+        "argon2__time_cost": settings.ARGON2_TIME_COST,
+        "argon2__memory_cost": settings.ARGON2_MEMORY_COST,
+        "argon2__parallelism": settings.ARGON2_PARALLELISM,
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+# Configuración de password hashing
+# Usar argon2 para compatibilidad con Python 3.14
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", **_argon2_options())
+
+
+class HashingBusyError(Exception):
+    """El pool de hashing tiene demasiadas peticiones pendientes"""
+
+
+class HashingPool:
+    """Pool de hilos acotado con límite de peticiones pendientes"""
+    
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def pending(self) -> int:
+        """Peticiones en ejecución o esperando un hilo libre"""
+        return self._pending
+    
+    async def run(self, func: Callable, *args):
+        """Ejecuta func(*args) en el pool sin bloquear el event loop"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingBusyError("Demasiadas operaciones de hashing pendientes")
+            self._pending += 1
+            
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="argon2"
+                )
+            executor = self._executor
+        
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+    
+    def shutdown(self):
+        """Detiene los hilos del pool"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+# Instancia global del pool de hashing
+hashing_pool = HashingPool(
+    workers=settings.HASH_POOL_WORKERS,
+    max_queue=settings.HASH_POOL_MAX_QUEUE
+)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifica la contraseña en el pool de hashing"""
+    return await hashing_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Genera el hash de la contraseña en el pool de hashing"""
+    return await hashing_pool.run(pwd_context.hash, password)
+
+
+# ===== CALIBRACIÓN =====
+
+def measure_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 5) -> float:
+    """Mediana en milisegundos de un hash con los parámetros indicados"""
+    context = CryptContext(
+        schemes=["argon2"],
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism
+    )
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def calibrate(
+    target_ms: float,
+    memory_cost: int = 65536,
+    parallelism: Optional[int] = None,
+    min_memory_cost: int = 19456,
+    max_time_cost: int = 10
+) -> Dict[str, float]:
+    """
+    Busca los parámetros de Argon2 más costosos que no superan target_ms
+    
+    Sube time_cost con la memoria indicada; si ni time_cost=1 cabe en el
+    objetivo, reduce la memoria a la mitad (hasta min_memory_cost, el
+    mínimo recomendado por OWASP).
+    
+    Returns:
+        Dict: time_cost, memory_cost (KiB), parallelism y ms medidos
+    """
+    parallelism = parallelism or min(os.cpu_count() or 1, 4)
+    
+    while True:
+        best = None
+        for time_cost in range(1, max_time_cost + 1):
+            elapsed = measure_ms(time_cost, memory_cost, parallelism)
+            if elapsed > target_ms:
+                break
+            best = {
+                "time_cost": time_cost,
+                "memory_cost": memory_cost,
+                "parallelism": parallelism,
+                "ms": round(elapsed, 1)
+            }
+        
+        if best or memory_cost <= min_memory_cost:
+            break
+        memory_cost = max(memory_cost // 2, min_memory_cost)
+    
+    # Ni con el mínimo cabe en el objetivo: devolver el mínimo seguro
+    return best or {
+        "time_cost": 1,
+        "memory_cost": min_memory_cost,
+        "parallelism": parallelism,
+        "ms": round(measure_ms(1, min_memory_cost, parallelism), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibra los parámetros de Argon2 para este host")
+    parser.add_argument("--target-ms", type=float, default=250, help="Latencia objetivo por hash")
+    parser.add_argument("--memory-cost", type=int, default=65536, help="Memoria inicial en KiB")
+    parser.add_argument("--parallelism", type=int, default=None, help="Hilos por hash")
+    args = parser.parse_args()
+    
+    print(f"Calibrando Argon2 para ~{args.target_ms:.0f} ms por hash...")
+    result = calibrate(args.target_ms, args.memory_cost, args.parallelism)
+    
+    print(f"Medido: {result['ms']} ms por hash\n")
+    print("Añade a tu .env:")
+    print(f"ARGON2_TIME_COST={result['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={result['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={result['parallelism']}")
+
+
+if __name__ == "__main__":
+    main()
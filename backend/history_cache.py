@@ -0,0 +1,200 @@
+"""
+Caché del historial de conversaciones listo para los proveedores de IA
+
+Guarda por conversación la lista de mensajes en formato OpenAI, su versión
+en formato Gemini y los tokens estimados de cada mensaje. Los mensajes nuevos
+se añaden a la entrada (write-through) en O(1), así un turno no vuelve a
+consultar ni a convertir todo el historial.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import math
+
+from .cache import LRUCache
+from .config import settings
+
+# Coste aproximado de cada mensaje aparte de su contenido (rol, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (~4 caracteres por token)"""
+    return math.ceil(len(text) / 4)
+
+
+def to_gemini_message(role: str, content: str) -> Dict:
+    """Convierte un mensaje de formato OpenAI a formato Gemini"""
+    return {
+        "role": "user" if role == "user" else "model",
+        "parts": [{"text": content}]
+    }
+
+
+class _HistoryLog:
+    """Listas paralelas (solo se añaden elementos) de una conversación"""
+
+    def __init__(self):
+        self.messages: List[Dict[str, str]] = []
+        self.gemini: List[Dict] = []
+        # token_offsets[i] = tokens de los mensajes [0, i)
+        self.token_offsets: List[int] = [0]
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        self.gemini.append(to_gemini_message(role, content))
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        self.token_offsets.append(self.token_offsets[-1] + tokens)
+
+
+class ChatHistory(Sequence):
+    """
+    Vista inmutable de un tramo del historial
+
+    Como el registro subyacente solo crece, una vista sigue siendo válida
+    aunque otro turno añada mensajes después; copiarla o recortarla es O(1).
+    """
+
+    __slots__ = ("_log", "_start", "_end")
+
+    def __init__(self, log: _HistoryLog, start: int = 0, end: Optional[int] = None):
+        self._log = log
+        self._start = start
+        self._end = len(log.messages) if end is None else end
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Dict[str, str]]) -> "ChatHistory":
+        """Crea una vista a partir de una lista de mensajes normal"""
+        log = _HistoryLog()
+        for msg in messages:
+            log.append(msg["role"], msg["content"])
+        return cls(log)
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("ChatHistory solo admite cortes contiguos")
+            return ChatHistory(self._log, self._start + start, self._start + max(stop, start))
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._log.messages[self._start + index]
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        messages = self._log.messages
+        for i in range(self._start, self._end):
+            yield messages[i]
+
+    @property
+    def gemini(self) -> List[Dict]:
+        """Mensajes ya convertidos al formato de Gemini"""
+        return self._log.gemini[self._start:self._end]
+
+    def message_tokens(self, index: int) -> int:
+        """Tokens estimados de un mensaje de la vista"""
+        offsets = self._log.token_offsets
+        return offsets[self._start + index + 1] - offsets[self._start + index]
+
+    def token_sum(self, start: int = 0, end: Optional[int] = None) -> int:
+        """Tokens estimados de los mensajes [start, end) de la vista, en O(1)"""
+        end = len(self) if end is None else end
+        offsets = self._log.token_offsets
+        return offsets[self._start + end] - offsets[self._start + start]
+
+
+class _HistoryEntry:
+    """Historial en caché y versión (updated_at) de la conversación que refleja"""
+
+    __slots__ = ("log", "version")
+
+    def __init__(self, version: Optional[datetime]):
+        self.log = _HistoryLog()
+        self.version = version
+
+
+class HistoryCache:
+    """Caché LRU de historiales por conversation_id"""
+
+    def __init__(self, max_size: int):
+        self._entries = LRUCache(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id: int, version: Optional[datetime] = None) -> Optional[ChatHistory]:
+        """
+        Devuelve una vista del historial en caché
+
+        Si se indica `version` (updated_at de la conversación) y no coincide,
+        otro proceso escribió en la conversación: la entrada se descarta.
+        """
+        entry: Optional[_HistoryEntry] = self._entries.get(conversation_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if version is not None and entry.version != version:
+            self._entries.pop(conversation_id)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return ChatHistory(entry.log)
+
+    def load(
+        self,
+        conversation_id: int,
+        messages: Iterable[Dict[str, str]],
+        version: Optional[datetime] = None
+    ) -> ChatHistory:
+        """Guarda el historial completo leído de la base de datos"""
+        entry = _HistoryEntry(version)
+        for msg in messages:
+            entry.log.append(msg["role"], msg["content"])
+
+        self._entries.set(conversation_id, entry)
+        return ChatHistory(entry.log)
+
+    def append(self, conversation_id: int, role: str, content: str) -> Optional[ChatHistory]:
+        """
+        Añade un mensaje nuevo a la entrada si la conversación está en caché
+
+        Devuelve la vista del historial con el mensaje (None si no estaba en
+        caché); no cuenta como consulta para hits/misses.
+        """
+        entry: Optional[_HistoryEntry] = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        entry.log.append(role, content)
+        return ChatHistory(entry.log)
+
+    def set_version(self, conversation_id: int, version: Optional[datetime]):
+        """Registra el updated_at que la conversación tiene tras escribir un turno"""
+        entry: Optional[_HistoryEntry] = self._entries.get(conversation_id)
+        if entry is not None:
+            entry.version = version
+
+    def invalidate(self, conversation_id: int):
+        """Descarta el historial de una conversación"""
+        self._entries.pop(conversation_id)
+
+    def clear(self):
+        """Vacía la caché y reinicia los contadores"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Aciertos y fallos de get() y conversaciones en caché"""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Instancia global de la caché de historiales
+history_cache = HistoryCache(max_size=settings.HISTORY_CACHE_SIZE)
@@ -0,0 +1,144 @@
+"""
+Cola de trabajos en segundo plano para la generación de respuestas
+
+La petición HTTP solo guarda el mensaje del usuario y encola el trabajo;
+un pool de workers (JOB_WORKERS tareas asyncio) llama a la IA y guarda la
+respuesta. El cliente recoge el resultado consultando el trabajo, con
+long-poll opcional.
+
+El estado de los trabajos vive en el proceso: con varios workers de
+uvicorn, las consultas deben llegar al mismo proceso que creó el trabajo.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import uuid
+
+from .cache import TTLCache
+from .config import settings
+from .metrics import background_context
+
+JobFunc = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFullError(Exception):
+    """La cola tiene demasiados trabajos pendientes"""
+
+
+@dataclass
+class Job:
+    """Trabajo encolado y su resultado"""
+    id: str
+    user_id: int
+    data: Dict[str, Any]
+    status: str = "queued"  # queued | running | completed | failed
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    
+    async def wait(self, timeout: float) -> bool:
+        """Espera hasta `timeout` segundos a que termine (True si terminó)"""
+        if timeout > 0 and not self.done.is_set():
+            try:
+                await asyncio.wait_for(self.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.done.is_set()
+
+
+class JobQueue:
+    """Cola acotada con un pool de workers asyncio"""
+    
+    def __init__(self, workers: int, max_queue: int, result_ttl: float, max_jobs: int = 100000):
+        self.workers = workers
+        self.max_queue = max_queue
+        # Trabajos en cola o en ejecución (no caducan) y terminados, consultables
+        # hasta result_ttl segundos después de terminar
+        self._pending: Dict[str, Job] = {}
+        self._jobs = TTLCache(max_size=max_jobs, ttl=result_ttl)
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self.running = 0
+    
+    def _ensure_workers(self):
+        """Arranca los workers en el event loop actual la primera vez"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [loop.create_task(self._worker(), context=background_context()) for _ in range(self.workers)]
+    
+    def submit(self, user_id: int, func: JobFunc, **data) -> Job:
+        """
+        Encola func() y devuelve el trabajo sin esperar a que se ejecute
+        
+        Raises:
+            JobQueueFullError: Si la cola está llena
+        """
+        self._ensure_workers()
+        job = Job(id=uuid.uuid4().hex, user_id=user_id, data=data)
+        
+        try:
+            self._queue.put_nowait((job, func))
+        except asyncio.QueueFull:
+            raise JobQueueFullError("Demasiados trabajos pendientes")
+        
+        self._pending[job.id] = job
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """Trabajo por ID (None si no existe o ya caducó)"""
+        job = self._pending.get(job_id)
+        return job if job is not None else self._jobs.get(job_id)
+    
+    async def _worker(self):
+        while True:
+            job, func = await self._queue.get()
+            job.status = "running"
+            self.running += 1
+            try:
+                job.result = await func()
+                job.status = "completed"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                self.running -= 1
+                job.finished_at = datetime.utcnow()
+                # La caducidad cuenta desde el final del trabajo
+                self._jobs.set(job.id, job)
+                self._pending.pop(job.id, None)
+                job.done.set()
+                self._queue.task_done()
+    
+    async def shutdown(self):
+        """Detiene los workers (los trabajos pendientes se pierden)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        self._loop = None
+        self._queue = None
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": self.running,
+            "jobs": len(self._pending) + len(self._jobs)
+        }
+
+
+# Instancia global de la cola de generación
+job_queue = JobQueue(
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_MAX_QUEUE,
+    result_ttl=settings.JOB_RESULT_TTL
+)
@@ -1,14 +1,16 @@
 """
 Aplicación principal FastAPI
 """
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-# Crear aplicación PRIMERO
+# Crear aplicación PRIMERO (JSON con orjson, ver backend/responses.py)
 app = FastAPI(
     title="AI Chatbot API",
     description="API REST para chatbot con inteligencia artificial",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Agregar CORS middleware ANTES de todo
@@ -18,11 +20,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Importar después de crear la app
+from .config import settings
 from .database import init_db
-from .routes import auth, conversations, chat
+from .ai_service import ai_service
+from .archive import conversation_archive
+from .auth import get_current_user, principal_cache
+from .group_commit import group_commit
+from .hashing import hashing_pool
+from .history_cache import history_cache
+from .jobs import job_queue
+from .metrics import MetricsMiddleware, cache_collector, render as render_metrics
+from .rate_limit import rate_limiter
+from .routes import auth, conversations, chat, search
+from .vector_index import semantic_index
+
+if settings.METRICS_ENABLED:
+    # El último middleware añadido es el más externo: mide la petición completa
+    app.add_middleware(MetricsMiddleware)
+    cache_collector.register("history", history_cache.stats)
+    cache_collector.register(
+        "response", lambda: ai_service.response_cache.stats() if ai_service.response_cache else None
+    )
+    cache_collector.register(
+        "principal_tokens", lambda: principal_cache.tokens.stats() if principal_cache else None
+    )
+    cache_collector.register(
+        "principal_users", lambda: principal_cache.users.stats() if principal_cache else None
+    )
+    # Aciertos = peticiones que se unieron a una llamada ya en curso
+    cache_collector.register(
+        "singleflight",
+        lambda: {"hits": ai_service.singleflight.shared, "misses": ai_service.singleflight.calls}
+        if ai_service.singleflight else None
+    )
 
 # Endpoints raíz ANTES de los routers
 @app.get("/")
@@ -41,21 +75,67 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/stats", dependencies=[Depends(get_current_user)])
+async def stats():
+    """Estadísticas de las cachés del proceso y del router de IA (requiere autenticación)"""
+    return {
+        "response_cache": ai_service.response_cache.stats() if ai_service.response_cache else None,
+        "singleflight": ai_service.singleflight.stats() if ai_service.singleflight else None,
+        "ai_router": ai_service.router.snapshot(),
+        "rate_limit": {"rejected": rate_limiter.rejected},
+        "jobs": job_queue.stats(),
+        "group_commit": group_commit.stats() if group_commit else None,
+        "history_cache": history_cache.stats(),
+        "vector_index": semantic_index.stats() if semantic_index else None,
+        "principal_cache": principal_cache.stats() if principal_cache else None,
+        "archive": conversation_archive.stats()
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 # Incluir routers DESPUÉS
 app.include_router(auth.router, prefix="/api")
 app.include_router(conversations.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Evento al iniciar la aplicación"""
-    init_db()
-    print("[OK] Base de datos inicializada")
+    version = init_db()
+    print(f"[OK] Base de datos en la versión de esquema {version}")
+    if semantic_index:
+        # Indexa en segundo plano los mensajes que falten
+        semantic_index.notify()
+    if settings.ARCHIVE_ENABLED:
+        # Archiva periódicamente las conversaciones inactivas
+        conversation_archive.start()
     print("[INFO] Servidor iniciado correctamente")
     print("[INFO] CORS habilitado para http://localhost:3000")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento al detener la aplicación"""
+    await job_queue.shutdown()
+    if group_commit:
+        await group_commit.shutdown()
+    if semantic_index:
+        await semantic_index.shutdown()
+    await conversation_archive.shutdown()
+    await ai_service.aclose()
+    hashing_pool.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
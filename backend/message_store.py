@@ -0,0 +1,207 @@
+"""
+Informe y compactación del almacenamiento de mensajes
+
+Los mensajes nuevos a partir de MESSAGE_BLOB_THRESHOLD bytes se guardan ya
+comprimidos y deduplicados (ver models.py); compact mueve a blobs los
+mensajes grandes que siguen en línea (anteriores a la migración 5 o a un
+umbral más bajo).
+
+Uso:
+    python -m backend.message_store report              # bytes en línea, en blobs y ahorro
+    python -m backend.message_store report --estimate   # ... y lo que ahorraría compact
+    python -m backend.message_store compact             # mueve a blobs los cuerpos grandes
+"""
+from typing import Any, Dict, Optional
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+
+from .compression import compress, content_hash
+from .config import settings
+from .database import engine as default_engine
+from .models import INDEX_MESSAGE_TEXT, MessageBlob
+
+# Bytes del texto en línea según el dialecto
+_BYTE_LENGTH = {"sqlite": "LENGTH(CAST(content AS BLOB))", "postgresql": "OCTET_LENGTH(content)"}
+
+
+def _byte_length(bind) -> str:
+    return _BYTE_LENGTH.get(bind.dialect.name, "LENGTH(content)")
+
+
+def storage_report(engine: Engine, threshold: int = settings.MESSAGE_BLOB_THRESHOLD) -> Dict[str, Any]:
+    """
+    Tamaño del contenido de los mensajes y bytes ahorrados por blobs
+    
+    - inline: mensajes con el texto en la fila
+    - blobs: blobs guardados, bytes originales y comprimidos
+    - logical_bytes: lo que ocuparían todos los mensajes sin compresión ni
+      deduplicación; stored_bytes: lo que ocupan; saved_bytes: la diferencia
+    - pending: mensajes en línea a partir de `threshold` (los que movería compact)
+    """
+    length = _byte_length(engine)
+    with engine.connect() as conn:
+        inline = conn.execute(text(
+            f"SELECT COUNT(*), COALESCE(SUM({length}), 0) FROM messages WHERE blob_hash IS NULL"
+        )).one()
+        referenced = conn.execute(text(
+            "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM messages m "
+            "JOIN message_blobs b ON b.hash = m.blob_hash"
+        )).one()
+        blobs = conn.execute(text(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM message_blobs"
+        )).one()
+        pending = conn.execute(text(
+            f"SELECT COUNT(*), COALESCE(SUM({length}), 0) FROM messages "
+            f"WHERE blob_hash IS NULL AND {length} >= :threshold"
+        ), {"threshold": max(threshold, 1)}).one()
+    
+    logical_bytes = inline[1] + referenced[1]
+    stored_bytes = inline[1] + blobs[2]
+    return {
+        "messages": inline[0] + referenced[0],
+        "inline": {"messages": inline[0], "bytes": inline[1]},
+        "blobs": {
+            "count": blobs[0],
+            "messages": referenced[0],
+            "original_bytes": blobs[1],
+            "stored_bytes": blobs[2],
+        },
+        "logical_bytes": logical_bytes,
+        "stored_bytes": stored_bytes,
+        "saved_bytes": logical_bytes - stored_bytes,
+        "pending": {"messages": pending[0], "bytes": pending[1]},
+    }
+
+
+def _large_inline_messages(conn, threshold: int, after_id: int, batch_size: int):
+    return conn.execute(text(
+        f"SELECT id, conversation_id, content FROM messages WHERE blob_hash IS NULL AND id > :after_id "
+        f"AND {_byte_length(conn)} >= :threshold ORDER BY id LIMIT :limit"
+    ), {"after_id": after_id, "threshold": threshold, "limit": batch_size}).all()
+
+
+def estimate_compaction(
+    engine: Engine,
+    threshold: int = settings.MESSAGE_BLOB_THRESHOLD,
+    codec: str = settings.MESSAGE_COMPRESSION,
+    level: Optional[int] = settings.MESSAGE_COMPRESSION_LEVEL,
+    batch_size: int = 1000
+) -> Dict[str, int]:
+    """Bytes que ahorraría compact (comprimiendo en memoria, sin escribir)"""
+    seen = set()
+    original = stored = after_id = 0
+    with engine.connect() as conn:
+        while True:
+            rows = _large_inline_messages(conn, threshold, after_id, batch_size)
+            if not rows:
+                break
+            for message_id, _, content in rows:
+                data = content.encode("utf-8")
+                original += len(data)
+                digest = content_hash(data)
+                if digest not in seen:
+                    seen.add(digest)
+                    stored += len(compress(data, codec, level)[1])
+            after_id = rows[-1][0]
+    return {"original_bytes": original, "stored_bytes": stored, "saved_bytes": original - stored}
+
+
+def compact(
+    engine: Engine,
+    threshold: int = settings.MESSAGE_BLOB_THRESHOLD,
+    codec: str = settings.MESSAGE_COMPRESSION,
+    level: Optional[int] = settings.MESSAGE_COMPRESSION_LEVEL,
+    batch_size: int = 500
+) -> int:
+    """
+    Mueve a blobs los mensajes en línea a partir de `threshold` bytes
+    
+    Cada lote va en su propia transacción, así que se puede interrumpir y
+    reanudar. El texto de los mensajes movidos se vuelve a indexar para la
+    búsqueda (los triggers solo indexan el texto en línea).
+    
+    Returns:
+        int: Mensajes movidos
+    """
+    if engine.dialect.name != "sqlite":
+        raise ValueError("Los blobs de mensajes solo se usan con SQLite (PostgreSQL comprime con TOAST)")
+    if threshold < 1:
+        raise ValueError("El umbral debe ser de al menos 1 byte")
+    
+    moved = after_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = _large_inline_messages(conn, threshold, after_id, batch_size)
+            if not rows:
+                break
+            
+            blobs, updates, indexed = {}, [], []
+            for message_id, conversation_id, content in rows:
+                data = content.encode("utf-8")
+                digest = content_hash(data)
+                if digest not in blobs:
+                    stored_codec, stored = compress(data, codec, level)
+                    blobs[digest] = {"hash": digest, "codec": stored_codec, "size": len(data), "data": stored}
+                updates.append({"id": message_id, "hash": digest})
+                indexed.append({"id": message_id, "content": content, "conversation_id": conversation_id})
+            
+            conn.execute(
+                sqlite_insert(MessageBlob.__table__).on_conflict_do_nothing(index_elements=["hash"]),
+                list(blobs.values())
+            )
+            conn.execute(text("UPDATE messages SET content = '', blob_hash = :hash WHERE id = :id"), updates)
+            # El trigger quita del índice de búsqueda los mensajes que pasan a un blob
+            conn.execute(text(INDEX_MESSAGE_TEXT), indexed)
+            moved += len(rows)
+            after_id = rows[-1][0]
+    return moved
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1_000_000:.2f} MB"
+
+
+def print_report(report: Dict[str, Any], estimate: Optional[Dict[str, int]] = None):
+    blobs = report["blobs"]
+    print(f"Mensajes: {report['messages']}")
+    print(f"  En línea: {report['inline']['messages']} ({_megabytes(report['inline']['bytes'])})")
+    print(
+        f"  En blobs: {blobs['messages']} mensajes, {blobs['count']} blobs "
+        f"({_megabytes(blobs['original_bytes'])} -> {_megabytes(blobs['stored_bytes'])})"
+    )
+    ratio = report["saved_bytes"] / report["logical_bytes"] if report["logical_bytes"] else 0.0
+    print(
+        f"Contenido: {_megabytes(report['logical_bytes'])} sin comprimir, "
+        f"{_megabytes(report['stored_bytes'])} guardados; ahorro {_megabytes(report['saved_bytes'])} ({ratio:.0%})"
+    )
+    print(f"Pendientes de compactar: {report['pending']['messages']} ({_megabytes(report['pending']['bytes'])})")
+    if estimate is not None:
+        print(
+            f"compact ahorraría {_megabytes(estimate['saved_bytes'])} "
+            f"({_megabytes(estimate['original_bytes'])} -> {_megabytes(estimate['stored_bytes'])})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacenamiento comprimido de mensajes")
+    parser.add_argument("--threshold", type=int, default=settings.MESSAGE_BLOB_THRESHOLD, help="Bytes mínimos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    report_parser = subparsers.add_parser("report", help="Bytes en línea, en blobs y ahorrados")
+    report_parser.add_argument("--estimate", action="store_true", help="Calcular lo que ahorraría compact")
+    
+    subparsers.add_parser("compact", help="Mueve a blobs los mensajes grandes en línea")
+    args = parser.parse_args()
+    
+    if args.command == "compact":
+        moved = compact(default_engine, args.threshold)
+        print(f"Mensajes movidos a blobs: {moved}")
+    estimate = estimate_compaction(default_engine, args.threshold) if getattr(args, "estimate", False) else None
+    print_report(storage_report(default_engine, args.threshold), estimate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Métricas Prometheus de la API, la base de datos y los proveedores de IA
+
+- MetricsMiddleware: latencia, peticiones en curso y estado por ruta (la
+  plantilla de la ruta, no la URL, para acotar la cardinalidad), más el
+  número y el tiempo de las consultas SQL de cada petición.
+- instrument_engine: eventos de cursor del engine; el acumulado de la
+  petición vive en un ContextVar que fija el middleware. Las tareas de
+  fondo arrancan con background_context() para no heredarlo.
+- observe_ai_call / record_tokens: latencia, resultados y tokens por
+  proveedor y modelo.
+- Cachés: sus contadores se leen de stats() al hacer scrape, sin coste en
+  el camino de la petición.
+
+Las métricas son del proceso: con varios workers, Prometheus debe leer
+cada uno (o usar el modo multiproceso de prometheus_client).
+"""
+from contextvars import Context, ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+from .cache import LRUCache
+
+# Ruta para las peticiones que no coinciden con ninguna (evita una serie por URL)
+UNMATCHED_ROUTE = "unmatched"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+AI_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Peticiones HTTP terminadas", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP (hasta el final del cuerpo)",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso", ["method", "route"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Duración de cada consulta SQL", buckets=LATENCY_BUCKETS
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries", "Consultas SQL por petición HTTP",
+    ["method", "route"], buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "http_request_db_seconds", "Tiempo total en consultas SQL por petición HTTP",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+AI_REQUESTS = Counter(
+    "ai_requests_total", "Llamadas a los proveedores de IA", ["provider", "model", "outcome"]
+)
+AI_LATENCY = Histogram(
+    "ai_request_duration_seconds", "Latencia de las llamadas (sin streaming) a los proveedores de IA",
+    ["provider", "model"], buckets=AI_LATENCY_BUCKETS
+)
+AI_TOKENS = Counter(
+    "ai_tokens_total", "Tokens consumidos por proveedor y modelo", ["provider", "model", "type"]
+)
+
+# [consultas, segundos] de la petición en curso (None fuera de una petición)
+_request_db: ContextVar[Optional[List[float]]] = ContextVar("request_db", default=None)
+
+
+def background_context() -> Context:
+    """
+    Contexto vacío para las tareas de fondo (create_task(..., context=...))
+    
+    create_task copia el contexto actual: una tarea arrancada durante una
+    petición sumaría sus consultas a las de esa petición.
+    """
+    return Context()
+
+
+# ===== BASE DE DATOS =====
+
+def instrument_engine(engine: Engine):
+    """Mide cada consulta del engine (síncrono o el sync_engine de uno asíncrono)"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed)
+        totals = _request_db.get()
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += elapsed
+    
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # La consulta falló: descartar su inicio para no desalinear la pila
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+# ===== PROVEEDORES DE IA =====
+
+def observe_ai_call(provider: str, model: str, latency_ms: Optional[float], ok: bool):
+    """Registra una llamada (latency_ms None = streaming, solo el resultado)"""
+    AI_REQUESTS.labels(provider, model, "ok" if ok else "error").inc()
+    if ok and latency_ms is not None:
+        AI_LATENCY.labels(provider, model).observe(latency_ms / 1000)
+
+
+def record_tokens(provider: str, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Suma los tokens que informa el proveedor (los ausentes se ignoran)"""
+    if prompt_tokens:
+        AI_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        AI_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+
+
+# ===== CACHÉS =====
+
+class CacheCollector:
+    """Expone aciertos, fallos y tamaño de las cachés registradas al hacer scrape"""
+    
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Optional[Dict[str, Any]]]] = {}
+    
+    def register(self, name: str, stats: Callable[[], Optional[Dict[str, Any]]]):
+        """`stats` devuelve un dict con hits, misses y opcionalmente size (o None)"""
+        self._sources[name] = stats
+    
+    def collect(self):
+        hits = CounterMetricFamily("app_cache_hits", "Aciertos de caché", labels=["cache"])
+        misses = CounterMetricFamily("app_cache_misses", "Fallos de caché", labels=["cache"])
+        ratio = GaugeMetricFamily("app_cache_hit_ratio", "Proporción de aciertos de caché", labels=["cache"])
+        size = GaugeMetricFamily("app_cache_entries", "Entradas en caché", labels=["cache"])
+        
+        for name, stats_func in self._sources.items():
+            stats = stats_func()
+            if stats is None:
+                continue
+            lookups = stats["hits"] + stats["misses"]
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hits"] / lookups if lookups else 0.0)
+            if "size" in stats:
+                size.add_metric([name], stats["size"])
+        
+        return [hits, misses, ratio, size]
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+# ===== HTTP =====
+
+class MetricsMiddleware:
+    """Middleware ASGI de métricas por ruta"""
+    
+    def __init__(self, app, route_cache_size: int = 4096):
+        self.app = app
+        # (método, path) -> plantilla de la ruta, para no recorrer las rutas en cada petición
+        self._routes = LRUCache(route_cache_size)
+        # Series ya resueltas: labels() es lo más caro de registrar una petición
+        self._series: Dict[Tuple[str, str], Tuple] = {}
+        self._requests: Dict[Tuple[str, str, int], Any] = {}
+    
+    def _route_name(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        name = self._routes.get(key)
+        if name is None:
+            name = UNMATCHED_ROUTE
+            for route in scope["app"].router.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    name = getattr(route, "path", UNMATCHED_ROUTE)
+                    break
+            self._routes.set(key, name)
+        return name
+    
+    def _route_series(self, method: str, route: str) -> Tuple:
+        series = self._series.get((method, route))
+        if series is None:
+            series = (
+                HTTP_IN_FLIGHT.labels(method, route),
+                HTTP_LATENCY.labels(method, route),
+                DB_QUERIES_PER_REQUEST.labels(method, route),
+                DB_TIME_PER_REQUEST.labels(method, route),
+            )
+            self._series[(method, route)] = series
+        return series
+    
+    def _count_request(self, method: str, route: str, status: int):
+        counter = self._requests.get((method, route, status))
+        if counter is None:
+            counter = HTTP_REQUESTS.labels(method, route, str(status))
+            self._requests[(method, route, status)] = counter
+        counter.inc()
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        route = self._route_name(scope)
+        status: List[int] = [500]
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        
+        in_flight, latency, db_queries, db_time = self._route_series(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            _request_db.reset(token)
+            self._count_request(method, route, status[0])
+            latency.observe(elapsed)
+            db_queries.observe(totals[0])
+            db_time.observe(totals[1])
+
+
+def render() -> Tuple[bytes, str]:
+    """Cuerpo y content type de la respuesta de /metrics"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,156 @@
+"""
+Migraciones versionadas del esquema de base de datos
+
+Cada módulo de `versions/` (vNNNN_descripcion.py) define VERSION, DESCRIPTION
+y las funciones up(conn) y down(conn). La versión aplicada se registra en la
+tabla schema_version; cada migración se ejecuta en su propia transacción.
+
+Uso:
+    python -m backend.migrations upgrade        # aplicar las pendientes
+    python -m backend.migrations downgrade 2    # volver a la versión 2
+    python -m backend.migrations current        # versión actual
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+import importlib
+import pkgutil
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+from . import versions
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+_metadata = MetaData()
+
+schema_version = Table(
+    SCHEMA_VERSION_TABLE, _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaVersionError(Exception):
+    """El esquema de la base de datos no coincide con el que espera el código"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Migración cargada desde un módulo de versions/"""
+    version: int
+    description: str
+    up: Callable[[Connection], None]
+    down: Callable[[Connection], None]
+
+
+def load_migrations() -> List[Migration]:
+    """Migraciones disponibles ordenadas por versión"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(versions.__path__):
+        if not module_info.name.startswith("v"):
+            continue
+        module = importlib.import_module(f"{versions.__name__}.{module_info.name}")
+        migrations.append(Migration(
+            version=module.VERSION,
+            description=module.DESCRIPTION,
+            up=module.up,
+            down=module.down
+        ))
+    
+    migrations.sort(key=lambda migration: migration.version)
+    numbers = [migration.version for migration in migrations]
+    if numbers != list(range(1, len(numbers) + 1)):
+        raise SchemaVersionError(f"Numeración de migraciones no consecutiva: {numbers}")
+    return migrations
+
+
+def head_version() -> int:
+    """Última versión que conoce el código"""
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(conn: Connection) -> int:
+    """Versión aplicada en la base de datos (0 si nunca se migró)"""
+    if not inspect(conn).has_table(SCHEMA_VERSION_TABLE):
+        return 0
+    
+    versions_applied = conn.execute(select(schema_version.c.version)).scalars().all()
+    return max(versions_applied, default=0)
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """
+    Aplica las migraciones pendientes hasta `target` (por defecto la última)
+    
+    Returns:
+        List[int]: Versiones aplicadas
+    """
+    migrations = load_migrations()
+    if target is None:
+        target = migrations[-1].version if migrations else 0
+    
+    with engine.begin() as conn:
+        _metadata.create_all(conn, checkfirst=True)
+        current = current_version(conn)
+    
+    applied = []
+    for migration in migrations:
+        if current < migration.version <= target:
+            with engine.begin() as conn:
+                migration.up(conn)
+                conn.execute(schema_version.insert().values(
+                    version=migration.version,
+                    description=migration.description,
+                    applied_at=datetime.utcnow()
+                ))
+            applied.append(migration.version)
+    return applied
+
+
+def downgrade(engine: Engine, target: int) -> List[int]:
+    """
+    Revierte las migraciones posteriores a `target`, de la más nueva a la más antigua
+    
+    Returns:
+        List[int]: Versiones revertidas
+    """
+    with engine.begin() as conn:
+        current = current_version(conn)
+    
+    reverted = []
+    for migration in reversed(load_migrations()):
+        if target < migration.version <= current:
+            with engine.begin() as conn:
+                migration.down(conn)
+                conn.execute(schema_version.delete().where(
+                    schema_version.c.version == migration.version
+                ))
+            reverted.append(migration.version)
+    return reverted
+
+
+def check(engine: Engine) -> int:
+    """
+    Verifica que la base de datos está en la versión que espera el código
+    
+    Raises:
+        SchemaVersionError: Si faltan migraciones o la base de datos es más nueva
+    """
+    head = head_version()
+    with engine.connect() as conn:
+        current = current_version(conn)
+    
+    if current < head:
+        raise SchemaVersionError(
+            f"Esquema en la versión {current}, se esperaba {head}: "
+            "ejecuta `python -m backend.migrations upgrade`"
+        )
+    if current > head:
+        raise SchemaVersionError(
+            f"Esquema en la versión {current}, más nueva que la del código ({head})"
+        )
+    return current
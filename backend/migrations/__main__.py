@@ -0,0 +1,39 @@
+"""
+CLI de migraciones: python -m backend.migrations upgrade|downgrade|current
+"""
+import argparse
+
+from ..database import engine
+from . import current_version, downgrade, head_version, load_migrations, upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de base de datos")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    upgrade_parser = subparsers.add_parser("upgrade", help="Aplica las migraciones pendientes")
+    upgrade_parser.add_argument("target", type=int, nargs="?", default=None, help="Versión destino")
+    
+    downgrade_parser = subparsers.add_parser("downgrade", help="Revierte hasta una versión")
+    downgrade_parser.add_argument("target", type=int, help="Versión destino (0 = vacía)")
+    
+    subparsers.add_parser("current", help="Muestra la versión aplicada")
+    subparsers.add_parser("history", help="Lista las migraciones disponibles")
+    args = parser.parse_args()
+    
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.target)
+        print(f"Aplicadas: {applied}" if applied else "Sin migraciones pendientes")
+    elif args.command == "downgrade":
+        reverted = downgrade(engine, args.target)
+        print(f"Revertidas: {reverted}" if reverted else "Nada que revertir")
+    elif args.command == "current":
+        with engine.connect() as conn:
+            print(f"Versión actual: {current_version(conn)} (última: {head_version()})")
+    else:
+        for migration in load_migrations():
+            print(f"{migration.version:04d}  {migration.description}")
+
+
+if __name__ == "__main__":
+    main()
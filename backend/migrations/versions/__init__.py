@@ -0,0 +1,3 @@
+"""
+Migraciones versionadas del esquema
+"""
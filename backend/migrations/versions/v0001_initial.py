@@ -0,0 +1,51 @@
+"""
+Esquema inicial: usuarios, conversaciones y mensajes
+"""
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text
+)
+from sqlalchemy.engine import Connection
+
+VERSION = 1
+DESCRIPTION = "Esquema inicial"
+
+# Definición congelada de las tablas en esta versión (no importar models.py:
+# los modelos cambian y esta migración debe crear siempre lo mismo)
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("username", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("created_at", DateTime),
+    Column("is_active", Boolean),
+)
+
+Table(
+    "conversations", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+Table(
+    "messages", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("conversation_id", Integer, ForeignKey("conversations.id"), nullable=False),
+    Column("role", String, nullable=False),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime),
+)
+
+
+def up(conn: Connection):
+    # checkfirst: las bases de datos creadas antes de las migraciones ya tienen las tablas
+    metadata.create_all(conn, checkfirst=True)
+
+
+def down(conn: Connection):
+    metadata.drop_all(conn, checkfirst=True)
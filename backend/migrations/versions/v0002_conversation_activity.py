@@ -0,0 +1,63 @@
+"""
+Datos desnormalizados de actividad en conversaciones
+(message_count, last_message_preview, last_message_at)
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from ...models import message_preview
+
+VERSION = 2
+DESCRIPTION = "Contador y último mensaje en conversaciones"
+
+COLUMNS = {
+    "message_count": "INTEGER NOT NULL DEFAULT 0",
+    "last_message_preview": "VARCHAR",
+    "last_message_at": "TIMESTAMP",
+}
+
+
+def up(conn: Connection):
+    existing = {column["name"] for column in inspect(conn).get_columns("conversations")}
+    
+    for name, ddl in COLUMNS.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE conversations ADD COLUMN {name} {ddl}"))
+    
+    # Rellenar a partir de los mensajes existentes
+    conn.execute(text("""
+        UPDATE conversations SET
+            message_count = (
+                SELECT COUNT(*) FROM messages
+                WHERE messages.conversation_id = conversations.id
+            ),
+            last_message_at = (
+                SELECT MAX(created_at) FROM messages
+                WHERE messages.conversation_id = conversations.id
+            )
+    """))
+    
+    # La vista previa se normaliza en Python, igual que al escribir un turno
+    latest = conn.execute(text("""
+        SELECT conversations.id, (
+            SELECT content FROM messages
+            WHERE messages.conversation_id = conversations.id
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        ) AS content
+        FROM conversations
+    """)).all()
+    previews = [
+        {"id": row.id, "preview": message_preview(row.content)}
+        for row in latest if row.content is not None
+    ]
+    if previews:
+        conn.execute(
+            text("UPDATE conversations SET last_message_preview = :preview WHERE id = :id"),
+            previews
+        )
+
+
+def down(conn: Connection):
+    for name in COLUMNS:
+        conn.execute(text(f"ALTER TABLE conversations DROP COLUMN {name}"))
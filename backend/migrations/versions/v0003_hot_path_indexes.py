@@ -0,0 +1,27 @@
+"""
+Índices compuestos para las consultas más frecuentes de las rutas
+
+- messages (conversation_id, created_at, id): historial y paginación de mensajes
+- conversations (user_id, updated_at DESC, id DESC): listado paginado del usuario
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+VERSION = 3
+DESCRIPTION = "Índices compuestos de mensajes y conversaciones"
+
+
+def up(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_messages_conversation_created "
+        "ON messages (conversation_id, created_at, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user_updated "
+        "ON conversations (user_id, updated_at DESC, id DESC)"
+    ))
+
+
+def down(conn: Connection):
+    conn.execute(text("DROP INDEX IF EXISTS ix_messages_conversation_created"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_conversations_user_updated"))
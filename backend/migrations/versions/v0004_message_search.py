@@ -0,0 +1,66 @@
+"""
+Índice de búsqueda de texto completo sobre los mensajes
+
+- SQLite: tabla FTS5 de contenido externo (vista messages_search) mantenida
+  por triggers de INSERT/DELETE/UPDATE; se reconstruye con los mensajes existentes
+- PostgreSQL: columna tsvector generada (content_tsv) con índice GIN
+"""
+from sqlalchemy.engine import Connection
+
+VERSION = 4
+DESCRIPTION = "Búsqueda de texto completo en mensajes"
+
+UP = {
+    "sqlite": [
+        "CREATE VIEW IF NOT EXISTS messages_search AS "
+        "SELECT m.id AS id, m.content AS content, 'u' || c.user_id AS owner "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, owner, content='messages_search', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts (rowid, content, owner) "
+        "SELECT new.id, new.content, 'u' || user_id FROM conversations WHERE id = new.conversation_id; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, content, owner) "
+        "SELECT 'delete', old.id, old.content, 'u' || user_id FROM conversations WHERE id = old.conversation_id; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, content, owner) "
+        "SELECT 'delete', old.id, old.content, 'u' || user_id FROM conversations WHERE id = old.conversation_id; "
+        "INSERT INTO messages_fts (rowid, content, owner) "
+        "SELECT new.id, new.content, 'u' || user_id FROM conversations WHERE id = new.conversation_id; "
+        "END",
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ],
+    "postgresql": [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_messages_content_tsv ON messages USING GIN (content_tsv)",
+    ],
+}
+
+DOWN = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS messages_fts_insert",
+        "DROP TRIGGER IF EXISTS messages_fts_delete",
+        "DROP TRIGGER IF EXISTS messages_fts_update",
+        "DROP TABLE IF EXISTS messages_fts",
+        "DROP VIEW IF EXISTS messages_search",
+    ],
+    "postgresql": [
+        "DROP INDEX IF EXISTS ix_messages_content_tsv",
+        "ALTER TABLE messages DROP COLUMN IF EXISTS content_tsv",
+    ],
+}
+
+
+def up(conn: Connection):
+    for statement in UP.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+
+def down(conn: Connection):
+    for statement in DOWN.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
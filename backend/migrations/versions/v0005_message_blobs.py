@@ -0,0 +1,135 @@
+"""
+Cuerpos de mensaje comprimidos y deduplicados (message_blobs)
+
+- Tabla message_blobs (hash SHA-256 -> datos comprimidos) y columna
+  messages.blob_hash con su índice
+- SQLite: el índice de búsqueda pasa de contenido externo (vista
+  messages_search) a una tabla FTS5 con su propia copia del texto, así los
+  triggers no necesitan leer los blobs: indexan el texto en línea, borran por
+  rowid y liberan los blobs que quedan sin mensajes. El texto de los mensajes
+  en blobs lo indexa la aplicación. Ningún trigger usa funciones propias, así
+  que cualquier conexión sqlite3 puede escribir en messages.
+
+Los mensajes existentes siguen en línea; para moverlos a blobs:
+python -m backend.message_store compact
+"""
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, inspect
+from sqlalchemy.engine import Connection
+
+from ...compression import decompress
+
+VERSION = 5
+DESCRIPTION = "Blobs comprimidos y deduplicados para mensajes grandes"
+
+metadata = MetaData()
+
+message_blobs = Table(
+    "message_blobs", metadata,
+    Column("hash", String(64), primary_key=True),
+    Column("codec", String(8), nullable=False),
+    Column("size", Integer, nullable=False),
+    Column("data", LargeBinary, nullable=False),
+)
+
+_INDEX_NEW_INLINE = (
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT new.id, new.content, 'u' || user_id FROM conversations "
+    "WHERE id = new.conversation_id AND new.blob_hash IS NULL; "
+)
+_RELEASE_OLD = (
+    "DELETE FROM message_blobs WHERE hash = old.blob_hash "
+    "AND NOT EXISTS (SELECT 1 FROM messages WHERE blob_hash = old.blob_hash); "
+)
+
+DROP_SEARCH = [
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TABLE IF EXISTS messages_fts",
+    "DROP VIEW IF EXISTS messages_search",
+]
+
+SEARCH_UP = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, owner, tokenize='unicode61 remove_diacritics 2')",
+    # En este punto todos los mensajes están en línea
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT m.id, m.content, 'u' || c.user_id FROM messages m "
+    "JOIN conversations c ON c.id = m.conversation_id WHERE m.blob_hash IS NULL",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    f"{_INDEX_NEW_INLINE}"
+    "END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "DELETE FROM messages_fts WHERE rowid = old.id; "
+    f"{_RELEASE_OLD}"
+    "END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, blob_hash ON messages BEGIN "
+    "DELETE FROM messages_fts WHERE rowid = old.id "
+    "AND (new.blob_hash IS NULL OR new.blob_hash IS NOT old.blob_hash); "
+    f"{_INDEX_NEW_INLINE}"
+    f"{_RELEASE_OLD}"
+    "END",
+]
+
+# Índice de la versión 4 (contenido externo, texto siempre en línea)
+SEARCH_DOWN = [
+    "CREATE VIEW messages_search AS "
+    "SELECT m.id AS id, m.content AS content, 'u' || c.user_id AS owner "
+    "FROM messages m JOIN conversations c ON c.id = m.conversation_id",
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, owner, content='messages_search', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT new.id, new.content, 'u' || user_id FROM conversations WHERE id = new.conversation_id; "
+    "END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, content, owner) "
+    "SELECT 'delete', old.id, old.content, 'u' || user_id FROM conversations WHERE id = old.conversation_id; "
+    "END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, content, owner) "
+    "SELECT 'delete', old.id, old.content, 'u' || user_id FROM conversations WHERE id = old.conversation_id; "
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT new.id, new.content, 'u' || user_id FROM conversations WHERE id = new.conversation_id; "
+    "END",
+    "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+]
+
+
+def _restore_inline_content(conn: Connection, batch_size: int = 500):
+    """Devuelve a la fila el texto de los blobs (descomprimido en Python)"""
+    while True:
+        rows = conn.exec_driver_sql(
+            "SELECT m.id, b.data FROM messages m JOIN message_blobs b ON b.hash = m.blob_hash "
+            f"WHERE m.blob_hash IS NOT NULL ORDER BY m.id LIMIT {batch_size}"
+        ).fetchall()
+        if not rows:
+            return
+        conn.exec_driver_sql(
+            "UPDATE messages SET content = ?, blob_hash = NULL WHERE id = ?",
+            [(decompress(data), message_id) for message_id, data in rows]
+        )
+
+
+def up(conn: Connection):
+    metadata.create_all(conn, checkfirst=True)
+    if "blob_hash" not in {column["name"] for column in inspect(conn).get_columns("messages")}:
+        conn.exec_driver_sql("ALTER TABLE messages ADD COLUMN blob_hash VARCHAR(64)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_messages_blob_hash ON messages (blob_hash)")
+    
+    if conn.dialect.name == "sqlite":
+        for statement in DROP_SEARCH + SEARCH_UP:
+            conn.exec_driver_sql(statement)
+
+
+def down(conn: Connection):
+    if conn.dialect.name == "sqlite":
+        # Devolver a la fila el texto de los blobs antes de quitar la columna
+        _restore_inline_content(conn)
+        for statement in DROP_SEARCH + SEARCH_DOWN:
+            conn.exec_driver_sql(statement)
+    
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_messages_blob_hash")
+    conn.exec_driver_sql("ALTER TABLE messages DROP COLUMN blob_hash")
+    metadata.drop_all(conn, checkfirst=True)
@@ -0,0 +1,39 @@
+"""
+Archivo en frío de conversaciones inactivas
+(conversations.archive_file y conversations.rehydrated_at)
+
+Revertirla con conversaciones archivadas dejaría sus mensajes solo en los
+ficheros: antes hay que restaurarlas con `python -m backend.archive restore --all`.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+VERSION = 6
+DESCRIPTION = "Archivo en frío de conversaciones"
+
+COLUMNS = {
+    "archive_file": "VARCHAR",
+    "rehydrated_at": "TIMESTAMP",
+}
+
+
+def up(conn: Connection):
+    existing = {column["name"] for column in inspect(conn).get_columns("conversations")}
+    
+    for name, ddl in COLUMNS.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE conversations ADD COLUMN {name} {ddl}"))
+
+
+def down(conn: Connection):
+    archived = conn.execute(text(
+        "SELECT COUNT(*) FROM conversations WHERE archive_file IS NOT NULL"
+    )).scalar()
+    if archived:
+        raise RuntimeError(
+            f"{archived} conversaciones archivadas: restáuralas antes con "
+            "`python -m backend.archive restore --all`"
+        )
+    
+    for name in COLUMNS:
+        conn.execute(text(f"ALTER TABLE conversations DROP COLUMN {name}"))
@@ -0,0 +1,30 @@
+"""
+Identificador aleatorio de la base de datos (database_instance)
+
+El índice vectorial lo guarda junto a la matriz para reconstruirse solo si
+la base de datos es otra, no al borrarse mensajes.
+"""
+import uuid
+
+from sqlalchemy import Column, MetaData, String, Table
+from sqlalchemy.engine import Connection
+
+VERSION = 7
+DESCRIPTION = "Identificador de la base de datos"
+
+metadata = MetaData()
+
+database_instance = Table(
+    "database_instance", metadata,
+    Column("id", String(32), primary_key=True),
+)
+
+
+def up(conn: Connection):
+    metadata.create_all(conn, checkfirst=True)
+    if conn.execute(database_instance.select().limit(1)).first() is None:
+        conn.execute(database_instance.insert().values(id=uuid.uuid4().hex))
+
+
+def down(conn: Connection):
+    metadata.drop_all(conn, checkfirst=True)
@@ -0,0 +1,146 @@
+"""
+Proveedor de IA simulado (AI_PROVIDER=mock)
+
+Responde sin red ni claves, para desarrollo, CI y pruebas de capacidad:
+- Respuestas deterministas: el texto depende solo del modelo, el system
+  prompt y la conversación (la misma petición da siempre la misma respuesta).
+- Latencia hasta el primer token según una distribución (fixed, uniform,
+  normal o lognormal) y después un ritmo de tokens por segundo, también sin
+  streaming, como un proveedor real.
+- Errores y timeouts inyectados con la probabilidad configurada; ocurren
+  antes del primer token (como un 5xx o un timeout HTTP), así que el router
+  los cuenta y pasa al siguiente destino igual que con los reales.
+"""
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+
+from . import metrics
+from .config import settings
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+VOCABULARY = (
+    "el modelo ajusta los pesos de la red neuronal con descenso de gradiente "
+    "y valida el resultado sobre datos que no ha visto durante el entrenamiento "
+    "para medir la precisión el recall y el sesgo de cada predicción"
+).split()
+
+
+class MockProvider:
+    """Proveedor simulado con latencia, ritmo de tokens y fallos configurables"""
+    
+    def __init__(
+        self,
+        latency_ms: float = 300.0,
+        distribution: str = "lognormal",
+        spread: float = 0.5,
+        tokens_per_second: float = 50.0,
+        min_tokens: int = 50,
+        max_tokens: int = 250,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout: float = 30.0,
+        seed: Optional[int] = None
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Distribución de latencia no soportada: {distribution}")
+        if min_tokens < 1 or max_tokens < min_tokens:
+            raise ValueError("Se espera 1 <= min_tokens <= max_tokens")
+        
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.spread = spread
+        self.tokens_per_second = tokens_per_second
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        # Latencias y fallos (el texto de la respuesta no depende de la semilla)
+        self._rng = random.Random(seed)
+    
+    @classmethod
+    def from_settings(cls) -> "MockProvider":
+        return cls(
+            latency_ms=settings.MOCK_AI_LATENCY_MS,
+            distribution=settings.MOCK_AI_LATENCY_DISTRIBUTION,
+            spread=settings.MOCK_AI_LATENCY_SPREAD,
+            tokens_per_second=settings.MOCK_AI_TOKENS_PER_SECOND,
+            min_tokens=settings.MOCK_AI_MIN_TOKENS,
+            max_tokens=settings.MOCK_AI_MAX_TOKENS,
+            error_rate=settings.MOCK_AI_ERROR_RATE,
+            timeout_rate=settings.MOCK_AI_TIMEOUT_RATE,
+            timeout=settings.AI_HTTP_TIMEOUT,
+            seed=settings.MOCK_AI_SEED
+        )
+    
+    def sample_latency(self) -> float:
+        """Segundos hasta el primer token (latency_ms es la mediana)"""
+        if self.distribution == "fixed":
+            latency = self.latency_ms
+        elif self.distribution == "uniform":
+            latency = self._rng.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+        elif self.distribution == "normal":
+            latency = self._rng.gauss(self.latency_ms, self.latency_ms * self.spread)
+        else:
+            # Cola larga: la forma habitual de la latencia de los proveedores
+            latency = self.latency_ms * math.exp(self._rng.gauss(0.0, self.spread))
+        return max(0.0, latency) / 1000
+    
+    def completion(self, messages: List[Dict[str, str]], system_prompt: str, model: str) -> List[str]:
+        """Fragmentos (un token por palabra) de la respuesta, fijos para cada petición"""
+        payload = json.dumps(
+            [model, system_prompt, [[msg["role"], msg["content"]] for msg in messages]],
+            ensure_ascii=False
+        )
+        digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest()
+        rng = random.Random(int.from_bytes(digest, "big"))
+        
+        words = rng.choices(VOCABULARY, k=rng.randint(self.min_tokens, self.max_tokens))
+        return [words[0].capitalize()] + [f" {word}" for word in words[1:]]
+    
+    async def _first_token(self):
+        """Espera la latencia inicial y aplica los fallos inyectados"""
+        await asyncio.sleep(self.sample_latency())
+        
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            raise Exception("Error al comunicarse con el proveedor simulado: error inyectado")
+        if roll < self.error_rate + self.timeout_rate:
+            await asyncio.sleep(self.timeout)
+            raise Exception(f"Error al comunicarse con el proveedor simulado: timeout ({self.timeout}s)")
+    
+    def _record_tokens(self, messages: List[Dict[str, str]], system_prompt: str, model: str, completion_tokens: int):
+        prompt_tokens = len(system_prompt.split()) + sum(len(msg["content"].split()) for msg in messages)
+        metrics.record_tokens("mock", model, prompt_tokens, completion_tokens)
+    
+    async def generate(self, messages: List[Dict[str, str]], system_prompt: str, model: str) -> str:
+        """Respuesta completa tras la latencia inicial y el tiempo de generación"""
+        tokens = self.completion(messages, system_prompt, model)
+        await self._first_token()
+        if self.tokens_per_second:
+            await asyncio.sleep((len(tokens) - 1) / self.tokens_per_second)
+        
+        self._record_tokens(messages, system_prompt, model, len(tokens))
+        return "".join(tokens)
+    
+    async def stream(self, messages: List[Dict[str, str]], system_prompt: str, model: str) -> AsyncIterator[str]:
+        """Respuesta en fragmentos al ritmo configurado"""
+        tokens = self.completion(messages, system_prompt, model)
+        await self._first_token()
+        
+        # Cada token se programa respecto al primero para no acumular deriva
+        start = time.monotonic()
+        for index, token in enumerate(tokens):
+            if self.tokens_per_second and index:
+                delay = start + index / self.tokens_per_second - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield token
+        
+        self._record_tokens(messages, system_prompt, model, len(tokens))
@@ -1,13 +1,29 @@
 """
 Modelos de base de datos
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index, LargeBinary, event, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, column_property, relationship
 from datetime import datetime
+import uuid
+from .compression import compress, content_hash, stored_content
+from .config import settings
 
 Base = declarative_base()
 
+# Longitud máxima del resumen del último mensaje guardado en la conversación
+MESSAGE_PREVIEW_LENGTH = 120
+
+
+def message_preview(content: str) -> str:
+    """Primeros caracteres de un mensaje, en una sola línea"""
+    preview = " ".join(content.split())
+    if len(preview) > MESSAGE_PREVIEW_LENGTH:
+        preview = preview[:MESSAGE_PREVIEW_LENGTH - 3] + "..."
+    return preview
+
 class User(Base):
     """Modelo de Usuario"""
     __tablename__ = "users"
@@ -36,14 +52,60 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Datos desnormalizados para listar conversaciones sin cargar sus mensajes
+    message_count = Column(Integer, default=0, nullable=False)
+    last_message_preview = Column(String, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    
+    # Archivo en frío (ver backend/archive.py): fichero con los mensajes si la
+    # conversación está archivada, y última restauración
+    archive_file = Column(String, nullable=True)
+    rehydrated_at = Column(DateTime, nullable=True)
+    
     # Relaciones
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     
+    @property
+    def archived(self) -> bool:
+        """Sus mensajes están en un fichero de archivo, no en la tabla messages"""
+        return self.archive_file is not None
+    
     def __repr__(self):
         return f"<Conversation {self.id}: {self.title}>"
 
 
+# Columnas de ConversationResponse para el listado (archived se calcula a partir de archive_file)
+CONVERSATION_RESPONSE_COLUMNS = (
+    Conversation.id,
+    Conversation.title,
+    Conversation.created_at,
+    Conversation.updated_at,
+    Conversation.message_count,
+    Conversation.last_message_preview,
+    Conversation.last_message_at,
+    Conversation.archive_file,
+)
+
+# Listado paginado de conversaciones de un usuario (más recientes primero)
+Index(
+    "ix_conversations_user_updated",
+    Conversation.user_id,
+    Conversation.updated_at.desc(),
+    Conversation.id.desc()
+)
+
+
+class MessageBlob(Base):
+    """Cuerpo grande de mensaje, comprimido y compartido por los mensajes con el mismo texto"""
+    __tablename__ = "message_blobs"
+    
+    hash = Column(String(64), primary_key=True)  # SHA-256 del texto en UTF-8
+    codec = Column(String(8), nullable=False)  # zlib, lzma, bz2 o raw
+    size = Column(Integer, nullable=False)  # Bytes del texto sin comprimir
+    data = Column(LargeBinary, nullable=False)  # Cabecera del codec + datos (ver compression.py)
+
+
 class Message(Base):
     """Modelo de Mensaje"""
     __tablename__ = "messages"
@@ -51,11 +113,195 @@ class Message(Base):
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # 'user' o 'assistant'
-    content = Column(Text, nullable=False)
+    # Texto en línea ("" si el cuerpo está en message_blobs); usar `content`
+    inline_content = Column("content", Text, nullable=False)
+    # Sin clave foránea: los triggers de SQLite borran el blob al quedar sin mensajes
+    blob_hash = Column(String(64), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Texto completo (descomprimido) tal y como se lee de la base de datos
+    _stored_content = column_property(stored_content(
+        select(MessageBlob.data).where(MessageBlob.hash == blob_hash).scalar_subquery(),
+        inline_content
+    ))
+    
     # Relaciones
     conversation = relationship("Conversation", back_populates="messages")
     
+    @hybrid_property
+    def content(self) -> str:
+        """Contenido del mensaje, esté en línea o en un blob"""
+        # El texto asignado en este proceso evita volver a leerlo tras el flush
+        if "_content" in self.__dict__:
+            return self.__dict__["_content"]
+        return self._stored_content
+    
+    @content.setter
+    def content(self, value: str):
+        self.__dict__["_content"] = value
+        self.inline_content = value
+        self.blob_hash = None
+    
+    @content.expression
+    def content(cls):
+        return cls._stored_content
+    
     def __repr__(self):
         return f"<Message {self.id} ({self.role})>"
+
+
+# Clave de session.info: mensajes movidos a blobs en el flush en curso y su texto
+_BLOB_MESSAGES = "blob_messages"
+
+
+@event.listens_for(Session, "before_flush")
+def _store_large_contents(session, flush_context, instances):
+    """
+    Mueve a message_blobs los cuerpos a partir de MESSAGE_BLOB_THRESHOLD bytes
+    
+    Un blob con el mismo hash ya guardado se reutiliza (INSERT OR IGNORE).
+    Solo en SQLite: en PostgreSQL el contenido va siempre en línea.
+    """
+    session.info.pop(_BLOB_MESSAGES, None)
+    threshold = settings.MESSAGE_BLOB_THRESHOLD
+    if not threshold:
+        return
+    
+    pending = [
+        message for message in (*session.new, *session.dirty)
+        if isinstance(message, Message) and message.blob_hash is None
+        and len(message.inline_content) * 4 >= threshold  # cota superior de bytes en UTF-8
+    ]
+    if not pending or session.get_bind().dialect.name != "sqlite":
+        return
+    
+    blobs, moved = {}, []
+    for message in pending:
+        data = message.inline_content.encode("utf-8")
+        if len(data) < threshold:
+            continue
+        digest = content_hash(data)
+        if digest not in blobs:
+            codec, stored = compress(data, settings.MESSAGE_COMPRESSION, settings.MESSAGE_COMPRESSION_LEVEL)
+            blobs[digest] = {"hash": digest, "codec": codec, "size": len(data), "data": stored}
+        moved.append((message, message.inline_content))
+        message.inline_content = ""
+        message.blob_hash = digest
+    
+    if blobs:
+        session.connection().execute(
+            sqlite_insert(MessageBlob.__table__).on_conflict_do_nothing(index_elements=["hash"]),
+            list(blobs.values())
+        )
+        session.info[_BLOB_MESSAGES] = moved
+
+
+@event.listens_for(Session, "after_flush")
+def _index_blob_messages(session, flush_context):
+    """Indexa para la búsqueda el texto de los mensajes que se acaban de guardar en blobs"""
+    moved = session.info.pop(_BLOB_MESSAGES, None)
+    if moved:
+        session.connection().execute(text(INDEX_MESSAGE_TEXT), [
+            {"id": message.id, "content": content, "conversation_id": message.conversation_id}
+            for message, content in moved
+        ])
+
+
+class DatabaseInstance(Base):
+    """
+    Identificador aleatorio de esta base de datos
+    
+    Se genera al crear el esquema; los índices guardados fuera de la base de
+    datos (ver vector_index.py) lo usan para saber si siguen siendo suyos.
+    """
+    __tablename__ = "database_instance"
+    
+    id = Column(String(32), primary_key=True)
+
+
+@event.listens_for(DatabaseInstance.__table__, "after_create")
+def _create_database_instance(target, connection, **kw):
+    connection.execute(target.insert().values(id=uuid.uuid4().hex))
+
+
+# Columnas de MessageResponse: los historiales se leen como filas, sin objetos del ORM
+MESSAGE_RESPONSE_COLUMNS = (Message.id, Message.conversation_id, Message.role, Message.content, Message.created_at)
+
+# Historial de una conversación en orden cronológico (y su paginación)
+Index("ix_messages_conversation_created", Message.conversation_id, Message.created_at, Message.id)
+
+
+# Búsqueda de texto completo sobre el contenido de los mensajes (ver backend/search.py).
+# SQLite: tabla FTS5 con su propia copia del texto, mantenida por triggers sin
+# funciones propias (cualquier conexión sqlite3 puede escribir en messages). La
+# columna owner ("u<user_id>") permite filtrar por usuario dentro del propio
+# índice. Los triggers indexan el texto en línea y borran por rowid; el texto de
+# los mensajes guardados en blobs lo indexa la aplicación (INDEX_MESSAGE_TEXT,
+# ver _index_blob_messages y message_store.compact). Los triggers de borrado y
+# actualización liberan además el blob que deja de usarse.
+# PostgreSQL: columna tsvector generada con índice GIN.
+INDEX_MESSAGE_TEXT = (
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT :id, :content, 'u' || user_id FROM conversations WHERE id = :conversation_id"
+)
+INDEX_NEW_INLINE = (
+    "INSERT INTO messages_fts (rowid, content, owner) "
+    "SELECT new.id, new.content, 'u' || user_id FROM conversations "
+    "WHERE id = new.conversation_id AND new.blob_hash IS NULL; "
+)
+RELEASE_OLD_BLOB = (
+    "DELETE FROM message_blobs WHERE hash = old.blob_hash "
+    "AND NOT EXISTS (SELECT 1 FROM messages WHERE blob_hash = old.blob_hash); "
+)
+
+MESSAGE_SEARCH_DDL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "content, owner, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+        f"{INDEX_NEW_INLINE}"
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+        "DELETE FROM messages_fts WHERE rowid = old.id; "
+        f"{RELEASE_OLD_BLOB}"
+        "END",
+        # Si el mensaje pasa a otro blob, la aplicación indexa el texto nuevo
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, blob_hash ON messages BEGIN "
+        "DELETE FROM messages_fts WHERE rowid = old.id "
+        "AND (new.blob_hash IS NULL OR new.blob_hash IS NOT old.blob_hash); "
+        f"{INDEX_NEW_INLINE}"
+        f"{RELEASE_OLD_BLOB}"
+        "END",
+    ],
+    "postgresql": [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_messages_content_tsv ON messages USING GIN (content_tsv)",
+    ],
+}
+
+MESSAGE_SEARCH_DROP = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS messages_fts_insert",
+        "DROP TRIGGER IF EXISTS messages_fts_delete",
+        "DROP TRIGGER IF EXISTS messages_fts_update",
+        "DROP TABLE IF EXISTS messages_fts",
+    ],
+    "postgresql": [
+        "DROP INDEX IF EXISTS ix_messages_content_tsv",
+        "ALTER TABLE messages DROP COLUMN IF EXISTS content_tsv",
+    ],
+}
+
+
+@event.listens_for(Message.__table__, "after_create")
+def _create_message_search(target, connection, **kw):
+    """create_all deja el mismo índice de búsqueda que las migraciones"""
+    for statement in MESSAGE_SEARCH_DDL.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Message.__table__, "before_drop")
+def _drop_message_search(target, connection, **kw):
+    for statement in MESSAGE_SEARCH_DROP.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
@@ -0,0 +1,89 @@
+"""
+Paginación por cursor (keyset)
+
+El cursor codifica la clave de ordenación (timestamp, id) del último
+elemento devuelto; la página siguiente empieza justo después de esa clave,
+así el coste de cada página no depende de lo lejos que se haya navegado.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import List, Optional, Tuple
+import json
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+
+
+def encode_cursor(timestamp: datetime, item_id: int) -> str:
+    """Codifica la clave (timestamp, id) como cursor opaco"""
+    raw = json.dumps([timestamp.isoformat(), item_id]).encode("utf-8")
+    return urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodifica un cursor; responde 400 si no es válido"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, item_id = json.loads(urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
+
+class PageParams:
+    """Dependency con los parámetros de paginación de la petición"""
+    
+    def __init__(
+        self,
+        limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+        cursor: Optional[str] = Query(None, description="Cursor devuelto por la página anterior")
+    ):
+        self.limit = limit
+        self.cursor = decode_cursor(cursor) if cursor else None
+
+
+async def fetch_page(
+    db: AsyncSession,
+    stmt: Select,
+    timestamp_column,
+    id_column,
+    page: PageParams,
+    scalars: bool = True
+) -> Tuple[List, Optional[str]]:
+    """
+    Ejecuta una consulta paginada de más reciente a más antiguo
+    
+    Args:
+        db: Sesión de base de datos
+        stmt: SELECT con los filtros de la página (sin ORDER BY ni LIMIT)
+        timestamp_column: Columna temporal de la clave (updated_at, created_at...)
+        id_column: Columna id que desempata filas con el mismo timestamp
+        page: Parámetros de paginación
+        scalars: True si stmt selecciona una entidad del ORM; False para
+            devolver filas de columnas (deben incluir las de la clave)
+    
+    Returns:
+        Tuple: (filas de la página en orden descendente, cursor siguiente o None)
+    """
+    if page.cursor:
+        stmt = stmt.where(tuple_(timestamp_column, id_column) < tuple_(*page.cursor))
+    
+    stmt = stmt.order_by(timestamp_column.desc(), id_column.desc()).limit(page.limit + 1)
+    result = await db.execute(stmt)
+    rows = list(result.scalars() if scalars else result)
+    
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, timestamp_column.key),
+            getattr(last, id_column.key)
+        )
+    
+    return rows, next_cursor
@@ -0,0 +1,335 @@
+"""
+Límites de uso por usuario en los endpoints de chat
+
+Dos límites independientes por usuario autenticado:
+- Ritmo: token bucket (RATE_LIMIT_PER_MINUTE sostenido, ráfagas de RATE_LIMIT_BURST)
+- Concurrencia: como mucho RATE_LIMIT_MAX_IN_FLIGHT peticiones de chat a la vez
+
+El backend "memory" guarda el estado en el proceso. Con varios workers se usa
+el backend "shared" sobre un almacén compartido (SharedStore): basta con
+implementar sus tres operaciones atómicas (p. ej. con Redis). LocalSharedStore
+es una implementación en memoria para desarrollo y tests.
+"""
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import math
+import time
+
+from fastapi import Depends, HTTPException, status
+
+from .auth import get_current_user
+from .cache import LRUCache
+from .config import settings
+from .models import User
+
+
+class RateLimitExceeded(Exception):
+    """El usuario superó uno de sus límites"""
+    
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+# ===== BACKENDS =====
+
+class RateLimitBackend(ABC):
+    """Estado de los límites (buckets y peticiones en curso) por clave"""
+    
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Consume un token del bucket de `key`
+        
+        Returns:
+            float: 0 si se permitió; si no, segundos hasta el siguiente token
+        """
+    
+    @abstractmethod
+    async def acquire(self, key: str, limit: int) -> bool:
+        """Ocupa un hueco de concurrencia de `key` (False si ya hay `limit`)"""
+    
+    @abstractmethod
+    async def release(self, key: str):
+        """Libera un hueco ocupado con acquire"""
+    
+    async def clear(self):
+        """Olvida todo el estado (tests)"""
+
+
+class InMemoryBackend(RateLimitBackend):
+    """Estado en el propio proceso (un único worker)"""
+    
+    def __init__(self, max_keys: int = 100000):
+        # (tokens disponibles, instante de la última actualización) por clave;
+        # expulsar un bucket equivale a devolverle todos sus tokens
+        self._buckets = LRUCache(max_keys)
+        self._in_flight: Dict[str, int] = {}
+    
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        
+        if tokens >= 1:
+            self._buckets.set(key, (tokens - 1, now))
+            return 0.0
+        
+        self._buckets.set(key, (tokens, now))
+        return (1 - tokens) / rate
+    
+    async def acquire(self, key: str, limit: int) -> bool:
+        current = self._in_flight.get(key, 0)
+        if current >= limit:
+            return False
+        self._in_flight[key] = current + 1
+        return True
+    
+    async def release(self, key: str):
+        current = self._in_flight.get(key, 0)
+        if current <= 1:
+            self._in_flight.pop(key, None)
+        else:
+            self._in_flight[key] = current - 1
+    
+    async def clear(self):
+        self._buckets.clear()
+        self._in_flight.clear()
+
+
+class SharedStore(ABC):
+    """
+    Almacén clave-valor compartido entre workers
+    
+    Las operaciones deben ser atómicas en el almacén (en Redis: GET, un
+    script Lua o WATCH/MULTI para compare_and_set, e INCRBY + EXPIRE).
+    """
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[float]:
+        """Valor actual de la clave (None si no existe o caducó)"""
+    
+    @abstractmethod
+    async def compare_and_set(self, key: str, expected: Optional[float], value: float, ttl: float) -> bool:
+        """Guarda `value` solo si el valor actual sigue siendo `expected`"""
+    
+    @abstractmethod
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        """Suma `amount` al contador (renovando su caducidad) y devuelve el resultado"""
+
+
+class LocalSharedStore(SharedStore):
+    """SharedStore en memoria: sustituto local de un almacén real"""
+    
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, float]] = {}
+        self._lock = asyncio.Lock()
+    
+    def _current(self, key: str) -> Optional[float]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item[0]
+    
+    async def get(self, key: str) -> Optional[float]:
+        return self._current(key)
+    
+    async def compare_and_set(self, key: str, expected: Optional[float], value: float, ttl: float) -> bool:
+        async with self._lock:
+            if self._current(key) != expected:
+                return False
+            self._data[key] = (value, time.time() + ttl)
+            return True
+    
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        async with self._lock:
+            value = int(self._current(key) or 0) + amount
+            self._data[key] = (value, time.time() + ttl)
+            return value
+    
+    def clear(self):
+        self._data.clear()
+
+
+class SharedStoreBackend(RateLimitBackend):
+    """
+    Límites compartidos entre workers a través de un SharedStore
+    
+    El bucket se guarda como un único número (GCRA: instante teórico en que
+    el bucket vuelve a estar lleno), que se actualiza con compare_and_set.
+    """
+    
+    def __init__(self, store: SharedStore, prefix: str = "ratelimit", slot_ttl: float = 120.0, retries: int = 10):
+        self.store = store
+        self.prefix = prefix
+        # Caducidad del contador de concurrencia si un worker muere sin liberar
+        self.slot_ttl = slot_ttl
+        self.retries = retries
+    
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        bucket_key = f"{self.prefix}:bucket:{key}"
+        interval = 1 / rate
+        
+        for _ in range(self.retries):
+            now = time.time()
+            stored = await self.store.get(bucket_key)
+            full_at = max(stored or now, now) + interval
+            allowed_at = full_at - burst * interval
+            
+            if allowed_at > now:
+                return allowed_at - now
+            
+            if await self.store.compare_and_set(bucket_key, stored, full_at, ttl=burst * interval):
+                return 0.0
+        
+        # Mucha contención en la misma clave: rechazar en lugar de reintentar sin fin
+        return interval
+    
+    async def acquire(self, key: str, limit: int) -> bool:
+        slot_key = f"{self.prefix}:inflight:{key}"
+        if await self.store.incr(slot_key, 1, self.slot_ttl) > limit:
+            await self.store.incr(slot_key, -1, self.slot_ttl)
+            return False
+        return True
+    
+    async def release(self, key: str):
+        await self.store.incr(f"{self.prefix}:inflight:{key}", -1, self.slot_ttl)
+    
+    async def clear(self):
+        if isinstance(self.store, LocalSharedStore):
+            self.store.clear()
+
+
+# ===== LIMITADOR =====
+
+class RateLimiter:
+    """Aplica el límite de ritmo y el de concurrencia a una clave"""
+    
+    def __init__(self, backend: RateLimitBackend, per_minute: float, burst: int, max_in_flight: int):
+        self.backend = backend
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.rejected = 0
+    
+    async def acquire(self, key: str):
+        """
+        Ocupa un hueco de concurrencia y consume un token
+        
+        El hueco se comprueba primero: un rechazo por concurrencia no gasta
+        tokens, y si no quedan tokens el hueco se libera.
+        
+        Raises:
+            RateLimitExceeded: Si no quedan huecos libres o tokens
+        """
+        if not await self.backend.acquire(key, self.max_in_flight):
+            self.rejected += 1
+            raise RateLimitExceeded("Ya tienes demasiadas respuestas en curso", 1.0)
+        
+        wait = await self.backend.take(key, self.rate, self.burst)
+        if wait > 0:
+            await self.backend.release(key)
+            self.rejected += 1
+            raise RateLimitExceeded("Demasiados mensajes, espera un momento", wait)
+    
+    async def release(self, key: str):
+        """Libera el hueco de concurrencia"""
+        await self.backend.release(key)
+    
+    async def clear(self):
+        await self.backend.clear()
+
+
+def _create_backend() -> RateLimitBackend:
+    """Backend configurado en RATE_LIMIT_BACKEND"""
+    if settings.RATE_LIMIT_BACKEND == "memory":
+        return InMemoryBackend()
+    elif settings.RATE_LIMIT_BACKEND == "shared":
+        # Sustituir por un SharedStore real (p. ej. Redis) con varios workers
+        return SharedStoreBackend(LocalSharedStore())
+    else:
+        raise ValueError(f"Backend de rate limiting no soportado: {settings.RATE_LIMIT_BACKEND}")
+
+
+# Instancia global del limitador de chat
+rate_limiter = RateLimiter(
+    _create_backend(),
+    per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    burst=settings.RATE_LIMIT_BURST,
+    max_in_flight=settings.RATE_LIMIT_MAX_IN_FLIGHT
+)
+
+
+class ChatSlot:
+    """
+    Hueco de concurrencia ocupado por una petición de chat
+    
+    La dependencia lo libera al terminar la respuesta, salvo que la ruta lo
+    pase a un trabajo en segundo plano con detach(): entonces lo libera el
+    trabajo al terminar (release() es idempotente).
+    """
+    
+    def __init__(self, user: User, key: Optional[str]):
+        self.user = user
+        self._key = key
+        self.detached = False
+    
+    def detach(self) -> "ChatSlot":
+        self.detached = True
+        return self
+    
+    async def release(self):
+        key, self._key = self._key, None
+        if key is not None:
+            await rate_limiter.release(key)
+
+
+async def _acquire_slot(user: User) -> ChatSlot:
+    """Aplica los límites del usuario (HTTP 429 si se supera alguno)"""
+    if not settings.RATE_LIMIT_ENABLED:
+        return ChatSlot(user, None)
+    
+    key = f"user:{user.id}"
+    try:
+        await rate_limiter.acquire(key)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.detail,
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+    return ChatSlot(user, key)
+
+
+async def chat_rate_limit(current_user: User = Depends(get_current_user)) -> AsyncIterator[User]:
+    """
+    Dependency de los endpoints de chat: aplica los límites del usuario
+    
+    El hueco de concurrencia se libera al terminar la respuesta (también
+    en streaming, cuando se cierra el stream).
+    """
+    slot = await _acquire_slot(current_user)
+    try:
+        yield current_user
+    finally:
+        await slot.release()
+
+
+async def chat_job_rate_limit(current_user: User = Depends(get_current_user)) -> AsyncIterator[ChatSlot]:
+    """
+    Como chat_rate_limit, pero el hueco puede pasar al trabajo encolado
+    
+    Así los trabajos pendientes cuentan para RATE_LIMIT_MAX_IN_FLIGHT: un
+    usuario no puede encolar generaciones sin límite.
+    """
+    slot = await _acquire_slot(current_user)
+    try:
+        yield slot
+    finally:
+        if not slot.detached:
+            await slot.release()
@@ -0,0 +1,90 @@
+"""
+Serialización rápida de respuestas
+
+- ORJSONResponse es la clase de respuesta por defecto de la app (main.py):
+  orjson serializa directamente datetimes y es varias veces más rápido que
+  json.dumps.
+- negotiate(): para los historiales y listados largos, las rutas leen solo
+  las columnas necesarias (sin crear objetos del ORM ni modelos de pydantic)
+  y devuelven los dicts directamente, en JSON o en MessagePack si el cliente
+  lo prefiere en la cabecera Accept (`Accept: application/msgpack`). Ambos
+  formatos tienen la misma estructura; las fechas van como texto ISO 8601.
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+import msgpack
+from fastapi import Request
+from fastapi.responses import ORJSONResponse
+from starlette.responses import Response
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Tipos MIME de MessagePack aceptados en la cabecera Accept
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _msgpack_default(value: Any) -> Any:
+    """Tipos que MessagePack no tiene, como en el JSON de la API"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable en MessagePack: {type(value).__name__}")
+
+
+class MsgPackResponse(Response):
+    """Respuesta en MessagePack"""
+    media_type = MSGPACK_MEDIA_TYPE
+    
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+def _media_ranges(accept: str) -> Dict[str, float]:
+    """Rangos de la cabecera Accept con su q (1 si no se indica)"""
+    ranges: Dict[str, float] = {}
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.lower()
+        ranges[media_type] = max(quality, ranges.get(media_type, 0.0))
+    return ranges
+
+
+def _quality(ranges: Dict[str, float], media_types: Tuple[str, ...]) -> float:
+    """q del rango más específico que cubre alguno de los tipos (0 si ninguno)"""
+    exact = [ranges[media_type] for media_type in media_types if media_type in ranges]
+    if exact:
+        return max(exact)
+    for wildcard in ("application/*", "*/*"):
+        if wildcard in ranges:
+            return ranges[wildcard]
+    return 0.0
+
+
+def wants_msgpack(request: Request) -> bool:
+    """
+    El cliente prefiere MessagePack a JSON en la cabecera Accept
+    
+    Solo si su q es mayor que la de JSON: con empate (p. ej. */*) se
+    responde en JSON, y q=0 significa que no lo acepta.
+    """
+    ranges = _media_ranges(request.headers.get("accept", ""))
+    msgpack_quality = _quality(ranges, MSGPACK_MEDIA_TYPES)
+    return msgpack_quality > 0 and msgpack_quality > _quality(ranges, (JSON_MEDIA_TYPE,))
+
+
+def negotiate(request: Request, content: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSON (orjson) o MessagePack según la cabecera Accept"""
+    headers = {**(headers or {}), "Vary": "Accept"}
+    if wants_msgpack(request):
+        return MsgPackResponse(content, headers=headers)
+    return ORJSONResponse(content, headers=headers)
@@ -2,14 +2,15 @@
 Rutas de autenticación
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from ..database import get_db
 from ..models import User
 from ..schemas import UserCreate, UserLogin, UserResponse, Token
 from ..auth import (
-    get_password_hash,
+    get_password_hash_pooled,
     authenticate_user,
     create_access_token,
     get_current_user
@@ -20,12 +21,12 @@ router = APIRouter(prefix="/auth", tags=["Autenticación"])
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Registra un nuevo usuario
     """
     # Verificar si el email ya existe
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -33,7 +34,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Verificar si el username ya existe
-    existing_username = db.query(User).filter(User.username == user_data.username).first()
+    existing_username = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -44,23 +45,22 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     new_user = User(
         email=user_data.email,
         username=user_data.username,
-        hashed_password=get_password_hash(user_data.password)
+        hashed_password=await get_password_hash_pooled(user_data.password)
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     return new_user
 
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Inicia sesión y devuelve un token JWT
     """
     # Autenticar usuario
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.email, user_credentials.password)
     
     if not user:
         raise HTTPException(
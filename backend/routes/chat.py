@@ -1,123 +1,528 @@
 """
 Rutas de chat (mensajes con IA)
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import Optional, Tuple
+import anyio
+import json
 
-from ..database import get_db
-from ..models import User, Conversation, Message
-from ..schemas import ChatRequest, ChatResponse, MessageResponse
+from ..archive import conversation_archive
+from ..config import settings
+from ..database import get_db, get_read_db, AsyncSessionLocal
+from ..models import MESSAGE_RESPONSE_COLUMNS, User, Conversation, Message, message_preview
+from ..schemas import ChatRequest, ChatResponse, JobResponse, MessageResponse
 from ..auth import get_current_user
 from ..ai_service import ai_service
+from ..context_manager import ContextWindow, context_manager
+from ..group_commit import commit_unit
+from ..history_cache import ChatHistory, history_cache
+from ..jobs import Job, JobQueueFullError, job_queue
+from ..pagination import PageParams, fetch_page
+from ..rate_limit import ChatSlot, chat_job_rate_limit, chat_rate_limit
+from ..responses import negotiate
+from ..vector_index import notify_new_messages, retrieve_context
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+async def _get_conversation(db: AsyncSession, current_user: User, conversation_id: int) -> Conversation:
+    """Obtiene una conversación del usuario (404 si no existe), restaurada si estaba archivada"""
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
+    
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversación no encontrada"
+        )
+    
+    await conversation_archive.restore(conversation)
+    return conversation
+
+
+async def _get_or_create_conversation(
+    db: AsyncSession,
+    current_user: User,
+    chat_request: ChatRequest
+) -> Conversation:
+    """
+    Obtiene la conversación indicada o crea una nueva
+    
+    La conversación nueva solo se envía a la base de datos (flush): se
+    confirma junto con el primer mensaje.
+    """
+    if chat_request.conversation_id:
+        return await _get_conversation(db, current_user, chat_request.conversation_id)
+    
+    # Crear nueva conversación
+    conversation = Conversation(
+        title=ai_service.generate_conversation_title(chat_request.message),
+        user_id=current_user.id
+    )
+    db.add(conversation)
+    await db.flush()
+    
+    # Conversación nueva: su historial en caché empieza vacío
+    history_cache.load(conversation.id, [], version=conversation.updated_at)
+    
+    return conversation
+
+
+async def _get_messages_for_ai(
+    db: AsyncSession,
+    conversation_id: int,
+    version: Optional[datetime]
+) -> ChatHistory:
+    """
+    Obtiene el historial de la conversación en formato para la IA
+    
+    Usa la caché de historiales; solo consulta la base de datos si la
+    conversación no está en caché o si su updated_at no coincide.
+    """
+    history = history_cache.get(conversation_id, version=version)
+    if history is not None:
+        return history
+    
+    messages_history = await db.execute(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+    )
+    
+    return history_cache.load(
+        conversation_id,
+        ({"role": msg.role, "content": msg.content} for msg in messages_history),
+        version=version
+    )
+
+
+def _record_turn(conversation_id: int, ai_response: str, updated_at: datetime):
+    """
+    UPDATE de la conversación tras guardar un turno completo
+    
+    Suma los dos mensajes del turno (usuario + asistente) de forma atómica en
+    la base de datos y guarda el resumen y la hora del último mensaje.
+    """
+    return (
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            message_count=Conversation.message_count + 2,
+            last_message_preview=message_preview(ai_response),
+            last_message_at=updated_at,
+            updated_at=updated_at
+        )
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Serializa un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _save_user_message(db: AsyncSession, conversation_id: int, content: str) -> Message:
+    """Guarda el mensaje del usuario y lo añade al historial en caché"""
+    user_message = Message(
+        conversation_id=conversation_id,
+        role="user",
+        content=content
+    )
+    db.add(user_message)
+    await db.commit()
+    history_cache.append(conversation_id, "user", content)
+    return user_message
+
+
+async def _generate_reply(
+    db: AsyncSession,
+    conversation_id: int,
+    version: Optional[datetime],
+    user_message_id: int
+) -> Tuple[Message, ContextWindow]:
+    """
+    Genera y guarda la respuesta del asistente a un mensaje ya guardado
+    
+    Si la IA falla, elimina el mensaje del usuario y relanza la excepción.
+    """
+    # Obtener historial de mensajes y ajustarlo al presupuesto de contexto
+    messages_for_ai = await _get_messages_for_ai(db, conversation_id, version)
+    context = await context_manager.build(conversation_id, messages_for_ai)
+    
+    # No retener la conexión mientras responde la IA (la sesión se reabre al escribir)
+    await db.close()
+    
+    try:
+        ai_response = await ai_service.generate_response(
+            context.messages,
+            context=context.system_context
+        )
+    except Exception:
+        await db.execute(delete(Message).where(Message.id == user_message_id))
+        await db.commit()
+        history_cache.invalidate(conversation_id)
+        raise
+    
+    # Guardar respuesta del asistente
+    assistant_message = Message(
+        conversation_id=conversation_id,
+        role="assistant",
+        content=ai_response
+    )
+    db.add(assistant_message)
+    
+    # Actualizar timestamp y datos desnormalizados de la conversación
+    updated_at = datetime.utcnow()
+    await db.execute(_record_turn(conversation_id, ai_response, updated_at))
+    
+    await db.commit()
+    history_cache.append(conversation_id, "assistant", ai_response)
+    history_cache.set_version(conversation_id, updated_at)
+    
+    return assistant_message, context
+
+
 @router.post("/", response_model=ChatResponse)
 async def send_message(
     chat_request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(chat_rate_limit),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Envía un mensaje al chatbot y recibe una respuesta
     
     Si se proporciona conversation_id, añade el mensaje a esa conversación.
     Si no, crea una nueva conversación.
+    
+    Nada se escribe hasta tener la respuesta de la IA: el turno completo
+    (conversación nueva, ambos mensajes y contadores) se guarda en una
+    sola transacción, así que un fallo de la IA no deja nada que deshacer.
     """
+    user_entry = {"role": "user", "content": chat_request.message}
+    sent_at = datetime.utcnow()
     
-    # 1. Obtener o crear conversación
+    # 1. Conversación existente e historial para la IA con el mensaje nuevo
     if chat_request.conversation_id:
-        conversation = db.query(Conversation).filter(
-            Conversation.id == chat_request.conversation_id,
-            Conversation.user_id == current_user.id
-        ).first()
-        
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversación no encontrada"
-            )
-    else:
-        # Crear nueva conversación
-        title = ai_service.generate_conversation_title(chat_request.message)
-        conversation = Conversation(
-            title=title,
-            user_id=current_user.id
+        conversation = await _get_conversation(db, current_user, chat_request.conversation_id)
+        conversation_id = conversation.id
+        history = await _get_messages_for_ai(db, conversation_id, conversation.updated_at)
+        messages_for_ai = (
+            history_cache.append(conversation_id, "user", chat_request.message)
+            or ChatHistory.from_messages([*history, user_entry])
         )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+    else:
+        conversation_id = None
+        messages_for_ai = ChatHistory.from_messages([user_entry])
     
-    # 2. Guardar mensaje del usuario
-    user_message = Message(
-        conversation_id=conversation.id,
-        role="user",
-        content=chat_request.message
-    )
-    db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
+    context = await context_manager.build(conversation_id, messages_for_ai)
     
-    # 3. Obtener historial de mensajes para contexto
-    messages_history = db.query(Message).filter(
-        Message.conversation_id == conversation.id
-    ).order_by(Message.created_at.asc()).all()
+    # Fragmentos parecidos de otras conversaciones del usuario
+    retrieved = await retrieve_context(db, current_user.id, chat_request.message, conversation_id)
+    system_context = "\n\n".join(part for part in (context.system_context, retrieved) if part) or None
     
-    # Convertir a formato para la IA
-    messages_for_ai = [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages_history
-    ]
+    # No retener la conexión de la base de datos mientras responde la IA
+    await db.close()
     
-    # 4. Generar respuesta de la IA
+    # 2. Generar respuesta de la IA
     try:
-        ai_response = await ai_service.generate_response(messages_for_ai)
+        ai_response = await ai_service.generate_response(
+            context.messages,
+            context=system_context
+        )
     except Exception as e:
-        # Si falla la IA, eliminar el mensaje del usuario y lanzar error
-        db.delete(user_message)
-        db.commit()
+        if conversation_id is not None:
+            history_cache.invalidate(conversation_id)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Error al generar respuesta: {str(e)}"
         )
     
-    # 5. Guardar respuesta del asistente
-    assistant_message = Message(
-        conversation_id=conversation.id,
-        role="assistant",
-        content=ai_response
-    )
-    db.add(assistant_message)
+    # 3. Guardar el turno completo en una transacción
+    updated_at = datetime.utcnow()
     
-    # 6. Actualizar timestamp de la conversación
-    conversation.updated_at = datetime.utcnow()
+    async def write_turn(session: AsyncSession) -> Tuple[int, Message, Message]:
+        turn_conversation_id = conversation_id
+        if turn_conversation_id is None:
+            new_conversation = Conversation(
+                title=ai_service.generate_conversation_title(chat_request.message),
+                user_id=current_user.id,
+                created_at=sent_at
+            )
+            session.add(new_conversation)
+            await session.flush()
+            turn_conversation_id = new_conversation.id
+        
+        user_message = Message(
+            conversation_id=turn_conversation_id,
+            role="user",
+            content=chat_request.message,
+            created_at=sent_at
+        )
+        assistant_message = Message(
+            conversation_id=turn_conversation_id,
+            role="assistant",
+            content=ai_response,
+            created_at=updated_at
+        )
+        session.add_all([user_message, assistant_message])
+        await session.execute(_record_turn(turn_conversation_id, ai_response, updated_at))
+        return turn_conversation_id, user_message, assistant_message
+    
+    try:
+        conversation_id, user_message, assistant_message = await commit_unit(db, write_turn)
+    except Exception:
+        if chat_request.conversation_id:
+            history_cache.invalidate(chat_request.conversation_id)
+        raise
     
-    db.commit()
-    db.refresh(assistant_message)
+    # 4. Actualizar la caché de historiales e indexar el turno en segundo plano
+    notify_new_messages()
+    if chat_request.conversation_id:
+        history_cache.append(conversation_id, "assistant", ai_response)
+        history_cache.set_version(conversation_id, updated_at)
+    else:
+        history_cache.load(
+            conversation_id,
+            [user_entry, {"role": "assistant", "content": ai_response}],
+            version=updated_at
+        )
     
-    # 7. Retornar respuesta
+    # 5. Retornar respuesta
     return ChatResponse(
-        conversation_id=conversation.id,
+        conversation_id=conversation_id,
         user_message=MessageResponse.from_orm(user_message),
-        assistant_message=MessageResponse.from_orm(assistant_message)
+        assistant_message=MessageResponse.from_orm(assistant_message),
+        tokens_saved=context.tokens_saved
+    )
+
+
+def _job_response(job: Job) -> JobResponse:
+    """Convierte un trabajo de la cola en su respuesta"""
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        conversation_id=job.data["conversation_id"],
+        user_message=job.data["user_message"],
+        result=job.result,
+        error=job.error
+    )
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_chat_job(
+    chat_request: ChatRequest,
+    slot: ChatSlot = Depends(chat_job_rate_limit),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Envía un mensaje y genera la respuesta en segundo plano
+    
+    Devuelve enseguida el ID del trabajo; el resultado se obtiene con
+    GET /api/chat/jobs/{job_id} (con ?wait=segundos para long-poll). El
+    trabajo ocupa el hueco de concurrencia del usuario hasta que termina.
+    """
+    current_user = slot.user
+    conversation = await _get_or_create_conversation(db, current_user, chat_request)
+    conversation_id = conversation.id
+    version = conversation.updated_at
+    
+    user_message = await _save_user_message(db, conversation_id, chat_request.message)
+    user_message_data = MessageResponse.from_orm(user_message)
+    
+    async def run() -> dict:
+        # El worker usa su propia sesión: la de la petición ya estará cerrada
+        try:
+            async with AsyncSessionLocal() as job_db:
+                assistant_message, context = await _generate_reply(
+                    job_db, conversation_id, version, user_message_data.id
+                )
+        finally:
+            await slot.release()
+        return ChatResponse(
+            conversation_id=conversation_id,
+            user_message=user_message_data,
+            assistant_message=MessageResponse.from_orm(assistant_message),
+            tokens_saved=context.tokens_saved
+        ).model_dump()
+    
+    try:
+        job = job_queue.submit(
+            current_user.id,
+            run,
+            conversation_id=conversation_id,
+            user_message=user_message_data
+        )
+        slot.detach()
+    except JobQueueFullError:
+        await db.execute(delete(Message).where(Message.id == user_message.id))
+        await db.commit()
+        history_cache.invalidate(conversation_id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+            headers={"Retry-After": "1"}
+        )
+    
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_chat_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=settings.JOB_MAX_WAIT, description="Segundos de long-poll"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Obtiene el estado de un trabajo de generación
+    
+    Con wait > 0 la petición espera hasta ese tiempo a que el trabajo termine.
+    """
+    job = job_queue.get(job_id)
+    
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo no encontrado"
+        )
+    
+    await job.wait(wait)
+    return _job_response(job)
+
+
+@router.post("/stream")
+async def send_message_stream(
+    chat_request: ChatRequest,
+    current_user: User = Depends(chat_rate_limit),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Envía un mensaje al chatbot y recibe la respuesta en streaming (SSE)
+    
+    Eventos emitidos:
+    - start: conversación y mensaje del usuario guardado
+    - delta: fragmento de texto generado por la IA
+    - done: mensaje del asistente ya guardado
+    - error: la IA falló (el mensaje del usuario se elimina)
+    """
+    
+    # Las validaciones (404, etc.) se resuelven antes de abrir el stream
+    conversation = await _get_or_create_conversation(db, current_user, chat_request)
+    conversation_id = conversation.id
+    version = conversation.updated_at
+    
+    user_message = await _save_user_message(db, conversation_id, chat_request.message)
+    
+    user_message_data = MessageResponse.from_orm(user_message).model_dump(mode="json")
+    messages_for_ai = await _get_messages_for_ai(db, conversation_id, version)
+    context = await context_manager.build(conversation_id, messages_for_ai)
+    
+    # La dependencia cierra la sesión cuando termina el stream: no retener la
+    # conexión (ni una transacción de lectura abierta) mientras genera la IA
+    await db.close()
+    
+    async def discard_user_message():
+        """Elimina el mensaje del usuario de un turno sin respuesta"""
+        async with AsyncSessionLocal() as stream_db:
+            await stream_db.execute(
+                delete(Message).where(Message.id == user_message_data["id"])
+            )
+            await stream_db.commit()
+        history_cache.invalidate(conversation_id)
+    
+    async def event_stream():
+        finished = False
+        try:
+            yield _sse_event("start", {
+                "conversation_id": conversation_id,
+                "user_message": user_message_data,
+                "tokens_saved": context.tokens_saved
+            })
+            
+            parts = []
+            try:
+                async for delta in ai_service.stream_response(
+                    context.messages,
+                    context=context.system_context
+                ):
+                    parts.append(delta)
+                    yield _sse_event("delta", {"content": delta})
+            except Exception as e:
+                # Si falla la IA, eliminar el mensaje del usuario y notificar
+                await discard_user_message()
+                finished = True
+                yield _sse_event("error", {"detail": f"Error al generar respuesta: {str(e)}"})
+                return
+            
+            ai_response = "".join(parts)
+            updated_at = datetime.utcnow()
+            
+            async with AsyncSessionLocal() as stream_db:
+                assistant_message = Message(
+                    conversation_id=conversation_id,
+                    role="assistant",
+                    content=ai_response
+                )
+                stream_db.add(assistant_message)
+                await stream_db.execute(_record_turn(conversation_id, ai_response, updated_at))
+                await stream_db.commit()
+                
+                assistant_message_data = MessageResponse.from_orm(assistant_message).model_dump(mode="json")
+            finished = True
+            
+            history_cache.append(conversation_id, "assistant", ai_response)
+            history_cache.set_version(conversation_id, updated_at)
+            
+            yield _sse_event("done", {
+                "conversation_id": conversation_id,
+                "assistant_message": assistant_message_data
+            })
+        finally:
+            if not finished:
+                # El cliente se desconectó (GeneratorExit/CancelledError) antes
+                # de guardar la respuesta: no dejar un turno sin contestar. El
+                # ámbito protegido deja terminar el DELETE aunque la tarea
+                # esté cancelada.
+                with anyio.CancelScope(shield=True):
+                    await discard_user_message()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
     )
 
 
 @router.get("/history/{conversation_id}")
 async def get_chat_history(
     conversation_id: int,
+    request: Request,
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Obtiene el historial completo de mensajes de una conversación
+    Obtiene el historial de mensajes de una conversación
+    
+    Devuelve los mensajes más recientes en orden cronológico; para cargar
+    los anteriores, repetir la petición con cursor=next_cursor. JSON o
+    MessagePack (Accept: application/msgpack).
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
     
     if not conversation:
         raise HTTPException(
@@ -125,12 +530,21 @@ async def get_chat_history(
             detail="Conversación no encontrada"
         )
     
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
+    await conversation_archive.restore(conversation)
+    
+    # Filas de columnas (MessageResponse) serializadas directamente
+    messages, next_cursor = await fetch_page(
+        db,
+        select(*MESSAGE_RESPONSE_COLUMNS).where(Message.conversation_id == conversation_id),
+        Message.created_at,
+        Message.id,
+        page,
+        scalars=False
+    )
     
-    return {
+    return negotiate(request, {
         "conversation_id": conversation_id,
         "title": conversation.title,
-        "messages": [MessageResponse.from_orm(msg) for msg in messages]
-    }
+        "messages": [row._asdict() for row in reversed(messages)],
+        "next_cursor": next_cursor
+    })
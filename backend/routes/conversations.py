@@ -1,18 +1,24 @@
 """
 Rutas de conversaciones
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from ..database import get_db
-from ..models import User, Conversation, Message
+from ..archive import conversation_archive
+from ..database import get_db, get_read_db
+from ..models import CONVERSATION_RESPONSE_COLUMNS, MESSAGE_RESPONSE_COLUMNS, User, Conversation, Message
+from ..responses import negotiate
 from ..schemas import (
     ConversationCreate,
     ConversationResponse,
     ConversationWithMessages
 )
 from ..auth import get_current_user
+from ..pagination import PageParams, fetch_page
+from ..context_manager import context_manager
+from ..history_cache import history_cache
 
 router = APIRouter(prefix="/conversations", tags=["Conversaciones"])
 
@@ -21,7 +27,7 @@ router = APIRouter(prefix="/conversations", tags=["Conversaciones"])
 async def create_conversation(
     conversation_data: ConversationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Crea una nueva conversación
@@ -32,51 +38,66 @@ async def create_conversation(
     )
     
     db.add(new_conversation)
-    db.commit()
-    db.refresh(new_conversation)
+    await db.commit()
     
-    # Añadir contador de mensajes
-    response = ConversationResponse.from_orm(new_conversation)
-    response.message_count = 0
-    
-    return response
+    return ConversationResponse.from_orm(new_conversation)
 
 
 @router.get("/", response_model=List[ConversationResponse])
 async def get_conversations(
+    request: Request,
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Obtiene todas las conversaciones del usuario actual
+    Obtiene las conversaciones del usuario actual, de más reciente a más antigua
+    
+    Paginado por cursor (updated_at, id): si hay más conversaciones, la
+    cabecera X-Next-Cursor trae el cursor de la página siguiente. JSON o
+    MessagePack (Accept: application/msgpack).
     """
-    conversations = db.query(Conversation).filter(
-        Conversation.user_id == current_user.id
-    ).order_by(Conversation.updated_at.desc()).all()
-    
-    # Añadir contador de mensajes a cada conversación
-    result = []
-    for conv in conversations:
-        conv_response = ConversationResponse.from_orm(conv)
-        conv_response.message_count = len(conv.messages)
-        result.append(conv_response)
-    
-    return result
+    # message_count y el último mensaje están desnormalizados en la conversación:
+    # una sola consulta, sin cargar mensajes ni crear objetos del ORM
+    rows, next_cursor = await fetch_page(
+        db,
+        select(*CONVERSATION_RESPONSE_COLUMNS).where(Conversation.user_id == current_user.id),
+        Conversation.updated_at,
+        Conversation.id,
+        page,
+        scalars=False
+    )
+    
+    conversations = []
+    for row in rows:
+        conversation = row._asdict()
+        conversation["archived"] = conversation.pop("archive_file") is not None
+        conversations.append(conversation)
+    
+    return negotiate(request, conversations, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
 
 
 @router.get("/{conversation_id}", response_model=ConversationWithMessages)
 async def get_conversation(
     conversation_id: int,
+    request: Request,
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Obtiene una conversación específica con todos sus mensajes
+    Obtiene una conversación específica con sus mensajes más recientes
+    
+    Los mensajes se paginan hacia atrás con el cursor next_cursor. Una
+    conversación archivada se restaura antes de leer sus mensajes. JSON o
+    MessagePack (Accept: application/msgpack).
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
     
     if not conversation:
         raise HTTPException(
@@ -84,22 +105,43 @@ async def get_conversation(
             detail="Conversación no encontrada"
         )
     
-    return conversation
+    await conversation_archive.restore(conversation)
+    
+    messages, next_cursor = await fetch_page(
+        db,
+        select(*MESSAGE_RESPONSE_COLUMNS).where(Message.conversation_id == conversation_id),
+        Message.created_at,
+        Message.id,
+        page,
+        scalars=False
+    )
+    
+    # Misma estructura que ConversationWithMessages, sin validarla fila a fila
+    return negotiate(request, {
+        "id": conversation.id,
+        "title": conversation.title,
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "messages": [row._asdict() for row in reversed(messages)],
+        "next_cursor": next_cursor
+    })
 
 
 @router.delete("/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_conversation(
     conversation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Elimina una conversación
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
     
     if not conversation:
         raise HTTPException(
@@ -107,8 +149,15 @@ async def delete_conversation(
             detail="Conversación no encontrada"
         )
     
-    db.delete(conversation)
-    db.commit()
+    # Borrar los mensajes en bloque en lugar de cargarlos para la cascada
+    await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+    await db.delete(conversation)
+    await db.commit()
+    
+    context_manager.invalidate(conversation_id)
+    history_cache.invalidate(conversation_id)
+    if conversation.archive_file:
+        conversation_archive.discard(conversation.archive_file)
     
     return None
 
@@ -118,15 +167,17 @@ async def update_conversation_title(
     conversation_id: int,
     conversation_data: ConversationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Actualiza el título de una conversación
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
+    conversation = await db.scalar(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
     
     if not conversation:
         raise HTTPException(
@@ -135,10 +186,6 @@ async def update_conversation_title(
         )
     
     conversation.title = conversation_data.title
-    db.commit()
-    db.refresh(conversation)
-    
-    response = ConversationResponse.from_orm(conversation)
-    response.message_count = len(conversation.messages)
+    await db.commit()
     
-    return response
+    return ConversationResponse.from_orm(conversation)
@@ -0,0 +1,26 @@
+"""
+Rutas de búsqueda en el historial
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from ..auth import get_current_user
+from ..config import settings
+from ..database import get_read_db
+from ..models import User
+from ..schemas import SearchResult
+from ..search import search_messages
+
+router = APIRouter(prefix="/search", tags=["Búsqueda"])
+
+
+@router.get("", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=500, description="Palabras a buscar"),
+    limit: int = Query(20, ge=1, le=settings.PAGE_SIZE_MAX),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Busca en los mensajes de todas las conversaciones del usuario, por relevancia"""
+    return await search_messages(db, current_user.id, q, limit)
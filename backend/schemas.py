@@ -36,6 +36,7 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     """Datos del token"""
     user_id: Optional[int] = None
+    expires_at: Optional[datetime] = None
 
 
 # ===== CONVERSATION SCHEMAS =====
@@ -51,6 +52,9 @@ class ConversationResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
     message_count: Optional[int] = 0
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    archived: bool = False  # Mensajes en el archivo en frío (se restauran al abrirla)
     
     class Config:
         from_attributes = True
@@ -83,6 +87,29 @@ class ChatResponse(BaseModel):
     conversation_id: int
     user_message: MessageResponse
     assistant_message: MessageResponse
+    tokens_saved: int = 0  # Tokens de historial ahorrados por la ventana de contexto
+
+class JobResponse(BaseModel):
+    """Schema de un trabajo de generación en segundo plano"""
+    job_id: str
+    status: str  # queued | running | completed | failed
+    conversation_id: int
+    user_message: MessageResponse
+    result: Optional[ChatResponse] = None  # Presente cuando status == "completed"
+    error: Optional[str] = None  # Presente cuando status == "failed"
+
+
+# ===== SEARCH SCHEMAS =====
+
+class SearchResult(BaseModel):
+    """Mensaje encontrado por la búsqueda de texto completo"""
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    snippet: str  # Fragmento con el HTML escapado y las coincidencias entre <mark>
+    score: float  # Relevancia (mayor = más relevante)
+    created_at: datetime
 
 
 # ===== CONVERSATION WITH MESSAGES =====
@@ -94,6 +121,7 @@ class ConversationWithMessages(BaseModel):
     created_at: datetime
     updated_at: datetime
     messages: List[MessageResponse]
+    next_cursor: Optional[str] = None  # Cursor para cargar mensajes anteriores
     
     class Config:
         from_attributes = True
@@ -0,0 +1,137 @@
+"""
+Búsqueda de texto completo en el historial de un usuario
+
+El índice se crea en las migraciones 4 y 5 (y en create_all, ver models.py):
+- SQLite: FTS5 con ranking bm25 y snippet(). El filtro por usuario va dentro
+  de la consulta MATCH (columna owner), así FTS5 cruza las listas de
+  aparición del usuario y del término en lugar de filtrar después.
+- PostgreSQL: tsvector + GIN con ts_rank y ts_headline.
+
+La consulta del usuario se reduce a palabras (sin operadores FTS) y la última
+se busca como prefijo, para poder buscar mientras se escribe.
+"""
+from html import escape
+from typing import Any, Dict, List, Optional
+import re
+
+from sqlalchemy import DateTime, Float, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Marcadores internos del fragmento; se convierten en <mark> tras escapar el HTML
+MARK_START = "\x02"
+MARK_END = "\x03"
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+# Palabras de contexto alrededor de las coincidencias en cada fragmento
+SNIPPET_TOKENS = 16
+
+# Máximo de palabras de la consulta que se tienen en cuenta
+MAX_QUERY_TERMS = 16
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_SQLITE_SEARCH = text("""
+    SELECT m.id AS message_id, m.conversation_id, c.title AS conversation_title,
+           m.role, m.created_at,
+           snippet(messages_fts, 0, :mark_start, :mark_end, '…', :tokens) AS snippet,
+           -messages_fts.rank AS score
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE messages_fts MATCH :query AND c.user_id = :user_id
+    ORDER BY messages_fts.rank
+    LIMIT :limit
+""").columns(created_at=DateTime, score=Float)
+
+# ts_headline es caro: se calcula solo para las filas ya ordenadas y limitadas
+_POSTGRES_SEARCH = text("""
+    SELECT m.id AS message_id, m.conversation_id, c.title AS conversation_title,
+           m.role, m.created_at,
+           ts_headline('simple', m.content, to_tsquery('simple', :query), :headline) AS snippet,
+           hits.score
+    FROM (
+        SELECT m.id, ts_rank(m.content_tsv, to_tsquery('simple', :query)) AS score
+        FROM messages m
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE c.user_id = :user_id AND m.content_tsv @@ to_tsquery('simple', :query)
+        ORDER BY score DESC, m.id DESC
+        LIMIT :limit
+    ) hits
+    JOIN messages m ON m.id = hits.id
+    JOIN conversations c ON c.id = m.conversation_id
+    ORDER BY hits.score DESC, m.id DESC
+""").columns(created_at=DateTime, score=Float)
+
+
+def query_terms(query: str) -> List[str]:
+    """Palabras de la consulta, en minúsculas y sin operadores"""
+    return [term.lower() for term in _TERM_RE.findall(query)][:MAX_QUERY_TERMS]
+
+
+def sqlite_match(user_id: int, terms: List[str]) -> str:
+    """
+    Expresión MATCH de FTS5: todas las palabras (la última como prefijo) del usuario
+    
+    Las palabras no llevan filtro de columna (más barato): una palabra que
+    coincida con un valor de owner no amplía el resultado, que sigue
+    limitado por owner:"u<user_id>".
+    """
+    phrases = " ".join(f'"{term}"' for term in terms) + "*"
+    return f'owner:"u{user_id}" AND {phrases}'
+
+
+def postgres_tsquery(terms: List[str]) -> str:
+    """Expresión to_tsquery equivalente (la última palabra como prefijo)"""
+    return " & ".join(terms) + ":*"
+
+
+def render_snippet(raw: Optional[str]) -> str:
+    """Escapa el fragmento y resalta las coincidencias con <mark>"""
+    return (
+        escape(raw or "")
+        .replace(MARK_START, HIGHLIGHT_START)
+        .replace(MARK_END, HIGHLIGHT_END)
+    )
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Mensajes del usuario que contienen todas las palabras de la consulta
+    
+    Returns:
+        List[Dict]: Resultados de mayor a menor relevancia, con el fragmento resaltado
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    
+    if db.get_bind().dialect.name == "postgresql":
+        result = await db.execute(_POSTGRES_SEARCH, {
+            "query": postgres_tsquery(terms),
+            "user_id": user_id,
+            "limit": limit,
+            "headline": (
+                f"StartSel={MARK_START}, StopSel={MARK_END}, "
+                f"MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS // 2}"
+            ),
+        })
+    else:
+        result = await db.execute(_SQLITE_SEARCH, {
+            "query": sqlite_match(user_id, terms),
+            "user_id": user_id,
+            "limit": limit,
+            "mark_start": MARK_START,
+            "mark_end": MARK_END,
+            "tokens": SNIPPET_TOKENS,
+        })
+    
+    return [
+        {**row, "snippet": render_snippet(row["snippet"])}
+        for row in result.mappings()
+    ]
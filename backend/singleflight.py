@@ -0,0 +1,81 @@
+"""
+Agrupación de llamadas idénticas en curso (single-flight)
+
+Las llamadas concurrentes con la misma clave comparten una única ejecución
+y su resultado (o su excepción). La ejecución corre en su propia tarea: si
+un llamante se cancela solo deja de esperar, y la llamada compartida se
+cancela únicamente cuando ya no queda nadie esperándola.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class _Call:
+    """Ejecución compartida y número de llamantes que la esperan"""
+    
+    __slots__ = ("task", "waiters")
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Ejecuta una sola vez las llamadas concurrentes con la misma clave"""
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Devuelve el resultado de func(), compartiéndolo con las llamadas en curso
+        
+        Args:
+            key: Identifica llamadas equivalentes
+            func: Función que crea la corrutina (solo se invoca si no hay una en curso)
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finish(key, call))
+            self.calls += 1
+        else:
+            self.shared += 1
+        
+        call.waiters += 1
+        try:
+            # shield: cancelar a este llamante no cancela la tarea compartida
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Olvidarla ya: hasta que termine de cancelarse, una llamada
+                # nueva se uniría a ella y recibiría CancelledError
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+    
+    def _finish(self, key: Hashable, call: _Call):
+        """Olvida la llamada terminada y marca su excepción como consumida"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            call.task.exception()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Llamadas ejecutadas y compartidas"""
+        total = self.calls + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_rate": round(self.shared / total, 4) if total else 0.0
+        }
+    
+    def __len__(self) -> int:
+        return len(self._calls)
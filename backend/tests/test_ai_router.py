@@ -0,0 +1,158 @@
+"""
+Tests del router de proveedores de IA
+Ejecutar con: pytest backend/tests/test_ai_router.py
+"""
+import asyncio
+import pytest
+from backend.ai_router import AIRouter, Target, parse_targets
+
+OPENAI = Target("openai", "gpt-4o-mini")
+GEMINI = Target("gemini", "gemini-1.5-flash")
+
+
+def responder(delays, failing=()):
+    """func(target) que tarda delays[target] segundos y falla en los destinos indicados"""
+    calls = []
+    
+    async def call(target):
+        calls.append(target)
+        await asyncio.sleep(delays.get(target, 0))
+        if target in failing:
+            raise RuntimeError(f"{target.name} caído")
+        return target.name
+    
+    call.calls = calls
+    return call
+
+
+class TestTargets:
+    """Tests de la configuración de destinos"""
+    
+    def test_parse_targets(self):
+        """Test: Lista proveedor:modelo separada por comas"""
+        assert parse_targets("openai:gpt-4o-mini, gemini:gemini-1.5-flash,") == [OPENAI, GEMINI]
+        assert parse_targets("") == []
+    
+    def test_invalid_targets(self):
+        """Test: Entradas sin modelo o con proveedor desconocido se rechazan"""
+        with pytest.raises(ValueError):
+            parse_targets("openai")
+        with pytest.raises(ValueError):
+            parse_targets("claude:modelo")
+
+
+class TestRouting:
+    """Tests de ordenación por salud y failover"""
+    
+    def test_fastest_target_first(self):
+        """Test: El destino con menor p50 va primero"""
+        router = AIRouter([OPENAI, GEMINI])
+        for _ in range(5):
+            router.record(OPENAI, 900, ok=True)
+            router.record(GEMINI, 300, ok=True)
+        
+        assert router.ranked() == [GEMINI, OPENAI]
+        assert router.stats[GEMINI].percentile(95) == 300
+    
+    def test_unhealthy_target_last(self):
+        """Test: Un destino con muchos errores recientes pasa al final"""
+        router = AIRouter([OPENAI, GEMINI], max_error_rate=0.5)
+        router.record(GEMINI, 900, ok=True)
+        router.record(OPENAI, 100, ok=True)
+        router.record(OPENAI, None, ok=False)
+        router.record(OPENAI, None, ok=False)
+        
+        assert router.ranked() == [GEMINI, OPENAI]
+    
+    def test_errors_expire(self):
+        """Test: Los errores fuera de la ventana de tiempo no cuentan"""
+        router = AIRouter([OPENAI], error_window=0)
+        router.record(OPENAI, None, ok=False)
+        assert router.stats[OPENAI].error_rate == 0.0
+    
+    def test_failover(self):
+        """Test: Si el primer destino falla se usa el siguiente"""
+        router = AIRouter([OPENAI, GEMINI])
+        call = responder({}, failing={OPENAI})
+        
+        assert asyncio.run(router.call(call)) == GEMINI.name
+        assert call.calls == [OPENAI, GEMINI]
+        assert router.failovers == 1
+        assert router.stats[OPENAI].error_rate == 1.0
+    
+    def test_all_targets_fail(self):
+        """Test: Si fallan todos se propaga el último error"""
+        router = AIRouter([OPENAI, GEMINI])
+        with pytest.raises(RuntimeError, match="gemini"):
+            asyncio.run(router.call(responder({}, failing={OPENAI, GEMINI})))
+
+
+class TestHedging:
+    """Tests de las peticiones de cobertura"""
+    
+    def test_slow_call_is_hedged(self):
+        """Test: Si la primera petición supera el percentil se cubre con el siguiente destino"""
+        router = AIRouter([OPENAI, GEMINI], hedge_percentile=95, hedge_min_samples=3)
+        for _ in range(3):
+            router.record(OPENAI, 10, ok=True)
+            router.record(GEMINI, 20, ok=True)
+        
+        call = responder({OPENAI: 1.0, GEMINI: 0.01})
+        
+        assert asyncio.run(router.call(call)) == GEMINI.name
+        assert call.calls == [OPENAI, GEMINI]
+        assert router.hedges == 1
+    
+    def test_fast_call_is_not_hedged(self):
+        """Test: Sin muestras suficientes o si responde a tiempo no se cubre"""
+        router = AIRouter([OPENAI, GEMINI], hedge_percentile=95, hedge_min_samples=3)
+        call = responder({OPENAI: 0.01})
+        
+        assert asyncio.run(router.call(call)) == OPENAI.name
+        assert router.hedges == 0
+    
+    def test_failed_hedge_is_not_retried(self):
+        """Test: Si fallan la petición y su cobertura, el fallback no vuelve a llamar al destino de cobertura"""
+        mock = Target("mock", "mock-model")
+        router = AIRouter([OPENAI, GEMINI, mock], hedge_percentile=95, hedge_min_samples=3)
+        for _ in range(3):
+            router.record(OPENAI, 10, ok=True)
+            router.record(GEMINI, 20, ok=True)
+            router.record(mock, 30, ok=True)
+        
+        call = responder({OPENAI: 0.2, GEMINI: 0.01}, failing=(OPENAI, GEMINI))
+        
+        assert asyncio.run(router.call(call)) == mock.name
+        assert call.calls == [OPENAI, GEMINI, mock]
+        assert router.failovers == 1
+
+
+class TestStreamRouting:
+    """Tests del failover en streaming"""
+    
+    def collect(self, router, func):
+        async def run():
+            return [delta async for delta in router.stream(func)]
+        return asyncio.run(run())
+    
+    def test_failover_before_first_delta(self):
+        """Test: Un stream que falla antes de emitir texto pasa al siguiente destino"""
+        async def stream(target):
+            if target == OPENAI:
+                raise RuntimeError("caído")
+            yield "Hola"
+        
+        router = AIRouter([OPENAI, GEMINI])
+        assert self.collect(router, stream) == ["Hola"]
+        assert router.failovers == 1
+    
+    def test_error_after_first_delta_is_raised(self):
+        """Test: Tras emitir texto no se cambia de destino"""
+        async def stream(target):
+            yield "Hola"
+            raise RuntimeError("cortado")
+        
+        router = AIRouter([OPENAI, GEMINI])
+        with pytest.raises(RuntimeError, match="cortado"):
+            self.collect(router, stream)
+        assert router.failovers == 0
@@ -0,0 +1,319 @@
+"""
+Tests del servicio de IA (sin red, usando transportes simulados de httpx)
+Ejecutar con: pytest backend/tests/test_ai_service.py
+"""
+import asyncio
+import httpx
+import pytest
+from backend.ai_router import AIRouter, Target
+from backend.ai_service import AIService
+from backend.cache import TTLCache
+from backend.config import settings
+from backend.singleflight import SingleFlight
+
+
+def openai_handler(request: httpx.Request) -> httpx.Response:
+    """Simula la API de OpenAI"""
+    return httpx.Response(200, json={
+        "choices": [{"message": {"content": "respuesta simulada"}}]
+    })
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """Servicio con proveedor OpenAI y transporte simulado"""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    service = AIService()
+    service.router = AIRouter([Target("openai", "gpt-3.5-turbo")])
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url=settings.OPENAI_BASE_URL,
+        transport=httpx.MockTransport(openai_handler)
+    )
+    yield service
+    asyncio.run(service.aclose())
+
+
+class TestHTTPClient:
+    """Tests del cliente HTTP asíncrono"""
+    
+    def test_generate_response(self, service):
+        """Test: Genera respuesta con el cliente compartido"""
+        result = asyncio.run(service.generate_response([{"role": "user", "content": "Hola"}]))
+        assert result == "respuesta simulada"
+    
+    def test_client_is_reused(self):
+        """Test: Un único cliente (pool) por proveedor"""
+        service = AIService()
+        client = service._get_client("openai")
+        assert service._get_client("openai") is client
+        assert service._get_client("gemini") is not client
+        asyncio.run(service.aclose())
+        assert service._clients == {}
+    
+    def test_http_error_is_wrapped(self, service):
+        """Test: Los errores HTTP se convierten en Exception con mensaje claro"""
+        service._clients["openai"] = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            transport=httpx.MockTransport(lambda request: httpx.Response(500))
+        )
+        with pytest.raises(Exception, match="Error al comunicarse con OpenAI"):
+            asyncio.run(service.generate_response([{"role": "user", "content": "Hola"}]))
+
+    
+    def test_failover_to_second_provider(self, service, monkeypatch):
+        """Test: Si OpenAI falla, el router usa Gemini con su propio modelo"""
+        monkeypatch.setattr(settings, "GEMINI_API_KEY", "test-key")
+        service.router = AIRouter([Target("openai", "gpt-4o-mini"), Target("gemini", "gemini-1.5-flash")])
+        service._clients["openai"] = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            transport=httpx.MockTransport(lambda request: httpx.Response(500))
+        )
+        
+        def gemini_handler(request):
+            assert "gemini-1.5-flash" in request.url.path
+            return httpx.Response(200, json={
+                "candidates": [{"content": {"parts": [{"text": "respuesta de Gemini"}]}}]
+            })
+        
+        service._clients["gemini"] = httpx.AsyncClient(
+            base_url=settings.GEMINI_BASE_URL,
+            transport=httpx.MockTransport(gemini_handler)
+        )
+        
+        result = asyncio.run(service.generate_response([{"role": "user", "content": "Hola"}]))
+        assert result == "respuesta de Gemini"
+        assert service.router.failovers == 1
+
+class TestStreaming:
+    """Tests del modo streaming de los proveedores"""
+    
+    def collect(self, service, messages):
+        """Consume el stream y devuelve la lista de deltas"""
+        async def run():
+            return [delta async for delta in service.stream_response(messages)]
+        return asyncio.run(run())
+    
+    def test_openai_stream(self, service):
+        """Test: Los deltas de OpenAI se emiten en orden hasta [DONE]"""
+        body = (
+            'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": "Hola"}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": " mundo"}}]}\n\n'
+            'data: [DONE]\n\n'
+        )
+        service._clients["openai"] = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+            )
+        )
+        assert self.collect(service, [{"role": "user", "content": "Hola"}]) == ["Hola", " mundo"]
+    
+    def test_gemini_stream(self, monkeypatch):
+        """Test: Los deltas de Gemini se extraen de cada candidato"""
+        monkeypatch.setattr(settings, "GEMINI_API_KEY", "test-key")
+        body = (
+            'data: {"candidates": [{"content": {"parts": [{"text": "Hola"}]}}]}\r\n\r\n'
+            'data: {"candidates": [{"content": {"parts": [{"text": " mundo"}]}}]}\r\n\r\n'
+        )
+        
+        def handler(request):
+            assert request.url.path.endswith(":streamGenerateContent")
+            assert request.url.params["alt"] == "sse"
+            return httpx.Response(200, text=body)
+        
+        service = AIService()
+        service.router = AIRouter([Target("gemini", "gemini-pro")])
+        service._clients["gemini"] = httpx.AsyncClient(
+            base_url=settings.GEMINI_BASE_URL,
+            transport=httpx.MockTransport(handler)
+        )
+        assert self.collect(service, [{"role": "user", "content": "Hola"}]) == ["Hola", " mundo"]
+
+
+class TestResponseCache:
+    """Tests de la caché de respuestas"""
+    
+    @pytest.fixture
+    def counted_service(self, service):
+        """Servicio con caché activada que cuenta las llamadas al proveedor"""
+        calls = []
+        
+        def handler(request):
+            calls.append(request)
+            return openai_handler(request)
+        
+        service._clients["openai"] = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            transport=httpx.MockTransport(handler)
+        )
+        service.response_cache = TTLCache(max_size=10, ttl=60)
+        service.calls = calls
+        return service
+    
+    def test_repeated_prompt_is_cached(self, counted_service):
+        """Test: La misma pregunta (normalizada) solo llama una vez al proveedor"""
+        first = asyncio.run(counted_service.generate_response(
+            [{"role": "user", "content": "What is overfitting?"}]
+        ))
+        second = asyncio.run(counted_service.generate_response(
+            [{"role": "user", "content": "  what is   OVERFITTING? "}]
+        ))
+        
+        assert first == second == "respuesta simulada"
+        assert len(counted_service.calls) == 1
+        assert counted_service.response_cache.stats()["hits"] == 1
+        assert counted_service.response_cache.stats()["misses"] == 1
+    
+    def test_context_changes_key(self, counted_service):
+        """Test: El system prompt forma parte de la clave"""
+        messages = [{"role": "user", "content": "Hola"}]
+        asyncio.run(counted_service.generate_response(messages))
+        asyncio.run(counted_service.generate_response(messages, context="Resumen previo"))
+        
+        assert len(counted_service.calls) == 2
+    
+    def test_expired_entries_are_misses(self, counted_service):
+        """Test: Las entradas caducadas vuelven a llamar al proveedor"""
+        counted_service.response_cache.ttl = 0
+        messages = [{"role": "user", "content": "Hola"}]
+        asyncio.run(counted_service.generate_response(messages))
+        asyncio.run(counted_service.generate_response(messages))
+        
+        assert len(counted_service.calls) == 2
+    
+    def test_size_is_bounded(self):
+        """Test: La caché expulsa las entradas menos recientes"""
+        cache = TTLCache(max_size=2, ttl=60)
+        for key in ("a", "b", "c"):
+            cache.set(key, key)
+        
+        assert cache.get("a") is None
+        assert cache.get("c") == "c"
+        assert len(cache) == 2
+
+
+class TestSingleFlight:
+    """Tests de la agrupación de peticiones idénticas en curso"""
+    
+    @pytest.fixture
+    def slow_service(self, monkeypatch):
+        """Servicio cuyo proveedor tarda en responder y cuenta las llamadas"""
+        service = AIService()
+        service.singleflight = SingleFlight()
+        service.calls = 0
+        
+        async def slow_generate(messages, context=None):
+            service.calls += 1
+            await asyncio.sleep(0.05)
+            return f"respuesta {service.calls}"
+        
+        monkeypatch.setattr(service, "_generate", slow_generate)
+        return service
+    
+    def test_concurrent_requests_share_one_call(self, slow_service):
+        """Test: Peticiones idénticas simultáneas llaman una sola vez al proveedor"""
+        messages = [{"role": "user", "content": "Hola"}]
+        
+        async def run():
+            return await asyncio.gather(*(slow_service.generate_response(messages) for _ in range(5)))
+        
+        assert asyncio.run(run()) == ["respuesta 1"] * 5
+        assert slow_service.calls == 1
+        assert slow_service.singleflight.stats()["shared"] == 4
+        assert len(slow_service.singleflight) == 0
+    
+    def test_different_payloads_are_not_merged(self, slow_service):
+        """Test: Historiales distintos generan llamadas distintas"""
+        async def run():
+            await asyncio.gather(
+                slow_service.generate_response([{"role": "user", "content": "Hola"}]),
+                slow_service.generate_response([{"role": "user", "content": "hola"}])
+            )
+        
+        asyncio.run(run())
+        assert slow_service.calls == 2
+    
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        """Test: Cancelar a un llamante no afecta a los demás"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return "ok"
+        
+        async def run():
+            first = asyncio.ensure_future(flight.do("k", upstream))
+            second = asyncio.ensure_future(flight.do("k", upstream))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return first, await second
+        
+        first, result = asyncio.run(run())
+        assert first.cancelled()
+        assert result == "ok"
+    
+    def test_call_is_cancelled_without_waiters(self):
+        """Test: Si todos los llamantes se cancelan, se cancela la llamada compartida"""
+        flight = SingleFlight()
+        cancelled = []
+        
+        async def upstream():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        async def run():
+            waiter = asyncio.ensure_future(flight.do("k", upstream))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.sleep(0.01)
+        
+        asyncio.run(run())
+        assert cancelled == [True]
+        assert len(flight) == 0
+    
+    def test_new_call_after_cancellation(self):
+        """Test: Una llamada posterior a la cancelación no se une a la tarea que se está cancelando"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                # Limpieza lenta: la tarea tarda en terminar de cancelarse
+                await asyncio.sleep(0.05)
+                raise
+            return "viejo"
+        
+        async def fresh():
+            return "nuevo"
+        
+        async def run():
+            waiter = asyncio.ensure_future(flight.do("k", upstream))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.sleep(0.01)
+            return await flight.do("k", fresh)
+        
+        assert asyncio.run(run()) == "nuevo"
+        assert flight.stats()["calls"] == 2
+    
+    def test_errors_are_shared(self):
+        """Test: La excepción de la llamada llega a todos los llamantes"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("proveedor caído")
+        
+        async def run():
+            return await asyncio.gather(
+                flight.do("k", upstream), flight.do("k", upstream), return_exceptions=True
+            )
+        
+        results = asyncio.run(run())
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.stats()["calls"] == 1
@@ -2,10 +2,28 @@
 Tests básicos para la API
 Ejecutar con: pytest backend/tests/test_api.py
 """
+from datetime import datetime, timedelta
+import asyncio
+import json
+import os
 import pytest
+import httpx
+import msgpack
 from fastapi.testclient import TestClient
 from backend.main import app
-from backend.database import get_db, Base, engine
+from backend.database import get_db, Base, engine, SessionLocal, AsyncSessionLocal, async_engine
+from backend import group_commit as group_commit_module
+from backend import vector_index as vector_index_module
+from backend.group_commit import GroupCommitWriter
+from backend.models import User
+from backend.auth import principal_cache
+from backend.ai_service import ai_service
+from backend.archive import conversation_archive
+from backend.history_cache import history_cache
+from backend.jobs import job_queue
+from backend.metrics import REGISTRY
+from backend.rate_limit import rate_limiter
+from backend.vector_index import HashingEmbedder, SemanticIndex, VectorStore
 
 # Cliente de test
 client = TestClient(app)
@@ -17,6 +35,9 @@ def setup_database():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    history_cache.clear()
+    principal_cache.clear()
+    asyncio.run(rate_limiter.clear())
 
 
 class TestAuth:
@@ -108,6 +129,38 @@ class TestAuth:
             }
         )
         assert response.status_code == 401
+    
+    def test_principal_cache_invalidated_on_deactivate(self):
+        """Test: El usuario autenticado se cachea y se invalida al desactivarlo"""
+        client.post(
+            "/api/auth/register",
+            json={
+                "username": "testuser",
+                "email": "test@example.com",
+                "password": "password123"
+            }
+        )
+        token = client.post(
+            "/api/auth/login",
+            json={
+                "email": "test@example.com",
+                "password": "password123"
+            }
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        assert client.get("/api/auth/me", headers=headers).status_code == 200
+        assert client.get("/api/auth/me", headers=headers).status_code == 200
+        assert principal_cache.stats()["users"]["hits"] == 1
+        
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.email == "test@example.com").first()
+            user.is_active = False
+            db.commit()
+        
+        response = client.get("/api/auth/me", headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Usuario inactivo"
 
 
 class TestConversations:
@@ -167,12 +220,672 @@ class TestConversations:
         data = response.json()
         assert len(data) == 3
     
+    def test_list_conversations_paginated(self, auth_token):
+        """Test: Listado paginado por cursor sin repetir ni saltar conversaciones"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for i in range(5):
+            client.post("/api/conversations/", json={"title": f"Conversation {i}"}, headers=headers)
+        
+        titles = []
+        cursor = None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/api/conversations/", params=params, headers=headers)
+            assert response.status_code == 200
+            titles += [conv["title"] for conv in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        
+        assert titles == [f"Conversation {i}" for i in reversed(range(5))]
+    
+    def test_invalid_cursor(self, auth_token):
+        """Test: Un cursor corrupto devuelve 400"""
+        response = client.get(
+            "/api/conversations/",
+            params={"cursor": "no-es-un-cursor"},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 400
+    
     def test_unauthorized_access(self):
         """Test: Acceso sin token"""
         response = client.get("/api/conversations/")
         assert response.status_code == 401
 
 
+class TestChat:
+    """Tests de chat con la IA simulada"""
+    
+    @pytest.fixture
+    def auth_headers(self):
+        """Crea un usuario y devuelve las cabeceras de autenticación"""
+        client.post(
+            "/api/auth/register",
+            json={
+                "username": "testuser",
+                "email": "test@example.com",
+                "password": "password123"
+            }
+        )
+        response = client.post(
+            "/api/auth/login",
+            json={
+                "email": "test@example.com",
+                "password": "password123"
+            }
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    @pytest.fixture
+    def fake_ai(self, monkeypatch):
+        """Sustituye las llamadas al proveedor por respuestas fijas"""
+        received = []
+        
+        async def generate_response(messages, context=None):
+            received.append(list(messages))
+            return "Respuesta de prueba"
+        
+        async def stream_response(messages, context=None):
+            for delta in ["Respuesta", " de", " prueba"]:
+                yield delta
+        
+        monkeypatch.setattr(ai_service, "generate_response", generate_response)
+        monkeypatch.setattr(ai_service, "stream_response", stream_response)
+        return received
+    
+    def test_send_message(self, auth_headers, fake_ai):
+        """Test: Enviar mensaje crea conversación y respuesta"""
+        response = client.post(
+            "/api/chat/",
+            json={"message": "¿Qué es el overfitting?"},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["user_message"]["content"] == "¿Qué es el overfitting?"
+        assert data["assistant_message"]["content"] == "Respuesta de prueba"
+    
+    def test_history_sent_to_ai(self, auth_headers, fake_ai):
+        """Test: Cada turno envía a la IA el historial completo de la conversación"""
+        first = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers).json()
+        client.post(
+            "/api/chat/",
+            json={"message": "¿Y el underfitting?", "conversation_id": first["conversation_id"]},
+            headers=auth_headers
+        )
+        
+        assert fake_ai[-1] == [
+            {"role": "user", "content": "Hola"},
+            {"role": "assistant", "content": "Respuesta de prueba"},
+            {"role": "user", "content": "¿Y el underfitting?"}
+        ]
+    
+    def test_conversation_counters(self, auth_headers, fake_ai):
+        """Test: La lista muestra contador y último mensaje sin cargar mensajes"""
+        first = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers).json()
+        client.post(
+            "/api/chat/",
+            json={"message": "Otra pregunta", "conversation_id": first["conversation_id"]},
+            headers=auth_headers
+        )
+        
+        conversation = client.get("/api/conversations/", headers=auth_headers).json()[0]
+        assert conversation["message_count"] == 4
+        assert conversation["last_message_preview"] == "Respuesta de prueba"
+        assert conversation["last_message_at"] is not None
+    
+    def test_history_paginated(self, auth_headers, fake_ai):
+        """Test: El historial se pagina hacia atrás en orden cronológico"""
+        first = client.post("/api/chat/", json={"message": "Mensaje 0"}, headers=auth_headers).json()
+        conversation_id = first["conversation_id"]
+        for i in range(1, 3):
+            client.post(
+                "/api/chat/",
+                json={"message": f"Mensaje {i}", "conversation_id": conversation_id},
+                headers=auth_headers
+            )
+        
+        page = client.get(
+            f"/api/chat/history/{conversation_id}", params={"limit": 4}, headers=auth_headers
+        ).json()
+        assert [msg["content"] for msg in page["messages"]] == [
+            "Mensaje 1", "Respuesta de prueba", "Mensaje 2", "Respuesta de prueba"
+        ]
+        
+        older = client.get(
+            f"/api/conversations/{conversation_id}",
+            params={"limit": 4, "cursor": page["next_cursor"]},
+            headers=auth_headers
+        ).json()
+        assert [msg["content"] for msg in older["messages"]] == ["Mensaje 0", "Respuesta de prueba"]
+        assert older["next_cursor"] is None
+    
+    def test_history_msgpack(self, auth_headers, fake_ai):
+        """Test: Historial y listados en MessagePack con la misma estructura que en JSON"""
+        sent = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers).json()
+        msgpack_headers = {**auth_headers, "Accept": "application/msgpack"}
+        
+        for url in (
+            f"/api/chat/history/{sent['conversation_id']}",
+            f"/api/conversations/{sent['conversation_id']}",
+            "/api/conversations/"
+        ):
+            as_json = client.get(url, headers=auth_headers)
+            as_msgpack = client.get(url, headers=msgpack_headers)
+            assert as_json.headers["content-type"] == "application/json"
+            assert as_msgpack.headers["content-type"] == "application/msgpack"
+            assert as_msgpack.headers["vary"] == "Accept"
+            assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+        
+        history = client.get(f"/api/chat/history/{sent['conversation_id']}", headers=auth_headers).json()
+        assert history["messages"][0] == sent["user_message"]
+    
+    def test_msgpack_accept_quality(self, auth_headers, fake_ai):
+        """Test: Se elige el formato por la q de la cabecera Accept, con JSON ante empate o rechazo"""
+        client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers)
+        cases = {
+            "application/msgpack": "application/msgpack",
+            "application/json, application/msgpack;q=0.1": "application/json",
+            "application/json;q=0.5, application/x-msgpack": "application/msgpack",
+            "application/msgpack, application/json": "application/json",
+            "application/msgpack;q=0": "application/json",
+            "*/*": "application/json",
+            "text/html, application/*;q=0.8": "application/json",
+            "application/vnd.msgpack;q=0.9, */*;q=0.1": "application/msgpack",
+        }
+        for accept, expected in cases.items():
+            response = client.get("/api/conversations/", headers={**auth_headers, "Accept": accept})
+            assert response.headers["content-type"] == expected, accept
+    
+    def test_large_message_roundtrip(self, auth_headers, fake_ai):
+        """Test: Un mensaje grande (guardado en un blob comprimido) se lee igual"""
+        pasted = "fecha,valor\n" + "2024-01-01,3.14\n" * 500
+        sent = client.post("/api/chat/", json={"message": pasted}, headers=auth_headers).json()
+        assert sent["user_message"]["content"] == pasted
+        
+        history = client.get(f"/api/chat/history/{sent['conversation_id']}", headers=auth_headers).json()
+        assert history["messages"][0]["content"] == pasted
+        assert fake_ai[-1][-1]["content"] == pasted
+    
+    def test_archived_conversation_restored_on_access(self, auth_headers, fake_ai, tmp_path, monkeypatch):
+        """Test: Una conversación archivada conserva su resumen y se restaura al abrirla o escribir en ella"""
+        monkeypatch.setattr(conversation_archive, "directory", str(tmp_path))
+        first = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers).json()
+        second = client.post("/api/chat/", json={"message": "Otra"}, headers=auth_headers).json()
+        later = datetime.utcnow() + timedelta(days=conversation_archive.after_days + 1)
+        assert asyncio.run(conversation_archive.run_once(now=later)) == 2
+        
+        listed = client.get("/api/conversations/", headers=auth_headers).json()
+        assert all(conv["archived"] and conv["message_count"] == 2 for conv in listed)
+        
+        detail = client.get(f"/api/conversations/{first['conversation_id']}", headers=auth_headers).json()
+        assert [msg["content"] for msg in detail["messages"]] == ["Hola", "Respuesta de prueba"]
+        
+        client.post(
+            "/api/chat/",
+            json={"message": "¿Sigues ahí?", "conversation_id": second["conversation_id"]},
+            headers=auth_headers
+        )
+        assert [msg["content"] for msg in fake_ai[-1]] == ["Otra", "Respuesta de prueba", "¿Sigues ahí?"]
+        assert not any(conv["archived"] for conv in client.get("/api/conversations/", headers=auth_headers).json())
+        assert os.listdir(tmp_path) == []
+    
+    def test_send_message_stream(self, auth_headers, fake_ai):
+        """Test: El streaming emite deltas SSE y guarda la respuesta completa"""
+        with client.stream(
+            "POST",
+            "/api/chat/stream",
+            json={"message": "¿Qué es el overfitting?"},
+            headers=auth_headers
+        ) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = response.read().decode()
+        
+        events = [block.split("\n")[0] for block in body.strip().split("\n\n")]
+        assert events == ["event: start"] + ["event: delta"] * 3 + ["event: done"]
+        
+        conversation_id = client.get("/api/conversations/", headers=auth_headers).json()[0]["id"]
+        history = client.get(f"/api/chat/history/{conversation_id}", headers=auth_headers).json()
+        assert [msg["content"] for msg in history["messages"]] == [
+            "¿Qué es el overfitting?",
+            "Respuesta de prueba"
+        ]
+    
+    def test_cached_history_is_read_once(self, auth_headers, fake_ai):
+        """Test: Un turno en una conversación en caché cuenta un único acierto"""
+        first = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers).json()
+        history_cache.hits = history_cache.misses = 0
+        
+        client.post(
+            "/api/chat/", json={"message": "Otra", "conversation_id": first["conversation_id"]}, headers=auth_headers
+        )
+        assert history_cache.stats()["hits"] == 1
+        assert history_cache.stats()["misses"] == 0
+        assert [msg["content"] for msg in fake_ai[-1]] == ["Hola", "Respuesta de prueba", "Otra"]
+    
+    def test_stream_releases_connection(self, auth_headers, fake_ai, monkeypatch):
+        """Test: El stream no retiene la conexión de la petición mientras genera la IA"""
+        checked_out = []
+        
+        async def stream_response(messages, context=None):
+            checked_out.append(async_engine.pool.checkedout())
+            yield "Respuesta"
+        
+        monkeypatch.setattr(ai_service, "stream_response", stream_response)
+        conversation_id = client.post(
+            "/api/conversations/", json={"title": "Chat"}, headers=auth_headers
+        ).json()["id"]
+        history_cache.clear()  # el historial se lee de la base de datos
+        
+        with client.stream(
+            "POST", "/api/chat/stream", json={"message": "Hola", "conversation_id": conversation_id}, headers=auth_headers
+        ) as response:
+            response.read()
+        assert checked_out == [0]
+    
+    def test_stream_aborted_discards_user_message(self, auth_headers, fake_ai, monkeypatch):
+        """Test: Si el cliente corta el stream a mitad, no queda un turno sin respuesta"""
+        async def stream_response(messages, context=None):
+            yield "Respuesta"
+            await asyncio.sleep(3600)
+            yield " nunca"
+        
+        monkeypatch.setattr(ai_service, "stream_response", stream_response)
+        conversation_id = client.post(
+            "/api/conversations/", json={"title": "Chat"}, headers=auth_headers
+        ).json()["id"]
+        body = json.dumps({"message": "Hola", "conversation_id": conversation_id}).encode()
+        
+        async def run():
+            # Llamada ASGI directa: el cliente se desconecta tras el primer delta
+            got_delta = asyncio.Event()
+            sent = []
+            requested = False
+            
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                await got_delta.wait()
+                return {"type": "http.disconnect"}
+            
+            async def send(message):
+                sent.append(message)
+                if b"event: delta" in message.get("body", b""):
+                    got_delta.set()
+            
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "POST", "scheme": "http", "path": "/api/chat/stream", "raw_path": b"/api/chat/stream",
+                "root_path": "", "query_string": b"", "client": ("test", 1), "server": ("test", 80),
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"authorization", auth_headers["Authorization"].encode())
+                ]
+            }
+            await asyncio.wait_for(app(scope, receive, send), timeout=10)
+            return b"".join(message.get("body", b"") for message in sent).decode()
+        
+        received = asyncio.run(run())
+        assert "event: start" in received and "event: done" not in received
+        
+        history = client.get(f"/api/chat/history/{conversation_id}", headers=auth_headers).json()
+        assert history["messages"] == []
+        conversations = client.get("/api/conversations/", headers=auth_headers).json()
+        assert conversations[0]["message_count"] == 0
+        
+        # El siguiente turno no arrastra el mensaje del turno cortado
+        client.post("/api/chat/", json={"message": "Otra", "conversation_id": conversation_id}, headers=auth_headers)
+        assert [msg["content"] for msg in fake_ai[-1]] == ["Otra"]
+    
+    def test_stream_unknown_conversation(self, auth_headers, fake_ai):
+        """Test: El streaming devuelve 404 antes de abrir el stream"""
+        response = client.post(
+            "/api/chat/stream",
+            json={"message": "Hola", "conversation_id": 999},
+            headers=auth_headers
+        )
+        assert response.status_code == 404
+    
+    
+    def test_rate_limited(self, auth_headers, fake_ai, monkeypatch):
+        """Test: Superar la ráfaga permitida devuelve 429 con Retry-After"""
+        monkeypatch.setattr(rate_limiter, "burst", 2)
+        monkeypatch.setattr(rate_limiter, "rate", 1 / 60)
+        
+        statuses = [
+            client.post("/api/chat/", json={"message": f"Hola {i}"}, headers=auth_headers).status_code
+            for i in range(3)
+        ]
+        assert statuses == [200, 200, 429]
+        
+        response = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+    
+    def test_stream_releases_slot(self, auth_headers, fake_ai, monkeypatch):
+        """Test: El stream ocupa el hueco de concurrencia mientras está abierto y lo libera al cerrarse"""
+        monkeypatch.setattr(rate_limiter, "max_in_flight", 1)
+        streaming = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def stream_response(messages, context=None):
+            yield "Respuesta"
+            streaming.set()
+            await release.wait()
+            yield " final"
+        
+        monkeypatch.setattr(ai_service, "stream_response", stream_response)
+        
+        async def scenario(async_client):
+            first = asyncio.create_task(
+                async_client.post("/api/chat/stream", json={"message": "Hola"}, headers=auth_headers)
+            )
+            await asyncio.wait_for(streaming.wait(), timeout=5)
+            during = await async_client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers)
+            release.set()
+            streamed = await first
+            after = await async_client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers)
+            return during, streamed, after
+        
+        during, streamed, after = self.run_in_loop(scenario)
+        assert during.status_code == 429
+        assert streamed.status_code == 200 and "event: done" in streamed.text
+        assert after.status_code == 200
+    
+    def test_ai_failure_writes_nothing(self, auth_headers, monkeypatch):
+        """Test: Si la IA falla no se guarda ni la conversación ni el mensaje"""
+        async def failing(messages, context=None):
+            raise RuntimeError("proveedor caído")
+        
+        monkeypatch.setattr(ai_service, "generate_response", failing)
+        response = client.post("/api/chat/", json={"message": "Hola"}, headers=auth_headers)
+        
+        assert response.status_code == 503
+        assert client.get("/api/conversations/", headers=auth_headers).json() == []
+    
+    def test_group_commit(self, auth_headers, fake_ai, monkeypatch):
+        """Test: Con group commit los turnos simultáneos se guardan en lotes"""
+        writer = GroupCommitWriter(AsyncSessionLocal, max_batch=64, max_delay=0.01)
+        monkeypatch.setattr(group_commit_module, "group_commit", writer)
+        monkeypatch.setattr(rate_limiter, "burst", 100)
+        monkeypatch.setattr(rate_limiter, "max_in_flight", 100)
+        
+        async def scenario(async_client):
+            responses = await asyncio.gather(*(
+                async_client.post("/api/chat/", json={"message": f"Hola {i}"}, headers=auth_headers)
+                for i in range(8)
+            ))
+            await writer.shutdown()
+            return responses
+        
+        responses = self.run_in_loop(scenario)
+        assert [response.status_code for response in responses] == [200] * 8
+        assert writer.stats()["units"] == 8
+        
+        conversations = client.get("/api/conversations/", headers=auth_headers).json()
+        assert len(conversations) == 8
+        assert all(conv["message_count"] == 2 for conv in conversations)
+    
+    def test_retrieval_adds_related_snippets(self, auth_headers, monkeypatch):
+        """Test: El prompt incluye fragmentos parecidos de otras conversaciones"""
+        embedder = HashingEmbedder(256)
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, AsyncSessionLocal)
+        monkeypatch.setattr(vector_index_module, "semantic_index", index)
+        contexts = []
+        
+        async def generate_response(messages, context=None):
+            contexts.append(context)
+            return "Usa chunksize en read_csv"
+        
+        monkeypatch.setattr(ai_service, "generate_response", generate_response)
+        
+        first = client.post(
+            "/api/chat/",
+            json={"message": "Mi csv de pandas no cabe en memoria"},
+            headers=auth_headers
+        ).json()
+        asyncio.run(index.sync())
+        second = client.post(
+            "/api/chat/",
+            json={"message": "Otra vez problemas de memoria con un csv en pandas"},
+            headers=auth_headers
+        ).json()
+        
+        assert contexts[0] is None
+        assert "Fragmentos relacionados" in contexts[1]
+        assert "Mi csv de pandas no cabe en memoria" in contexts[1]
+        assert second["conversation_id"] != first["conversation_id"]
+    
+    def run_in_loop(self, scenario):
+        """Ejecuta scenario(cliente) en un único event loop (workers de la cola, escritor agrupado)"""
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                    return await scenario(async_client)
+            finally:
+                await job_queue.shutdown()
+        return asyncio.run(run())
+    
+    def test_chat_job_long_poll(self, auth_headers, fake_ai):
+        """Test: El trabajo se encola al instante y el long-poll devuelve la respuesta"""
+        async def scenario(async_client):
+            created = await async_client.post("/api/chat/jobs", json={"message": "Hola"}, headers=auth_headers)
+            job_id = created.json()["job_id"]
+            result = await async_client.get(f"/api/chat/jobs/{job_id}", params={"wait": 5}, headers=auth_headers)
+            return created, result
+        
+        created, result = self.run_in_loop(scenario)
+        assert created.status_code == 202
+        assert created.json()["status"] == "queued"
+        assert created.json()["user_message"]["content"] == "Hola"
+        
+        data = result.json()
+        assert data["status"] == "completed"
+        assert data["result"]["assistant_message"]["content"] == "Respuesta de prueba"
+        
+        history = client.get(f"/api/chat/history/{data['conversation_id']}", headers=auth_headers).json()
+        assert [msg["content"] for msg in history["messages"]] == ["Hola", "Respuesta de prueba"]
+    
+    def test_chat_job_failure(self, auth_headers, monkeypatch):
+        """Test: Si la IA falla el trabajo queda failed y se elimina el mensaje del usuario"""
+        async def failing(messages, context=None):
+            raise RuntimeError("proveedor caído")
+        
+        monkeypatch.setattr(ai_service, "generate_response", failing)
+        
+        async def scenario(async_client):
+            created = (await async_client.post("/api/chat/jobs", json={"message": "Hola"}, headers=auth_headers)).json()
+            return (await async_client.get(
+                f"/api/chat/jobs/{created['job_id']}", params={"wait": 5}, headers=auth_headers
+            )).json()
+        
+        data = self.run_in_loop(scenario)
+        assert data["status"] == "failed"
+        assert "proveedor caído" in data["error"]
+        
+        history = client.get(f"/api/chat/history/{data['conversation_id']}", headers=auth_headers).json()
+        assert history["messages"] == []
+    
+    def test_chat_job_holds_slot(self, auth_headers, monkeypatch):
+        """Test: El trabajo ocupa el hueco de concurrencia hasta terminar, sin retener la conexión"""
+        monkeypatch.setattr(rate_limiter, "max_in_flight", 1)
+        generating = asyncio.Event()
+        release = asyncio.Event()
+        checked_out = []
+        
+        async def generate_response(messages, context=None):
+            checked_out.append(async_engine.pool.checkedout())
+            generating.set()
+            await release.wait()
+            return "Respuesta de prueba"
+        
+        monkeypatch.setattr(ai_service, "generate_response", generate_response)
+        
+        async def scenario(async_client):
+            created = (await async_client.post("/api/chat/jobs", json={"message": "Hola"}, headers=auth_headers)).json()
+            await asyncio.wait_for(generating.wait(), timeout=5)
+            during = await async_client.post("/api/chat/jobs", json={"message": "Otra"}, headers=auth_headers)
+            release.set()
+            result = (await async_client.get(
+                f"/api/chat/jobs/{created['job_id']}", params={"wait": 5}, headers=auth_headers
+            )).json()
+            after = await async_client.post("/api/chat/jobs", json={"message": "Otra"}, headers=auth_headers)
+            return during, result, after
+        
+        during, result, after = self.run_in_loop(scenario)
+        assert during.status_code == 429
+        assert result["status"] == "completed"
+        assert after.status_code == 202
+        assert checked_out and not any(checked_out)
+    
+    def test_unknown_job(self, auth_headers):
+        """Test: Un trabajo inexistente devuelve 404"""
+        response = client.get("/api/chat/jobs/desconocido", headers=auth_headers)
+        assert response.status_code == 404
+    
+    def test_stats_requires_auth(self, auth_headers):
+        """Test: Las estadísticas internas solo se sirven a usuarios autenticados"""
+        assert client.get("/stats").status_code == 401
+        response = client.get("/stats", headers=auth_headers)
+        assert response.status_code == 200
+        assert "ai_router" in response.json()
+
+class TestSearch:
+    """Tests de la búsqueda de texto completo"""
+    
+    def register(self, name):
+        """Registra un usuario y devuelve sus cabeceras de autenticación"""
+        client.post(
+            "/api/auth/register",
+            json={"username": name, "email": f"{name}@example.com", "password": "password123"}
+        )
+        response = client.post(
+            "/api/auth/login",
+            json={"email": f"{name}@example.com", "password": "password123"}
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    @pytest.fixture
+    def chat(self, monkeypatch):
+        """Envía un mensaje; la IA simulada responde con un texto fijo"""
+        async def generate_response(messages, context=None):
+            return "Una respuesta sobre árboles de decisión"
+        
+        monkeypatch.setattr(ai_service, "generate_response", generate_response)
+        
+        def send(headers, message, conversation_id=None):
+            return client.post(
+                "/api/chat/",
+                json={"message": message, "conversation_id": conversation_id},
+                headers=headers
+            ).json()
+        return send
+    
+    def test_search_ranked_and_highlighted(self, chat):
+        """Test: Devuelve coincidencias del usuario, ordenadas y resaltadas"""
+        headers = self.register("alice")
+        data = chat(headers, "¿Cómo evito el overfitting en <redes> neuronales?")
+        chat(headers, "Overfitting, overfitting y más overfitting", data["conversation_id"])
+        chat(headers, "Háblame de regresión lineal")
+        
+        response = client.get("/api/search", params={"q": "overfitting"}, headers=headers)
+        assert response.status_code == 200
+        results = response.json()
+        assert len(results) == 2
+        assert results[0]["snippet"].count("<mark>") == 3
+        assert results[0]["score"] >= results[1]["score"]
+        assert "&lt;redes&gt;" in results[1]["snippet"]
+        assert results[1]["conversation_id"] == data["conversation_id"]
+    
+    def test_prefix_and_accents(self, chat):
+        """Test: La última palabra se busca como prefijo y sin distinguir tildes"""
+        headers = self.register("alice")
+        chat(headers, "Explícame la regresión logística")
+        
+        for query in ("regresion", "regresión logis", "REGRES"):
+            results = client.get("/api/search", params={"q": query}, headers=headers).json()
+            assert len(results) == 1, query
+        
+        assert client.get("/api/search", params={"q": "regresión lineal"}, headers=headers).json() == []
+    
+    def test_scoped_to_user(self, chat):
+        """Test: No se ven los mensajes de otros usuarios"""
+        alice = self.register("alice")
+        bob = self.register("bob")
+        chat(alice, "Mi contraseña secreta es dragón")
+        
+        assert client.get("/api/search", params={"q": "dragón"}, headers=bob).json() == []
+        assert len(client.get("/api/search", params={"q": "dragón"}, headers=alice).json()) == 1
+    
+    def test_deleted_conversation_is_not_found(self, chat):
+        """Test: El índice se actualiza al borrar mensajes"""
+        headers = self.register("alice")
+        data = chat(headers, "Random forest")
+        client.delete(f"/api/conversations/{data['conversation_id']}", headers=headers)
+        
+        assert client.get("/api/search", params={"q": "forest"}, headers=headers).json() == []
+    
+    def test_query_operators_are_ignored(self, chat):
+        """Test: Los operadores FTS de la consulta se tratan como texto"""
+        headers = self.register("alice")
+        chat(headers, "Gradient boosting")
+        
+        response = client.get("/api/search", params={"q": 'owner:u1 OR "boost* NEAR('}, headers=headers)
+        assert response.status_code == 200
+        assert client.get("/api/search", params={"q": "?!"}, headers=headers).json() == []
+
+
+class TestMetrics:
+    """Tests del endpoint /metrics"""
+    
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+    
+    def test_route_template_and_db_queries(self):
+        """Test: Las peticiones se etiquetan por plantilla de ruta y cuentan sus consultas SQL"""
+        labels = {"method": "GET", "route": "/api/conversations/{conversation_id}"}
+        requests_before = self.sample("http_requests_total", status="401", **labels)
+        
+        client.get("/api/conversations/123")
+        client.get("/api/conversations/456")
+        
+        assert self.sample("http_requests_total", status="401", **labels) == requests_before + 2
+        assert self.sample("http_requests_in_flight", **labels) == 0
+        
+        client.post(
+            "/api/auth/register",
+            json={"username": "metrics", "email": "metrics@example.com", "password": "password123"}
+        )
+        register = {"method": "POST", "route": "/api/auth/register"}
+        assert self.sample("http_request_db_queries_count", **register) >= 1
+        assert self.sample("http_request_db_queries_sum", **register) >= 2
+    
+    def test_unmatched_paths_share_a_label(self):
+        """Test: Las URLs desconocidas no crean una serie cada una"""
+        labels = {"method": "GET", "route": "unmatched", "status": "404"}
+        before = self.sample("http_requests_total", **labels)
+        
+        client.get("/no-existe/1")
+        client.get("/no-existe/2")
+        
+        assert self.sample("http_requests_total", **labels) == before + 2
+    
+    def test_metrics_endpoint(self):
+        """Test: /metrics expone el formato de Prometheus con las cachés"""
+        client.get("/health")
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/health"}' in response.text
+        assert 'app_cache_hits_total{cache="history"}' in response.text
+
+
 class TestHealth:
     """Tests de endpoints básicos"""
     
@@ -0,0 +1,212 @@
+"""
+Tests del archivo en frío de conversaciones
+Ejecutar con: pytest backend/tests/test_archive.py
+"""
+from datetime import datetime, timedelta
+import asyncio
+import os
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend import migrations
+from backend.archive import ConversationArchive
+from backend.models import Base, Conversation, Message
+from backend.search import search_messages
+
+OLD = datetime(2024, 1, 1)
+TRACEBACK = "Traceback (most recent call last):\n  File \"train.py\", line 12, in <module>\n" * 40
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sesiones sobre una base de datos SQLite temporal con dos conversaciones antiguas"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'archive.db'}")
+    
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text(
+                "INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"
+            ))
+        async with async_sessionmaker(engine)() as db:
+            for conversation_id in (1, 2):
+                db.add(Conversation(
+                    id=conversation_id, title=f"Chat {conversation_id}", user_id=1,
+                    updated_at=OLD, message_count=3
+                ))
+                db.add_all([
+                    Message(conversation_id=conversation_id, role="user", content="¿Qué es el overfitting?",
+                            created_at=OLD),
+                    Message(conversation_id=conversation_id, role="assistant", content=TRACEBACK,
+                            created_at=OLD + timedelta(seconds=1)),
+                    Message(conversation_id=conversation_id, role="user", content="Gracias",
+                            created_at=OLD + timedelta(seconds=2)),
+                ])
+            await db.commit()
+    
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def archive(session_factory, tmp_path):
+    return ConversationArchive(str(tmp_path / "archive"), after_days=30, session_factory=session_factory)
+
+
+async def messages_of(session_factory, conversation_id):
+    async with session_factory() as db:
+        return (await db.execute(
+            select(Message.id, Message.role, Message.content, Message.created_at)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )).all()
+
+
+class TestArchive:
+    """Tests del archivado y la restauración"""
+    
+    def test_archive_and_restore_roundtrip(self, archive, session_factory):
+        """Test: Archivar deja solo la fila de la conversación y restaurar recupera los mensajes"""
+        async def run():
+            before = await messages_of(session_factory, 1)
+            archived = await archive.run_once()
+            async with session_factory() as db:
+                conversation = await db.get(Conversation, 1)
+                hot = await db.scalar(select(func.count()).select_from(Message))
+                found = await search_messages(db, 1, "overfitting", 10)
+            files = sorted(os.listdir(archive.directory))
+            restored = await archive.restore(conversation)
+            after = await messages_of(session_factory, 1)
+            async with session_factory() as db:
+                reloaded = await db.get(Conversation, 1)
+            return before, archived, conversation, hot, found, files, restored, after, reloaded
+        
+        before, archived, conversation, hot, found, files, restored, after, reloaded = asyncio.run(run())
+        assert archived == 2 and hot == 0 and found == []
+        assert conversation.archived and conversation.message_count == 3
+        assert conversation.updated_at == OLD
+        assert len(files) == 2 and conversation.archive_file in files
+        
+        assert restored == 3
+        assert after == before
+        assert not reloaded.archived and reloaded.rehydrated_at is not None
+        assert not os.path.exists(os.path.join(archive.directory, conversation.archive_file))
+    
+    def test_restored_conversation_is_searchable_and_not_rearchived(self, archive, session_factory):
+        """Test: Tras restaurar vuelve al índice de búsqueda y no se archiva de nuevo enseguida"""
+        async def run():
+            await archive.run_once()
+            restored = await archive.restore_conversation(1)
+            async with session_factory() as db:
+                found = await search_messages(db, 1, "traceback", 10)
+                await db.execute(text("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')"))
+            archived_again = await archive.run_once()
+            return restored, found, archived_again
+        
+        restored, found, archived_again = asyncio.run(run())
+        assert restored == 3
+        assert [result["conversation_id"] for result in found] == [1]
+        assert archived_again == 0
+    
+    def test_active_conversations_are_kept(self, archive, session_factory):
+        """Test: Solo se archivan las conversaciones inactivas desde hace más de after_days"""
+        async def run():
+            async with session_factory() as db:
+                await db.execute(text("UPDATE conversations SET updated_at = :now WHERE id = 2"), {
+                    "now": datetime.utcnow()
+                })
+                await db.commit()
+            archived = await archive.run_once()
+            return archived, await messages_of(session_factory, 2)
+        
+        archived, kept = asyncio.run(run())
+        assert archived == 1
+        assert len(kept) == 3
+    
+    def test_restore_is_claimed_once(self, archive, session_factory):
+        """Test: Dos restauraciones simultáneas insertan los mensajes una sola vez"""
+        async def run():
+            await archive.run_once()
+            results = await asyncio.gather(archive.restore_conversation(1), archive.restore_conversation(1))
+            return results, await messages_of(session_factory, 1)
+        
+        results, after = asyncio.run(run())
+        assert sorted(results) == [0, 3]
+        assert len(after) == 3
+    
+    def test_reused_ids_are_renumbered(self, archive, session_factory):
+        """Test: Si SQLite reutilizó el ID de un mensaje archivado, se restaura con uno nuevo"""
+        async def run():
+            await archive.run_once()
+            # Los mensajes de la conversación 2 tenían los IDs más altos
+            async with session_factory() as db:
+                db.add(Message(conversation_id=1, role="user", content="Nuevo", created_at=datetime.utcnow()))
+                await db.commit()
+            await archive.restore_conversation(1)
+            await archive.restore_conversation(2)
+            return await messages_of(session_factory, 1), await messages_of(session_factory, 2)
+        
+        first, second = asyncio.run(run())
+        assert [row.content for row in first][-1] == "Nuevo"
+        assert [row.content for row in second] == ["¿Qué es el overfitting?", TRACEBACK, "Gracias"]
+        assert len({row.id for row in first} | {row.id for row in second}) == 7
+    
+    def test_failed_claim_removes_file(self, archive, session_factory, monkeypatch):
+        """Test: Si otra escritura reactiva la conversación a mitad de archivado, no se borra nada"""
+        original = archive._write
+        
+        def write_then_touch(name, document):
+            original(name, document)
+            engine = create_engine(f"sqlite:///{os.path.join(os.path.dirname(archive.directory), 'archive.db')}")
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE conversations SET updated_at = :now"), {"now": datetime.utcnow()})
+            engine.dispose()
+        
+        monkeypatch.setattr(archive, "_write", write_then_touch)
+        archived = asyncio.run(archive.run_once())
+        after = asyncio.run(messages_of(session_factory, 1))
+        assert archived == 0 and len(after) == 3
+        assert os.listdir(archive.directory) == []
+    
+    def test_new_message_blocks_claim(self, archive, session_factory, monkeypatch):
+        """Test: Un mensaje guardado a mitad de archivado (sin tocar updated_at) impide reclamar la conversación"""
+        original = archive._write
+        
+        def write_then_insert(name, document):
+            original(name, document)
+            engine = create_engine(f"sqlite:///{os.path.join(os.path.dirname(archive.directory), 'archive.db')}")
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO messages (conversation_id, role, content, created_at) "
+                    "VALUES (:id, 'user', 'Nuevo', :now)"
+                ), {"id": document["conversation_id"], "now": datetime.utcnow()})
+            engine.dispose()
+        
+        monkeypatch.setattr(archive, "_write", write_then_insert)
+        archived = asyncio.run(archive.run_once())
+        first, second = asyncio.run(messages_of(session_factory, 1)), asyncio.run(messages_of(session_factory, 2))
+        assert archived == 0
+        assert [row.content for row in first][-1] == "Nuevo" and len(first) == 4
+        assert len(second) == 4
+        assert os.listdir(archive.directory) == []
+
+
+class TestArchiveMigration:
+    """Tests de la migración del archivo en frío"""
+    
+    def test_downgrade_requires_restore(self, tmp_path):
+        """Test: No se revierte la migración con conversaciones archivadas"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'downgrade.db'}")
+        migrations.upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"))
+            conn.execute(text("INSERT INTO conversations (id, title, user_id, archive_file) VALUES (1, 'Chat', 1, '1-x.json.gz')"))
+        
+        with pytest.raises(RuntimeError, match="restore --all"):
+            migrations.downgrade(engine, 5)
+        
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE conversations SET archive_file = NULL"))
+        assert migrations.downgrade(engine, 5) == [6]
+        engine.dispose()
@@ -0,0 +1,154 @@
+"""
+Tests de la ventana de contexto con resumen incremental
+Ejecutar con: pytest backend/tests/test_context_manager.py
+"""
+import asyncio
+from backend.context_manager import ContextManager, message_tokens
+
+
+def make_history(turns):
+    """Historial alternando usuario/asistente con mensajes de ~100 tokens"""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"pregunta {i} " + "x" * 400})
+        history.append({"role": "assistant", "content": f"respuesta {i} " + "y" * 400})
+    return history
+
+
+class FakeSummarizer:
+    """Resumidor que registra qué mensajes recibe en cada llamada"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    async def __call__(self, previous_summary, messages):
+        self.calls.append(len(messages))
+        return f"{previous_summary}+{len(messages)}"
+
+
+def build(manager, conversation_id, history):
+    """build() y espera a la actualización del resumen que haya arrancado"""
+    async def run():
+        window = await manager.build(conversation_id, history)
+        await manager.wait_refresh(conversation_id)
+        return window
+    return asyncio.run(run())
+
+
+class TestContextManager:
+    """Tests del presupuesto de tokens"""
+    
+    def test_short_history_unchanged(self):
+        """Test: Si el historial cabe, se envía completo y sin resumen"""
+        summarizer = FakeSummarizer()
+        manager = ContextManager(max_tokens=3000, summary_max_tokens=200, cache_size=10, summarizer=summarizer)
+        history = make_history(2)
+        
+        window = asyncio.run(manager.build(1, history))
+        
+        assert list(window.messages) == history
+        assert window.summary is None
+        assert window.tokens_saved == 0
+        assert summarizer.calls == []
+    
+    def test_long_history_fits_budget(self):
+        """Test: Los turnos antiguos se resumen y los recientes van literales"""
+        summarizer = FakeSummarizer()
+        manager = ContextManager(max_tokens=1000, summary_max_tokens=200, cache_size=10, summarizer=summarizer)
+        history = make_history(10)
+        
+        # Sin resumen todavía: solo los recientes que caben
+        first = build(manager, 1, history)
+        assert first.summary is None
+        assert first.tokens_sent <= 1000
+        
+        window = build(manager, 1, history)
+        
+        assert list(window.messages) == history[-len(window.messages):]
+        assert window.messages[0]["role"] == "user"
+        assert sum(message_tokens(msg) for msg in window.messages) <= 800
+        assert window.summary is not None
+        assert window.tokens_saved > 0
+        assert window.tokens_sent <= 1000
+    
+    def test_summary_is_incremental(self):
+        """Test: Cada actualización solo resume los mensajes nuevos"""
+        summarizer = FakeSummarizer()
+        manager = ContextManager(max_tokens=1000, summary_max_tokens=200, cache_size=10, summarizer=summarizer)
+        history = make_history(10)
+        
+        build(manager, 1, history)
+        summarized = sum(summarizer.calls)
+        
+        # Un turno más cabe gracias al margen: no se vuelve a resumir
+        build(manager, 1, history + make_history(1))
+        assert sum(summarizer.calls) == summarized
+        
+        # Muchos turnos más: solo se resumen los que aún no lo estaban
+        longer = history + make_history(6)
+        build(manager, 1, longer)
+        window = build(manager, 1, longer)
+        assert len(summarizer.calls) == 2
+        assert sum(summarizer.calls) + len(window.messages) == len(longer)
+    
+    def test_invalidate(self):
+        """Test: Invalidar descarta el resumen en caché"""
+        summarizer = FakeSummarizer()
+        manager = ContextManager(max_tokens=1000, summary_max_tokens=200, cache_size=10, summarizer=summarizer)
+        history = make_history(10)
+        
+        build(manager, 1, history)
+        manager.invalidate(1)
+        build(manager, 1, history)
+        
+        assert len(summarizer.calls) == 2
+        assert summarizer.calls[0] == summarizer.calls[1]
+    
+    def test_summary_refresh_is_background(self):
+        """Test: El turno no espera al resumidor; mientras tanto se usa el resumen anterior"""
+        release = asyncio.Event()
+        calls = []
+        
+        async def slow_summarizer(previous_summary, messages):
+            calls.append(len(messages))
+            await release.wait()
+            return "resumen"
+        
+        manager = ContextManager(max_tokens=1000, summary_max_tokens=200, cache_size=10, summarizer=slow_summarizer)
+        history = make_history(10)
+        
+        async def run():
+            first = await asyncio.wait_for(manager.build(1, history), timeout=1)
+            second = await asyncio.wait_for(manager.build(1, history), timeout=1)
+            release.set()
+            await manager.wait_refresh(1)
+            third = await manager.build(1, history)
+            return first, second, third
+        
+        first, second, third = asyncio.run(run())
+        assert len(calls) == 1
+        assert first.summary is None and second.summary is None
+        assert first.tokens_sent <= 1000
+        assert "resumen" in third.system_context
+    
+    def test_failed_summary_is_retried(self):
+        """Test: Si el resumidor falla, los mismos turnos se resumen en la siguiente llamada"""
+        summarizer = FakeSummarizer()
+        failures = [RuntimeError("proveedor caído")]
+        
+        async def flaky(previous_summary, messages):
+            if failures:
+                raise failures.pop()
+            return await summarizer(previous_summary, messages)
+        
+        manager = ContextManager(max_tokens=1000, summary_max_tokens=200, cache_size=10, summarizer=flaky)
+        history = make_history(10)
+        
+        build(manager, 1, history)
+        assert summarizer.calls == []
+        
+        build(manager, 1, history)
+        window = build(manager, 1, history)
+        assert len(summarizer.calls) == 1
+        assert summarizer.calls[0] + len(window.messages) == len(history)
+        assert window.summary == f"+{summarizer.calls[0]}"
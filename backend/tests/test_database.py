@@ -0,0 +1,54 @@
+"""
+Tests de la configuración de conexiones a la base de datos
+Ejecutar con: pytest backend/tests/test_database.py
+"""
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.database import configure_connections, sqlite_pragmas
+
+
+class TestSQLiteProfile:
+    """Tests del perfil de producción de SQLite"""
+    
+    def test_default_profile_has_no_pragmas(self):
+        """Test: El perfil por defecto no cambia nada en las conexiones de escritura"""
+        assert sqlite_pragmas("default") == []
+        assert sqlite_pragmas("default", read_only=True) == ["query_only=ON"]
+    
+    def test_production_pragmas_are_applied(self, tmp_path):
+        """Test: Las conexiones nuevas usan WAL y los pragmas configurados"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+        configure_connections(engine, profile="production")
+        
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+        engine.dispose()
+    
+    def test_read_pool_rejects_writes(self, tmp_path):
+        """Test: El pool de lectura no puede escribir en la base de datos"""
+        url = f"sqlite+aiosqlite:///{tmp_path / 'read.db'}"
+        
+        async def run():
+            writer = create_async_engine(url)
+            configure_connections(writer.sync_engine, profile="production")
+            reader = create_async_engine(url)
+            configure_connections(reader.sync_engine, profile="production", read_only=True)
+            try:
+                async with writer.begin() as conn:
+                    await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY)"))
+                    await conn.execute(text("INSERT INTO items VALUES (1)"))
+                
+                async with reader.connect() as conn:
+                    assert (await conn.execute(text("SELECT COUNT(*) FROM items"))).scalar() == 1
+                    with pytest.raises(OperationalError):
+                        await conn.execute(text("INSERT INTO items VALUES (2)"))
+            finally:
+                await writer.dispose()
+                await reader.dispose()
+        
+        asyncio.run(run())
@@ -0,0 +1,74 @@
+"""
+Tests del escritor agrupado (group commit)
+Ejecutar con: pytest backend/tests/test_group_commit.py
+"""
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend.group_commit import GroupCommitWriter
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sesiones sobre una base de datos SQLite temporal con una tabla de prueba"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'group.db'}")
+    
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL)"))
+    
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def insert(value):
+    """Unidad de trabajo que inserta una fila"""
+    async def work(db):
+        await db.execute(text("INSERT INTO items (value) VALUES (:value)"), {"value": value})
+        return value
+    return work
+
+
+async def count(session_factory):
+    async with session_factory() as db:
+        return (await db.execute(text("SELECT COUNT(*) FROM items"))).scalar()
+
+
+class TestGroupCommit:
+    """Tests de agrupación y aislamiento de fallos"""
+    
+    def test_concurrent_units_share_transactions(self, session_factory):
+        """Test: Las unidades simultáneas se confirman en pocos lotes"""
+        writer = GroupCommitWriter(session_factory, max_batch=64, max_delay=0.01)
+        
+        async def run():
+            results = await asyncio.gather(*(writer.submit(insert(f"v{i}")) for i in range(20)))
+            await writer.shutdown()
+            return results, await count(session_factory)
+        
+        results, rows = asyncio.run(run())
+        assert results == [f"v{i}" for i in range(20)]
+        assert rows == 20
+        assert writer.batches < 20
+        assert writer.stats()["units"] == 20
+    
+    def test_failure_is_isolated(self, session_factory):
+        """Test: Si una unidad falla, las demás del lote se guardan igualmente"""
+        writer = GroupCommitWriter(session_factory, max_batch=64, max_delay=0.01)
+        
+        async def run():
+            results = await asyncio.gather(
+                writer.submit(insert("a")),
+                writer.submit(insert(None)),  # viola NOT NULL
+                writer.submit(insert("b")),
+                return_exceptions=True
+            )
+            await writer.shutdown()
+            return results, await count(session_factory)
+        
+        results, rows = asyncio.run(run())
+        assert results[0] == "a" and results[2] == "b"
+        assert isinstance(results[1], Exception)
+        assert rows == 2
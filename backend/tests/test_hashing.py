@@ -0,0 +1,43 @@
+"""
+Tests del pool de hashing de contraseñas
+Ejecutar con: pytest backend/tests/test_hashing.py
+"""
+import asyncio
+import threading
+import pytest
+from backend.hashing import HashingBusyError, HashingPool, hash_password_async, pwd_context, verify_password_async
+
+
+class TestHashingPool:
+    """Tests del pool acotado"""
+    
+    def test_hash_and_verify_off_loop(self):
+        """Test: Hash y verificación funcionan a través del pool"""
+        async def run():
+            hashed = await hash_password_async("password123")
+            return hashed, await verify_password_async("password123", hashed)
+        
+        hashed, valid = asyncio.run(run())
+        assert valid
+        assert pwd_context.identify(hashed) == "argon2"
+    
+    def test_queue_limit(self):
+        """Test: Se rechazan peticiones cuando el pool y su cola están llenos"""
+        pool = HashingPool(workers=1, max_queue=0)
+        release = threading.Event()
+        
+        async def run():
+            blocked = asyncio.ensure_future(pool.run(release.wait))
+            await asyncio.sleep(0.05)
+            assert pool.pending == 1
+            
+            with pytest.raises(HashingBusyError):
+                await pool.run(lambda: None)
+            
+            release.set()
+            await blocked
+            assert pool.pending == 0
+            assert await pool.run(lambda: "ok") == "ok"
+        
+        asyncio.run(run())
+        pool.shutdown()
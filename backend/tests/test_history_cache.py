@@ -0,0 +1,58 @@
+"""
+Tests de la caché de historiales
+Ejecutar con: pytest backend/tests/test_history_cache.py
+"""
+from datetime import datetime, timedelta
+from backend.history_cache import HistoryCache
+
+
+class TestHistoryCache:
+    """Tests de la caché LRU con write-through"""
+    
+    def test_append_is_written_through(self):
+        """Test: Los mensajes nuevos se añaden a la entrada en caché"""
+        cache = HistoryCache(max_size=10)
+        cache.load(1, [{"role": "user", "content": "Hola"}])
+        cache.append(1, "assistant", "¡Hola!")
+        
+        history = cache.get(1)
+        assert list(history) == [
+            {"role": "user", "content": "Hola"},
+            {"role": "assistant", "content": "¡Hola!"}
+        ]
+        assert history.gemini[1] == {"role": "model", "parts": [{"text": "¡Hola!"}]}
+    
+    def test_views_are_snapshots(self):
+        """Test: Una vista no cambia aunque se añadan mensajes después"""
+        cache = HistoryCache(max_size=10)
+        cache.load(1, [{"role": "user", "content": "Hola"}])
+        view = cache.get(1)
+        cache.append(1, "assistant", "¡Hola!")
+        
+        assert len(view) == 1
+        assert len(view.gemini) == 1
+        assert view.token_sum() == view.message_tokens(0)
+    
+    def test_stale_version_is_discarded(self):
+        """Test: Si updated_at no coincide, la entrada se descarta"""
+        cache = HistoryCache(max_size=10)
+        version = datetime.utcnow()
+        cache.load(1, [], version=version)
+        
+        assert cache.get(1, version=version) is not None
+        assert cache.get(1, version=version + timedelta(seconds=1)) is None
+        assert cache.get(1) is None
+    
+    def test_lru_eviction_and_invalidation(self):
+        """Test: La caché está acotada y se puede invalidar"""
+        cache = HistoryCache(max_size=2)
+        for conversation_id in (1, 2, 3):
+            cache.load(conversation_id, [])
+        
+        assert cache.get(1) is None
+        assert len(cache) == 2
+        
+        cache.invalidate(2)
+        assert cache.get(2) is None
+        cache.append(2, "user", "sin entrada")  # No crea entradas nuevas
+        assert cache.get(2) is None
@@ -0,0 +1,97 @@
+"""
+Tests de la cola de trabajos en segundo plano
+Ejecutar con: pytest backend/tests/test_jobs.py
+"""
+import asyncio
+import pytest
+from backend.jobs import JobQueue, JobQueueFullError
+
+
+class TestJobQueue:
+    """Tests de la cola acotada y sus workers"""
+    
+    def test_concurrency_is_bounded(self):
+        """Test: Nunca se ejecutan más trabajos que workers"""
+        queue = JobQueue(workers=2, max_queue=10, result_ttl=60)
+        running, peak = [0], [0]
+        
+        async def work():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return {"ok": True}
+        
+        async def run():
+            jobs = [queue.submit(1, work) for _ in range(6)]
+            await asyncio.gather(*(job.wait(5) for job in jobs))
+            await queue.shutdown()
+            return jobs
+        
+        jobs = asyncio.run(run())
+        assert peak[0] == 2
+        assert all(job.status == "completed" and job.result == {"ok": True} for job in jobs)
+        assert queue.get(jobs[0].id) is jobs[0]
+    
+    def test_full_queue_rejects(self):
+        """Test: Con la cola llena submit lanza JobQueueFullError"""
+        queue = JobQueue(workers=1, max_queue=1, result_ttl=60)
+        
+        async def work():
+            await asyncio.sleep(1)
+            return {}
+        
+        async def run():
+            try:
+                queue.submit(1, work)
+                await asyncio.sleep(0)  # el worker toma el primero
+                queue.submit(1, work)
+                with pytest.raises(JobQueueFullError):
+                    queue.submit(1, work)
+            finally:
+                await queue.shutdown()
+        
+        asyncio.run(run())
+    
+    def test_wait_times_out(self):
+        """Test: wait devuelve False si el trabajo no termina a tiempo"""
+        queue = JobQueue(workers=1, max_queue=10, result_ttl=60)
+        
+        async def work():
+            await asyncio.sleep(1)
+            return {}
+        
+        async def run():
+            job = queue.submit(1, work)
+            finished = await job.wait(0.01)
+            await queue.shutdown()
+            return job, finished
+        
+        job, finished = asyncio.run(run())
+        assert finished is False
+        assert job.status == "running"
+    
+    def test_pending_job_does_not_expire(self):
+        """Test: La caducidad cuenta desde que termina el trabajo, no desde que se encola"""
+        queue = JobQueue(workers=1, max_queue=10, result_ttl=0.05)
+        
+        async def work():
+            await asyncio.sleep(0.1)
+            return {"ok": True}
+        
+        async def run():
+            first = queue.submit(1, work)
+            second = queue.submit(1, work)
+            await asyncio.sleep(0.15)
+            queued = queue.get(second.id)
+            await second.wait(5)
+            finished = queue.get(second.id)
+            await asyncio.sleep(0.1)
+            expired = queue.get(first.id)
+            await queue.shutdown()
+            return second, queued, finished, expired
+        
+        second, queued, finished, expired = asyncio.run(run())
+        assert queued is second and finished is second
+        assert second.status == "completed"
+        assert expired is None
@@ -0,0 +1,190 @@
+"""
+Tests de la compresión y deduplicación del contenido de los mensajes
+Ejecutar con: pytest backend/tests/test_message_store.py
+"""
+import asyncio
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend import message_store, migrations
+from backend.compression import compress, decompress
+from backend.config import settings
+from backend.models import Base, Message, MessageBlob
+from backend.schemas import MessageResponse
+from backend.search import search_messages
+
+TRACEBACK = "Traceback (most recent call last):\n  File \"train.py\", line 12, in <module>\n" * 40
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """Sesiones sobre una base de datos SQLite temporal con un usuario y una conversación"""
+    monkeypatch.setattr(settings, "MESSAGE_BLOB_THRESHOLD", 1024)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'store.db'}")
+    
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text(
+                "INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"
+            ))
+            await conn.execute(text(
+                "INSERT INTO conversations (id, title, user_id, message_count) VALUES (1, 'Errores', 1, 0)"
+            ))
+    
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+async def add_messages(session_factory, contents):
+    async with session_factory() as db:
+        messages = [Message(conversation_id=1, role="user", content=content) for content in contents]
+        db.add_all(messages)
+        await db.commit()
+        return messages
+
+
+class TestCodecs:
+    """Tests de los algoritmos de compresión"""
+    
+    @pytest.mark.parametrize("codec", ["zlib", "lzma", "bz2"])
+    def test_roundtrip(self, codec):
+        """Test: Cada codec recupera el texto original"""
+        stored_codec, data = compress(TRACEBACK.encode("utf-8"), codec)
+        assert stored_codec == codec
+        assert len(data) < len(TRACEBACK)
+        assert decompress(data) == TRACEBACK
+    
+    def test_incompressible_is_stored_raw(self):
+        """Test: Si comprimir no reduce el tamaño, se guarda tal cual"""
+        stored_codec, data = compress("ñ".encode("utf-8"), "zlib")
+        assert stored_codec == "raw"
+        assert decompress(data) == "ñ"
+    
+    def test_unknown_codec(self):
+        """Test: Un algoritmo desconocido es un error"""
+        with pytest.raises(ValueError):
+            compress(b"x", "zip")
+
+
+class TestTransparentStorage:
+    """Tests del almacenamiento transparente a través del ORM"""
+    
+    def test_large_bodies_are_deduplicated(self, session_factory):
+        """Test: Los cuerpos grandes iguales comparten un blob y los pequeños van en línea"""
+        async def run():
+            created = await add_messages(session_factory, [TRACEBACK, TRACEBACK, "Hola"])
+            async with session_factory() as db:
+                loaded = (await db.execute(select(Message).order_by(Message.id))).scalars().all()
+                projected = (await db.execute(select(Message.id, Message.content).order_by(Message.id))).all()
+                blobs = (await db.execute(select(MessageBlob))).scalars().all()
+            return created, loaded, projected, blobs
+        
+        created, loaded, projected, blobs = asyncio.run(run())
+        assert [message.content for message in created] == [TRACEBACK, TRACEBACK, "Hola"]
+        assert created[0].inline_content == "" and created[0].blob_hash == created[1].blob_hash
+        assert created[2].blob_hash is None
+        assert [message.content for message in loaded] == [TRACEBACK, TRACEBACK, "Hola"]
+        assert [row.content for row in projected] == [TRACEBACK, TRACEBACK, "Hola"]
+        assert len(blobs) == 1 and blobs[0].size == len(TRACEBACK)
+        assert MessageResponse.model_validate(loaded[0]).content == TRACEBACK
+    
+    def test_search_and_blob_release(self, session_factory):
+        """Test: Los mensajes en blobs se encuentran y el blob se borra con su último mensaje"""
+        async def run():
+            await add_messages(session_factory, [TRACEBACK, TRACEBACK])
+            async with session_factory() as db:
+                found = await search_messages(db, 1, "traceback", 10)
+                await db.execute(text("DELETE FROM messages WHERE id = 1"))
+                after_first = await db.scalar(text("SELECT COUNT(*) FROM message_blobs"))
+                await db.execute(text("DELETE FROM messages WHERE id = 2"))
+                after_last = await db.scalar(text("SELECT COUNT(*) FROM message_blobs"))
+                await db.execute(text("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')"))
+                await db.commit()
+            return found, after_first, after_last
+        
+        found, after_first, after_last = asyncio.run(run())
+        assert len(found) == 2 and "<mark>Traceback</mark>" in found[0]["snippet"]
+        assert (after_first, after_last) == (1, 0)
+    
+    def test_threshold_disabled(self, session_factory, monkeypatch):
+        """Test: Con MESSAGE_BLOB_THRESHOLD=0 todo va en línea"""
+        monkeypatch.setattr(settings, "MESSAGE_BLOB_THRESHOLD", 0)
+        created = asyncio.run(add_messages(session_factory, [TRACEBACK]))
+        assert created[0].blob_hash is None and created[0].inline_content == TRACEBACK
+    
+    def test_plain_sqlite3_connection(self, session_factory, tmp_path):
+        """Test: Una conexión sqlite3 cualquiera escribe en messages sin funciones propias"""
+        asyncio.run(add_messages(session_factory, [TRACEBACK, "Hola"]))
+        conn = sqlite3.connect(tmp_path / "store.db")
+        try:
+            conn.execute("UPDATE messages SET content = 'Bosque aleatorio' WHERE content = 'Hola'")
+            conn.execute("INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'Árbol')")
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')")
+            matches = [
+                conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (term,)).fetchone()[0]
+                for term in ("traceback", "hola", "bosque", "arbol")
+            ]
+            conn.execute("DELETE FROM messages")
+            conn.commit()
+            left = conn.execute("SELECT (SELECT COUNT(*) FROM message_blobs), (SELECT COUNT(*) FROM messages_fts)").fetchone()
+        finally:
+            conn.close()
+        assert matches == [1, 0, 1, 1]
+        assert left == (0, 0)
+
+class TestCompaction:
+    """Tests del informe y la compactación de una base de datos existente"""
+    
+    def test_report_and_compact(self, tmp_path):
+        """Test: compact mueve los mensajes grandes existentes y el informe refleja el ahorro"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'existing.db'}")
+        migrations.upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"))
+            conn.execute(text("INSERT INTO conversations (id, title, user_id) VALUES (1, 'Chat', 1)"))
+            conn.execute(text(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', :content)"
+            ), [{"content": TRACEBACK}, {"content": TRACEBACK}, {"content": "Hola"}])
+        
+        before = message_store.storage_report(engine, threshold=1024)
+        estimate = message_store.estimate_compaction(engine, threshold=1024)
+        assert before["saved_bytes"] == 0
+        assert before["pending"] == {"messages": 2, "bytes": 2 * len(TRACEBACK)}
+        
+        assert message_store.compact(engine, threshold=1024, batch_size=1) == 2
+        after = message_store.storage_report(engine, threshold=1024)
+        assert after["logical_bytes"] == before["logical_bytes"]
+        assert after["saved_bytes"] == estimate["saved_bytes"] > len(TRACEBACK)
+        assert after["blobs"]["count"] == 1 and after["pending"]["messages"] == 0
+        
+        with engine.connect() as conn:
+            contents = conn.execute(select(Message.content).order_by(Message.id)).scalars().all()
+            matches = conn.execute(text(
+                "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'traceback'"
+            )).scalar()
+        assert contents == [TRACEBACK, TRACEBACK, "Hola"]
+        assert matches == 2
+        engine.dispose()
+    
+    def test_downgrade_restores_inline_content(self, tmp_path):
+        """Test: Revertir la migración devuelve el texto de los blobs a las filas"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'downgrade.db'}")
+        migrations.upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"))
+            conn.execute(text("INSERT INTO conversations (id, title, user_id) VALUES (1, 'Chat', 1)"))
+            conn.execute(text("INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', :content)"), {
+                "content": TRACEBACK
+            })
+        message_store.compact(engine, threshold=1024)
+        
+        migrations.downgrade(engine, 4)
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT content FROM messages")).scalar() == TRACEBACK
+            assert conn.execute(text(
+                "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'traceback'"
+            )).scalar() == 1
+        engine.dispose()
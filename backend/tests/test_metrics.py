@@ -0,0 +1,148 @@
+"""
+Tests de las métricas de proveedores, base de datos y cachés
+Ejecutar con: pytest backend/tests/test_metrics.py
+"""
+import asyncio
+import httpx
+import pytest
+from prometheus_client import CollectorRegistry
+from sqlalchemy import create_engine, text
+from backend.ai_router import AIRouter, Target
+from backend.ai_service import AIService
+from backend.cache import TTLCache
+from backend.config import settings
+from backend.jobs import JobQueue
+from backend.metrics import REGISTRY, CacheCollector, _request_db, instrument_engine
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """Servicio OpenAI simulado que informa del uso de tokens"""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    service = AIService()
+    service.singleflight = None
+    service.router = AIRouter([Target("openai", "metrics-model")])
+    service._clients["openai"] = httpx.AsyncClient(
+        base_url=settings.OPENAI_BASE_URL,
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={
+            "choices": [{"message": {"content": "hola"}}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 3}
+        }))
+    )
+    yield service
+    asyncio.run(service.aclose())
+
+
+class TestProviderMetrics:
+    """Tests de latencia, resultados y tokens por proveedor y modelo"""
+    
+    def test_successful_call(self, service):
+        """Test: Una llamada correcta suma latencia y tokens"""
+        labels = {"provider": "openai", "model": "metrics-model"}
+        before = sample("ai_request_duration_seconds_count", **labels)
+        prompt_before = sample("ai_tokens_total", type="prompt", **labels)
+        
+        asyncio.run(service.generate_response([{"role": "user", "content": "Hola"}]))
+        
+        assert sample("ai_request_duration_seconds_count", **labels) == before + 1
+        assert sample("ai_tokens_total", type="prompt", **labels) == prompt_before + 12
+        assert sample("ai_requests_total", outcome="ok", **labels) >= 1
+    
+    def test_failed_call(self, service):
+        """Test: Los errores del proveedor se cuentan aparte"""
+        service._clients["openai"] = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            transport=httpx.MockTransport(lambda request: httpx.Response(500))
+        )
+        labels = {"provider": "openai", "model": "metrics-model", "outcome": "error"}
+        before = sample("ai_requests_total", **labels)
+        
+        with pytest.raises(Exception):
+            asyncio.run(service.generate_response([{"role": "user", "content": "Hola"}]))
+        
+        assert sample("ai_requests_total", **labels) == before + 1
+
+
+class TestDatabaseMetrics:
+    """Tests de la instrumentación del engine"""
+    
+    def test_queries_are_counted_per_request(self):
+        """Test: Las consultas suman al acumulado de la petición en curso"""
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        before = sample("db_query_duration_seconds_count")
+        
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+                with pytest.raises(Exception):
+                    conn.execute(text("SELECT * FROM no_existe"))
+        finally:
+            _request_db.reset(token)
+        
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 3"))
+        
+        assert totals[0] == 2
+        assert totals[1] > 0
+        assert sample("db_query_duration_seconds_count") == before + 3
+    
+    def test_background_queries_are_not_counted(self):
+        """Test: Las consultas de un trabajo encolado no cuentan para la petición que lo encola"""
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        
+        def query():
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        
+        async def job():
+            query()
+            return {"ok": True}
+        
+        async def run():
+            queue = JobQueue(workers=1, max_queue=10, result_ttl=60)
+            totals = [0, 0.0]
+            token = _request_db.set(totals)
+            try:
+                query()
+                submitted = queue.submit(1, job)
+                await submitted.wait(5)
+            finally:
+                _request_db.reset(token)
+                await queue.shutdown()
+            return totals, submitted
+        
+        totals, submitted = asyncio.run(run())
+        assert submitted.result == {"ok": True}
+        assert totals[0] == 1
+
+
+class TestCacheCollector:
+    """Tests de la exposición de las cachés"""
+    
+    def test_collect_reads_stats(self):
+        """Test: Aciertos, fallos, proporción y tamaño por caché"""
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        
+        registry = CollectorRegistry()
+        collector = CacheCollector()
+        collector.register("prueba", cache.stats)
+        collector.register("desactivada", lambda: None)
+        registry.register(collector)
+        
+        assert registry.get_sample_value("app_cache_hits_total", {"cache": "prueba"}) == 1
+        assert registry.get_sample_value("app_cache_misses_total", {"cache": "prueba"}) == 1
+        assert registry.get_sample_value("app_cache_hit_ratio", {"cache": "prueba"}) == 0.5
+        assert registry.get_sample_value("app_cache_entries", {"cache": "prueba"}) == 1
+        assert registry.get_sample_value("app_cache_hits_total", {"cache": "desactivada"}) is None
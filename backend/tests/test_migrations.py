@@ -0,0 +1,149 @@
+"""
+Tests de las migraciones del esquema
+Ejecutar con: pytest backend/tests/test_migrations.py
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from backend import migrations
+from backend.migrations.versions import v0001_initial
+from backend.models import Base
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """Engine sobre una base de datos SQLite vacía"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def _search_objects(engine):
+    """Vistas, tablas virtuales y triggers del índice de búsqueda"""
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name LIKE 'messages_fts%' OR name = 'messages_search'"
+        )).fetchall())
+
+
+def _schema(engine):
+    """Columnas e índices de cada tabla de los modelos"""
+    inspector = inspect(engine)
+    return {
+        table: (
+            {column["name"] for column in inspector.get_columns(table)},
+            {index["name"] for index in inspector.get_indexes(table)}
+        )
+        for table in Base.metadata.tables
+    }
+
+
+class TestMigrations:
+    """Tests del runner de migraciones"""
+    
+    def test_upgrade_from_empty(self, db_engine):
+        """Test: upgrade aplica todas las migraciones y registra la versión"""
+        applied = migrations.upgrade(db_engine)
+        
+        assert applied == list(range(1, migrations.head_version() + 1))
+        assert migrations.check(db_engine) == migrations.head_version()
+        assert migrations.upgrade(db_engine) == []
+    
+    def test_matches_models(self, db_engine, tmp_path):
+        """Test: El esquema migrado coincide con el de los modelos"""
+        migrations.upgrade(db_engine)
+        
+        models_engine = create_engine(f"sqlite:///{tmp_path / 'models.db'}")
+        Base.metadata.create_all(models_engine)
+        try:
+            assert _schema(db_engine) == _schema(models_engine)
+            assert _search_objects(db_engine) == _search_objects(models_engine)
+        finally:
+            models_engine.dispose()
+    
+    def test_downgrade_and_upgrade_again(self, db_engine):
+        """Test: downgrade revierte las migraciones en orden inverso"""
+        migrations.upgrade(db_engine)
+        head = migrations.head_version()
+        
+        assert migrations.downgrade(db_engine, 1) == list(range(head, 1, -1))
+        with db_engine.connect() as conn:
+            assert migrations.current_version(conn) == 1
+        assert "message_count" not in {c["name"] for c in inspect(db_engine).get_columns("conversations")}
+        
+        assert migrations.upgrade(db_engine) == list(range(2, head + 1))
+    
+    def test_hot_path_indexes(self, db_engine):
+        """Test: Las consultas de historial y listado usan los índices compuestos"""
+        migrations.upgrade(db_engine)
+        
+        with db_engine.connect() as conn:
+            history_plan = conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT role, content FROM messages "
+                "WHERE conversation_id = 1 ORDER BY created_at, id"
+            )).fetchall()
+            list_plan = conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM conversations "
+                "WHERE user_id = 1 ORDER BY updated_at DESC, id DESC LIMIT 50"
+            )).fetchall()
+        
+        assert "ix_messages_conversation_created" in str(history_plan)
+        assert "ix_conversations_user_updated" in str(list_plan)
+        assert "TEMP B-TREE" not in str(history_plan) + str(list_plan)
+    
+    def test_legacy_database_is_adopted(self, db_engine):
+        """Test: Una base de datos creada antes de las migraciones se actualiza con sus datos"""
+        v0001_initial.metadata.create_all(db_engine)
+        with db_engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"))
+            conn.execute(text("INSERT INTO conversations (id, title, user_id) VALUES (1, 'Chat', 1)"))
+            conn.execute(text(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES "
+                "(1, 'user', 'Hola', '2024-01-01 10:00:00'), "
+                "(1, 'assistant', :content, '2024-01-01 10:00:01')"
+            ), {"content": "Buenas\n\n  tardes " + "x" * 150})
+        
+        migrations.upgrade(db_engine)
+        
+        with db_engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT message_count, last_message_preview FROM conversations WHERE id = 1"
+            )).one()
+        # Misma vista previa que al escribir un turno: una línea y 120 caracteres
+        assert row.message_count == 2
+        assert row.last_message_preview == "Buenas tardes " + "x" * 103 + "..."
+    
+    def test_search_index_backfilled(self, db_engine):
+        """Test: La migración indexa los mensajes existentes y los triggers los mantienen"""
+        migrations.upgrade(db_engine, target=3)
+        with db_engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'a@a.com', 'a', 'x')"))
+            conn.execute(text("INSERT INTO conversations (id, title, user_id) VALUES (1, 'Chat', 1)"))
+            conn.execute(text("INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'Árbol de decisión')"))
+        
+        migrations.upgrade(db_engine)
+        
+        query = text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH :match")
+        with db_engine.begin() as conn:
+            assert conn.execute(query, {"match": 'owner:"u1" AND arbol'}).fetchall() == [(1,)]
+            conn.execute(text("UPDATE messages SET content = 'Bosque aleatorio' WHERE id = 1"))
+            assert conn.execute(query, {"match": "arbol"}).fetchall() == []
+            assert conn.execute(query, {"match": "bosque"}).fetchall() == [(1,)]
+            conn.execute(text("DELETE FROM messages"))
+            assert conn.execute(query, {"match": "bosque"}).fetchall() == []
+            conn.execute(text("INSERT INTO messages_fts (messages_fts) VALUES ('integrity-check')"))
+    
+    def test_check_requires_upgrade(self, db_engine):
+        """Test: check falla si faltan migraciones o el esquema es más nuevo"""
+        migrations.upgrade(db_engine, target=1)
+        with pytest.raises(migrations.SchemaVersionError):
+            migrations.check(db_engine)
+        
+        migrations.upgrade(db_engine)
+        with db_engine.begin() as conn:
+            conn.execute(migrations.schema_version.insert().values(
+                version=99, description="futura", applied_at=datetime.utcnow()
+            ))
+        with pytest.raises(migrations.SchemaVersionError):
+            migrations.check(db_engine)
@@ -0,0 +1,153 @@
+"""
+Tests del proveedor de IA simulado
+Ejecutar con: pytest backend/tests/test_mock_provider.py
+"""
+import asyncio
+import pytest
+from backend.ai_router import AIRouter, Target, parse_targets
+from backend.ai_service import AIService
+from backend.mock_provider import MockProvider
+
+MESSAGES = [{"role": "user", "content": "¿Qué es el overfitting?"}]
+
+
+def instant(**kwargs) -> MockProvider:
+    """Proveedor sin esperas"""
+    return MockProvider(latency_ms=0, tokens_per_second=0, **kwargs)
+
+
+async def collect(stream) -> str:
+    return "".join([delta async for delta in stream])
+
+
+class TestResponses:
+    """Tests de las respuestas simuladas"""
+    
+    def test_deterministic(self):
+        """Test: La misma petición da la misma respuesta, aunque cambie la semilla"""
+        first = asyncio.run(instant(seed=1).generate(MESSAGES, "sistema", "m"))
+        second = asyncio.run(instant(seed=2).generate(MESSAGES, "sistema", "m"))
+        other = asyncio.run(instant().generate([{"role": "user", "content": "Otra cosa"}], "sistema", "m"))
+        assert first == second
+        assert first != other
+    
+    def test_response_size(self):
+        """Test: El número de tokens está entre min_tokens y max_tokens"""
+        provider = instant(min_tokens=5, max_tokens=8)
+        for index in range(20):
+            tokens = provider.completion([{"role": "user", "content": str(index)}], "", "m")
+            assert 5 <= len(tokens) <= 8
+    
+    def test_stream_matches_generate(self):
+        """Test: El streaming entrega en fragmentos la misma respuesta"""
+        provider = instant(min_tokens=10, max_tokens=10)
+        
+        async def run():
+            full = await provider.generate(MESSAGES, "", "m")
+            deltas = [delta async for delta in provider.stream(MESSAGES, "", "m")]
+            return full, deltas
+        
+        full, deltas = asyncio.run(run())
+        assert len(deltas) == 10
+        assert "".join(deltas) == full
+
+
+class TestLatency:
+    """Tests de la latencia y el ritmo de tokens"""
+    
+    @pytest.mark.parametrize("distribution", ["fixed", "uniform", "normal", "lognormal"])
+    def test_distributions(self, distribution):
+        """Test: Las latencias no son negativas y se centran en latency_ms"""
+        provider = MockProvider(latency_ms=100, distribution=distribution, spread=0.2, seed=3)
+        samples = sorted(provider.sample_latency() for _ in range(500))
+        assert samples[0] >= 0
+        assert 0.08 < samples[250] < 0.12
+        if distribution == "uniform":
+            assert 0.08 <= samples[0] and samples[-1] <= 0.12
+    
+    def test_invalid_distribution(self):
+        """Test: Una distribución desconocida es un error de configuración"""
+        with pytest.raises(ValueError):
+            MockProvider(distribution="pareto")
+    
+    def test_token_rate(self):
+        """Test: Sin streaming se espera la latencia más el tiempo de generación"""
+        provider = MockProvider(
+            latency_ms=20, distribution="fixed", tokens_per_second=200, min_tokens=11, max_tokens=11
+        )
+        
+        async def run():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await provider.generate(MESSAGES, "", "m")
+            return loop.time() - start
+        
+        # 20 ms hasta el primer token + 10 tokens a 200/s
+        assert asyncio.run(run()) >= 0.065
+
+
+class TestFaults:
+    """Tests de los errores y timeouts inyectados"""
+    
+    def test_error_injection(self):
+        """Test: Con error_rate=1 todas las llamadas fallan, también en streaming"""
+        provider = instant(error_rate=1.0)
+        with pytest.raises(Exception, match="error inyectado"):
+            asyncio.run(provider.generate(MESSAGES, "", "m"))
+        with pytest.raises(Exception, match="error inyectado"):
+            asyncio.run(collect(provider.stream(MESSAGES, "", "m")))
+    
+    def test_timeout_injection(self):
+        """Test: Un timeout inyectado espera `timeout` segundos y falla"""
+        provider = instant(timeout_rate=1.0, timeout=0.01)
+        with pytest.raises(Exception, match="timeout"):
+            asyncio.run(provider.generate(MESSAGES, "", "m"))
+    
+    def test_error_rate_is_seeded(self):
+        """Test: Con semilla, la secuencia de fallos se repite"""
+        async def outcomes(seed):
+            provider = instant(error_rate=0.5, seed=seed)
+            results = []
+            for _ in range(20):
+                try:
+                    await provider.generate(MESSAGES, "", "m")
+                    results.append(True)
+                except Exception:
+                    results.append(False)
+            return results
+        
+        first = asyncio.run(outcomes(7))
+        assert first == asyncio.run(outcomes(7))
+        assert True in first and False in first
+
+
+class TestService:
+    """Tests del proveedor simulado a través de AIService y el router"""
+    
+    def test_mock_target(self):
+        """Test: "mock:<modelo>" es un destino válido del router"""
+        assert parse_targets("mock:rapido") == [Target("mock", "rapido")]
+    
+    def test_generate_and_stream(self):
+        """Test: AIService genera y hace streaming con el proveedor simulado"""
+        service = AIService()
+        service.router = AIRouter([Target("mock", "m")])
+        service.mock = instant()
+        
+        async def run():
+            full = await service.generate_response(MESSAGES)
+            streamed = await collect(service.stream_response(MESSAGES))
+            return full, streamed
+        
+        full, streamed = asyncio.run(run())
+        assert full and full == streamed
+    
+    def test_faults_count_as_errors(self):
+        """Test: Los fallos simulados pasan al siguiente destino y cuentan en su salud"""
+        service = AIService()
+        service.router = AIRouter([Target("mock", "roto"), Target("mock", "sano")])
+        service.mock = instant(error_rate=1.0)
+        
+        with pytest.raises(Exception, match="error inyectado"):
+            asyncio.run(service.generate_response(MESSAGES))
+        assert all(stats.error_rate == 1.0 for stats in service.router.stats.values())
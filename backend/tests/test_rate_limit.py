@@ -0,0 +1,130 @@
+"""
+Tests de los límites de uso por usuario
+Ejecutar con: pytest backend/tests/test_rate_limit.py
+"""
+import asyncio
+import pytest
+from backend.rate_limit import (
+    InMemoryBackend, LocalSharedStore, RateLimiter, RateLimitExceeded, SharedStoreBackend
+)
+
+
+def backends():
+    """Backend en proceso y backend compartido sobre el almacén local"""
+    return [InMemoryBackend(), SharedStoreBackend(LocalSharedStore())]
+
+
+class TestBackends:
+    """Tests comunes a los backends"""
+    
+    @pytest.mark.parametrize("backend", backends())
+    def test_burst_then_wait(self, backend):
+        """Test: Se permite la ráfaga y después se indica cuánto esperar"""
+        async def run():
+            return [await backend.take("user:1", rate=1.0, burst=3) for _ in range(4)]
+        
+        waits = asyncio.run(run())
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert 0 < waits[3] <= 1.0
+    
+    @pytest.mark.parametrize("backend", backends())
+    def test_tokens_refill(self, backend):
+        """Test: Los tokens se recuperan al ritmo configurado"""
+        async def run():
+            await backend.take("user:1", rate=100.0, burst=1)
+            blocked = await backend.take("user:1", rate=100.0, burst=1)
+            await asyncio.sleep(0.02)
+            return blocked, await backend.take("user:1", rate=100.0, burst=1)
+        
+        blocked, allowed = asyncio.run(run())
+        assert blocked > 0
+        assert allowed == 0.0
+    
+    @pytest.mark.parametrize("backend", backends())
+    def test_keys_are_independent(self, backend):
+        """Test: Cada usuario tiene su propio bucket"""
+        async def run():
+            await backend.take("user:1", rate=1.0, burst=1)
+            return await backend.take("user:2", rate=1.0, burst=1)
+        
+        assert asyncio.run(run()) == 0.0
+    
+    @pytest.mark.parametrize("backend", backends())
+    def test_in_flight_cap(self, backend):
+        """Test: No se ocupan más huecos que el límite y release los libera"""
+        async def run():
+            results = [await backend.acquire("user:1", limit=2) for _ in range(3)]
+            await backend.release("user:1")
+            results.append(await backend.acquire("user:1", limit=2))
+            return results
+        
+        assert asyncio.run(run()) == [True, True, False, True]
+
+
+class TestSharedStore:
+    """Tests del backend compartido entre workers"""
+    
+    def test_workers_share_limits(self):
+        """Test: Dos workers con el mismo almacén comparten bucket y huecos"""
+        store = LocalSharedStore()
+        worker_a, worker_b = SharedStoreBackend(store), SharedStoreBackend(store)
+        
+        async def run():
+            first = await worker_a.take("user:1", rate=1.0, burst=1)
+            second = await worker_b.take("user:1", rate=1.0, burst=1)
+            await worker_a.acquire("user:1", limit=1)
+            return first, second, await worker_b.acquire("user:1", limit=1)
+        
+        first, second, slot = asyncio.run(run())
+        assert first == 0.0
+        assert second > 0
+        assert slot is False
+    
+    def test_concurrent_takes_are_atomic(self):
+        """Test: Peticiones simultáneas no consumen más tokens que la ráfaga"""
+        backend = SharedStoreBackend(LocalSharedStore())
+        
+        async def run():
+            return await asyncio.gather(*(backend.take("user:1", rate=0.1, burst=5) for _ in range(20)))
+        
+        waits = asyncio.run(run())
+        assert sum(wait == 0.0 for wait in waits) == 5
+
+
+class TestRateLimiter:
+    """Tests del limitador"""
+    
+    def test_exceeded_carries_retry_after(self):
+        """Test: Superar el ritmo lanza RateLimitExceeded con el tiempo de espera"""
+        limiter = RateLimiter(InMemoryBackend(), per_minute=60, burst=1, max_in_flight=5)
+        
+        async def run():
+            await limiter.acquire("user:1")
+            await limiter.acquire("user:1")
+        
+        with pytest.raises(RateLimitExceeded) as exc:
+            asyncio.run(run())
+        assert 0 < exc.value.retry_after <= 1.0
+        assert limiter.rejected == 1
+    
+    def test_concurrency_rejection_keeps_tokens(self):
+        """Test: Un rechazo por concurrencia no consume tokens ni deja el hueco ocupado"""
+        limiter = RateLimiter(InMemoryBackend(), per_minute=60, burst=2, max_in_flight=1)
+        
+        async def run():
+            await limiter.acquire("user:1")
+            with pytest.raises(RateLimitExceeded):
+                await limiter.acquire("user:1")
+            await limiter.release("user:1")
+            # Queda el segundo token de la ráfaga
+            await limiter.acquire("user:1")
+            await limiter.release("user:1")
+            with pytest.raises(RateLimitExceeded) as exc:
+                await limiter.acquire("user:1")
+            # Sin tokens el hueco se devuelve
+            return exc.value, await limiter.backend.acquire("user:1", 1)
+        
+        exceeded, slot_free = asyncio.run(run())
+        assert exceeded.retry_after > 0
+        assert slot_free
+        assert limiter.rejected == 2
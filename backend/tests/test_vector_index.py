@@ -0,0 +1,208 @@
+"""
+Tests del índice vectorial y la recuperación semántica
+Ejecutar con: pytest backend/tests/test_vector_index.py
+"""
+import asyncio
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from backend.models import Base
+from backend.vector_index import HashingEmbedder, SemanticIndex, VectorStore, retrieval_context
+
+embedder = HashingEmbedder(256)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sesiones sobre una base de datos SQLite temporal con dos usuarios"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'vectors.db'}")
+    
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text(
+                "INSERT INTO users (id, email, username, hashed_password) VALUES "
+                "(1, 'a@a.com', 'a', 'x'), (2, 'b@b.com', 'b', 'x')"
+            ))
+            await conn.execute(text(
+                "INSERT INTO conversations (id, title, user_id, message_count) VALUES "
+                "(1, 'Pandas', 1, 0), (2, 'Redes', 1, 0), (3, 'Ajeno', 2, 0)"
+            ))
+    
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+async def add_messages(session_factory, rows):
+    async with session_factory() as db:
+        for conversation_id, content in rows:
+            await db.execute(text(
+                "INSERT INTO messages (conversation_id, role, content) VALUES (:c, 'user', :content)"
+            ), {"c": conversation_id, "content": content})
+        await db.commit()
+
+
+class TestHashingEmbedder:
+    """Tests del embedding local"""
+    
+    def test_deterministic_and_normalized(self):
+        """Test: El mismo texto da el mismo vector, de norma 1"""
+        first, second = embedder(["Cómo agrupar un DataFrame", "cómo agrupar un dataframe"])
+        assert np.allclose(first, second)
+        assert np.isclose(np.linalg.norm(first), 1.0)
+    
+    def test_related_texts_are_closer(self):
+        """Test: Textos con palabras en común tienen más similitud"""
+        query, related, unrelated = embedder([
+            "error de memoria al leer un csv con pandas",
+            "pandas read_csv se queda sin memoria con un csv enorme",
+            "qué función de activación uso en la capa de salida"
+        ])
+        assert query @ related > query @ unrelated
+    
+    def test_empty_text(self):
+        """Test: Un texto sin palabras da un vector nulo"""
+        assert not embedder(["?!"]).any()
+
+
+class TestVectorStore:
+    """Tests de la matriz de vectores"""
+    
+    def test_top_k_scoped_to_user(self):
+        """Test: Solo se buscan los vectores del usuario, de mayor a menor similitud"""
+        store = VectorStore(256, embedder.name, initial_capacity=2)
+        texts = ["pandas groupby agregación", "pandas merge de tablas", "pandas groupby agregación"]
+        store.add(embedder(texts), user_ids=[1, 1, 2], conversation_ids=[1, 2, 3], message_ids=[10, 11, 12], fingerprints=[0, 0, 0])
+        
+        hits = store.search(embedder(["agregación con groupby en pandas"])[0], user_id=1, k=5)
+        assert [message_id for message_id, _ in hits] == [10, 11]
+        assert hits[0][1] > hits[1][1]
+        assert store.capacity >= 3
+        
+        hits = store.search(embedder(["pandas"])[0], user_id=1, k=5, exclude_conversation_id=1)
+        assert [message_id for message_id, _ in hits] == [11]
+    
+    def test_memory_mapped_persistence(self, tmp_path):
+        """Test: El índice en disco se recupera al reabrirlo y se vacía si cambia el embedder"""
+        store = VectorStore(256, embedder.name, directory=str(tmp_path), initial_capacity=1)
+        store.add(embedder(["uno", "dos"]), user_ids=[1, 1], conversation_ids=[1, 1], message_ids=[1, 2], fingerprints=[0, 0])
+        
+        reopened = VectorStore(256, embedder.name, directory=str(tmp_path))
+        assert len(reopened) == 2
+        assert reopened.last_message_id == 2
+        assert reopened.search(embedder(["dos"])[0], user_id=1, k=1)[0][0] == 2
+        
+        assert len(VectorStore(128, "otro", directory=str(tmp_path))) == 0
+
+
+class TestSemanticIndex:
+    """Tests del indexado incremental y la recuperación"""
+    
+    def test_incremental_sync_and_related(self, session_factory):
+        """Test: Indexa solo los mensajes nuevos y recupera los del usuario"""
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, session_factory, batch_size=2)
+        
+        async def run():
+            await add_messages(session_factory, [
+                (1, "Cómo leo un csv enorme con pandas sin quedarme sin memoria"),
+                (2, "Qué optimizador uso para entrenar una red neuronal"),
+                (3, "Leer un csv enorme con pandas"),
+            ])
+            first = await index.sync()
+            await add_messages(session_factory, [(2, "Tasa de aprendizaje del optimizador Adam")])
+            second = await index.sync()
+            
+            async with session_factory() as db:
+                related = await index.related(db, 1, "pandas csv enorme memoria", k=2, min_score=0.2)
+                excluded = await index.related(
+                    db, 1, "pandas csv enorme memoria", k=2, min_score=0.2, exclude_conversation_id=1
+                )
+            await index.shutdown()
+            return first, second, related, excluded
+        
+        first, second, related, excluded = asyncio.run(run())
+        assert (first, second) == (3, 1)
+        assert [snippet.conversation_id for snippet in related] == [1]
+        assert related[0].conversation_title == "Pandas"
+        assert excluded == []
+    
+    def test_deleted_messages_are_skipped(self, session_factory):
+        """Test: Un mensaje borrado no se devuelve aunque siga en la matriz"""
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, session_factory)
+        
+        async def run():
+            await add_messages(session_factory, [(1, "validación cruzada estratificada")])
+            await index.sync()
+            async with session_factory() as db:
+                await db.execute(text("DELETE FROM messages"))
+                await db.commit()
+                related = await index.related(db, 1, "validación cruzada", k=3)
+            await index.shutdown()
+            return related
+        
+        assert asyncio.run(run()) == []
+    
+    def test_deleting_newest_messages_keeps_index(self, session_factory):
+        """Test: Borrar los mensajes más recientes solo descarta sus vectores; otra base de datos reconstruye"""
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, session_factory)
+        
+        async def run():
+            await add_messages(session_factory, [(1, "pandas groupby"), (2, "red neuronal convolucional")])
+            indexed = await index.sync()
+            async with session_factory() as db:
+                await db.execute(text("DELETE FROM messages WHERE id = 2"))
+                await db.commit()
+            after_delete = await index.sync()
+            kept = len(index.store)
+            
+            async with session_factory() as db:
+                await db.execute(text("UPDATE database_instance SET id = 'otra'"))
+                await db.commit()
+            rebuilt = await index.sync()
+            await index.shutdown()
+            return indexed, after_delete, kept, rebuilt
+        
+        indexed, after_delete, kept, rebuilt = asyncio.run(run())
+        assert (indexed, after_delete, kept) == (2, 0, 1)
+        assert rebuilt == 1 and index.store.database_id == "otra"
+    
+    def test_reused_message_id_is_reindexed(self, session_factory):
+        """Test: Un mensaje nuevo que reutiliza el ID de uno borrado se indexa con su texto"""
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, session_factory)
+        
+        async def run():
+            await add_messages(session_factory, [(1, "pandas groupby"), (2, "red neuronal convolucional")])
+            await index.sync()
+            async with session_factory() as db:
+                await db.execute(text("DELETE FROM messages WHERE id = 2"))
+                await db.commit()
+            await add_messages(session_factory, [(2, "validación cruzada estratificada")])
+            reindexed = await index.sync()
+            async with session_factory() as db:
+                related = await index.related(db, 1, "validación cruzada", k=1, min_score=0.2)
+            await index.shutdown()
+            return reindexed, related
+        
+        reindexed, related = asyncio.run(run())
+        assert reindexed == 1 and len(index.store) == 2
+        assert [(snippet.message_id, snippet.content) for snippet in related] == [(2, "validación cruzada estratificada")]
+    
+    def test_retrieval_context(self, session_factory):
+        """Test: Los fragmentos se formatean y recortan para el system prompt"""
+        index = SemanticIndex(VectorStore(256, embedder.name), embedder, session_factory)
+        
+        async def run():
+            await add_messages(session_factory, [(2, "dropout " * 200)])
+            await index.sync()
+            async with session_factory() as db:
+                related = await index.related(db, 1, "dropout", k=3)
+            await index.shutdown()
+            return related
+        
+        context = retrieval_context(asyncio.run(run()), max_chars=50)
+        assert context.startswith("Fragmentos relacionados")
+        assert "[Redes] Usuario: dropout" in context
+        assert context.endswith("...")
+        assert retrieval_context([], max_chars=50) is None
@@ -0,0 +1,544 @@
+"""
+Índice vectorial local para recuperar fragmentos de conversaciones anteriores
+
+- VectorStore: matriz float32 (una fila normalizada por mensaje) y sus
+  metadatos (user_id, conversation_id, message_id) en ficheros mapeados en
+  memoria; el top-k por usuario es un producto matriz-vector de NumPy.
+- HashingEmbedder: embedding local por hashing de palabras y bigramas, sin
+  modelos ni red. Cualquier función texto -> vector con `name` y `dim`
+  puede sustituirlo (SemanticIndex(embedder=...)).
+- SemanticIndex: indexa de forma incremental los mensajes nuevos (id mayor
+  que el último indexado) en una tarea en segundo plano, fuera del camino
+  de la petición, y recupera los fragmentos más parecidos a un mensaje.
+
+El indexado sigue el orden de los IDs: en PostgreSQL, una transacción que
+confirme un ID menor después de indexarse uno mayor no se indexaría.
+
+Los mensajes borrados no se eliminan de la matriz: al recuperar, el texto se
+lee de la base de datos filtrando por usuario, así que solo se devuelven
+mensajes que siguen existiendo (y los restaurados del archivo, con su ID
+original, vuelven a estar disponibles). La excepción son los últimos: SQLite
+reutiliza el mayor rowid tras un borrado, así que cada sync comprueba que
+las filas finales sigan correspondiendo al mismo mensaje (conversación y
+huella del texto) y descarta las que no, para indexar el mensaje nuevo.
+El índice guarda el identificador de la base de datos (tabla
+database_instance) y solo se reconstruye si cambia.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .config import settings
+from .database import AsyncReadSessionLocal
+from .metrics import background_context
+from .models import Conversation, DatabaseInstance, Message
+
+# Columnas de la matriz de metadatos
+_USER, _CONVERSATION, _MESSAGE, _FINGERPRINT = range(4)
+_META_COLUMNS = 4
+
+# Versión del formato de los ficheros (otra versión se reconstruye)
+_FORMAT = 2
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_STOPWORDS = frozenset(
+    "de la el en y a que los las del un una por con para es se lo al como mas "
+    "su sus o pero si no me mi te tu yo the of and to in is it for on with as "
+    "this that be are or an at by from can how what".split()
+)
+
+
+class Embedder(Protocol):
+    """Función texto -> vector normalizado (L2) de dimensión fija"""
+    name: str
+    dim: int
+    
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder:
+    """
+    Embedding por hashing de características (feature hashing)
+    
+    Palabras sin tildes ni stopwords y bigramas de palabras consecutivas,
+    con peso 1 + log(tf) y signo aleatorio por hash para que las colisiones
+    se compensen. Determinista: el mismo texto da siempre el mismo vector.
+    """
+    
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+    
+    @staticmethod
+    def tokens(text: str) -> List[str]:
+        """Palabras en minúsculas, sin tildes ni stopwords"""
+        normalized = unicodedata.normalize("NFKD", text.lower())
+        normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+        return [
+            word for word in _WORD_RE.findall(normalized)
+            if len(word) > 1 and word not in _STOPWORDS
+        ]
+    
+    def _features(self, text: str) -> Dict[str, int]:
+        words = self.tokens(text)
+        counts: Dict[str, int] = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        return counts
+    
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                digest = int.from_bytes(
+                    hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little"
+                )
+                sign = 1.0 if digest & 1 else -1.0
+                vectors[row, (digest >> 1) % self.dim] += sign * (1.0 + math.log(count))
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+def fingerprint(text: str) -> int:
+    """Huella de 64 bits del texto de un mensaje (cabe en la matriz int64)"""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class VectorStore:
+    """
+    Matriz de vectores y metadatos que crece por bloques
+    
+    Con `directory` los datos viven en vectors.f32 / meta.i64 (np.memmap) y
+    index.json guarda dimensión, embedder, base de datos y número de filas
+    válidas. Si el embedder o la dimensión cambian, el índice se vacía y se
+    reconstruye. Sin `directory` la matriz vive solo en memoria.
+    
+    Las filas de cada usuario se guardan también en un índice en memoria,
+    así la búsqueda solo recorre las del usuario y no toda la matriz.
+    """
+    
+    def __init__(self, dim: int, embedder_name: str, directory: Optional[str] = None, initial_capacity: int = 1024):
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self.directory = directory
+        self.count = 0
+        self.capacity = 0
+        # Base de datos de la que salen los vectores (DatabaseInstance.id)
+        self.database_id: Optional[str] = None
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._meta = np.zeros((0, _META_COLUMNS), dtype=np.int64)
+        self._user_rows: Dict[int, np.ndarray] = {}
+        
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            header = self._read_header()
+            if header.get("format") == _FORMAT and header.get("dim") == dim and header.get("embedder") == embedder_name:
+                self.count = header["count"]
+                self.database_id = header.get("database")
+            else:
+                self._truncate_files()
+        self._resize(max(initial_capacity, self.count))
+        self._index_rows(0, self.count)
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+    
+    def _read_header(self) -> dict:
+        try:
+            with open(self._path("index.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _write_header(self):
+        """Se escribe después de los datos: count nunca apunta a filas sin escribir"""
+        tmp = self._path("index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({
+                "format": _FORMAT,
+                "dim": self.dim,
+                "embedder": self.embedder_name,
+                "database": self.database_id,
+                "count": self.count
+            }, f)
+        os.replace(tmp, self._path("index.json"))
+    
+    def _truncate_files(self):
+        for name in ("vectors.f32", "meta.i64"):
+            open(self._path(name), "wb").close()
+        self.count = 0
+    
+    def reset(self, database_id: Optional[str] = None):
+        """Vacía el índice y lo asocia a otra base de datos"""
+        self.count = 0
+        self.database_id = database_id
+        self._user_rows = {}
+        if self.directory:
+            self._write_header()
+    
+    def _index_rows(self, start: int, end: int):
+        """Añade las filas [start, end) al índice por usuario"""
+        users = self._meta[start:end, _USER]
+        for user_id in np.unique(users):
+            rows = start + np.flatnonzero(users == user_id)
+            previous = self._user_rows.get(int(user_id))
+            self._user_rows[int(user_id)] = rows if previous is None else np.concatenate([previous, rows])
+    
+    def _resize(self, capacity: int):
+        """Amplía la capacidad conservando las filas existentes"""
+        if self.directory:
+            for name, row_bytes in (("vectors.f32", self.dim * 4), ("meta.i64", _META_COLUMNS * 8)):
+                with open(self._path(name), "ab") as f:
+                    f.truncate(capacity * row_bytes)
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            self._meta = np.memmap(self._path("meta.i64"), dtype=np.int64, mode="r+", shape=(capacity, _META_COLUMNS))
+        else:
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            meta = np.zeros((capacity, _META_COLUMNS), dtype=np.int64)
+            vectors[:self.count] = self._vectors[:self.count]
+            meta[:self.count] = self._meta[:self.count]
+            self._vectors, self._meta = vectors, meta
+        self.capacity = capacity
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    @property
+    def last_message_id(self) -> int:
+        """ID del último mensaje indexado (se indexan en orden de ID)"""
+        return int(self._meta[self.count - 1, _MESSAGE]) if self.count else 0
+    
+    def tail(self, rows: int) -> List[Tuple[int, int, int]]:
+        """(message_id, conversation_id, huella) de las últimas `rows` filas"""
+        start = max(0, self.count - rows)
+        meta = self._meta[start:self.count]
+        return [
+            (int(row[_MESSAGE]), int(row[_CONVERSATION]), int(row[_FINGERPRINT]))
+            for row in meta
+        ]
+    
+    def truncate(self, count: int):
+        """Descarta las filas a partir de `count`"""
+        if count >= self.count:
+            return
+        self.count = count
+        self._user_rows = {
+            user_id: rows[rows < count]
+            for user_id, rows in self._user_rows.items()
+            if rows[0] < count
+        }
+        if self.directory:
+            self._write_header()
+    
+    def add(
+        self,
+        vectors: np.ndarray,
+        user_ids: Sequence[int],
+        conversation_ids: Sequence[int],
+        message_ids: Sequence[int],
+        fingerprints: Sequence[int]
+    ):
+        """Añade filas al final de la matriz"""
+        rows = len(vectors)
+        if self.count + rows > self.capacity:
+            self._resize(max(self.capacity * 2, self.count + rows))
+        
+        end = self.count + rows
+        self._vectors[self.count:end] = vectors
+        self._meta[self.count:end, _USER] = user_ids
+        self._meta[self.count:end, _CONVERSATION] = conversation_ids
+        self._meta[self.count:end, _MESSAGE] = message_ids
+        self._meta[self.count:end, _FINGERPRINT] = fingerprints
+        self._index_rows(self.count, end)
+        self.count = end
+        
+        if self.directory:
+            self._vectors.flush()
+            self._meta.flush()
+            self._write_header()
+    
+    def search(
+        self,
+        query: np.ndarray,
+        user_id: int,
+        k: int,
+        exclude_conversation_id: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Top-k por similitud coseno entre los mensajes del usuario
+        
+        Returns:
+            List[Tuple[int, float]]: (message_id, score) de mayor a menor score
+        """
+        rows = self._user_rows.get(user_id)
+        if rows is None or k <= 0:
+            return []
+        if exclude_conversation_id is not None:
+            rows = rows[self._meta[rows, _CONVERSATION] != exclude_conversation_id]
+        if not len(rows):
+            return []
+        
+        scores = self._vectors[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._meta[rows[i], _MESSAGE]), float(scores[i])) for i in top]
+
+
+@dataclass
+class RelatedSnippet:
+    """Mensaje de otra conversación parecido al mensaje actual"""
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    content: str
+    score: float
+
+
+class SemanticIndex:
+    """Indexado incremental en segundo plano y recuperación de fragmentos"""
+    
+    def __init__(
+        self,
+        store: VectorStore,
+        embedder: Embedder,
+        session_factory: async_sessionmaker = AsyncReadSessionLocal,
+        batch_size: int = 256,
+        interval: float = 5.0
+    ):
+        self.store = store
+        self.embedder = embedder
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Serializa sync() entre la tarea de fondo y las llamadas directas
+        self._lock = asyncio.Lock()
+        self.indexed = 0
+    
+    def _ensure_indexer(self):
+        """Arranca la tarea de indexado en el event loop actual la primera vez"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._indexer(), context=background_context())
+    
+    def notify(self):
+        """Avisa de que hay mensajes nuevos (no espera a que se indexen)"""
+        self._ensure_indexer()
+        self._wakeup.set()
+    
+    async def _indexer(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"[WARN] Error al indexar mensajes: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+    
+    async def _drop_replaced(self) -> int:
+        """
+        Descarta las últimas filas cuyo mensaje ya no existe o cambió de ID
+        
+        Solo mira el final de la matriz: SQLite solo reutiliza los rowid
+        mayores que el máximo actual. Lo habitual es comprobar una fila.
+        """
+        dropped = 0
+        rows = 1
+        while len(self.store):
+            tail = self.store.tail(rows)
+            async with self.session_factory() as db:
+                current = {
+                    row.id: (row.conversation_id, fingerprint(row.content))
+                    for row in (await db.execute(
+                        select(Message.id, Message.conversation_id, Message.content)
+                        .where(Message.id.in_([message_id for message_id, _, _ in tail]))
+                    )).all()
+                }
+            
+            # Última fila que sigue siendo el mismo mensaje
+            keep = len(tail)
+            while keep and current.get(tail[keep - 1][0]) != tail[keep - 1][1:]:
+                keep -= 1
+            
+            dropped += len(tail) - keep
+            self.store.truncate(len(self.store) - len(tail) + keep)
+            if keep:
+                break
+            rows = self.batch_size
+        return dropped
+    
+    async def sync(self) -> int:
+        """Indexa todos los mensajes pendientes por lotes; devuelve cuántos"""
+        total = 0
+        async with self._lock:
+            async with self.session_factory() as db:
+                database_id = await db.scalar(select(DatabaseInstance.id))
+            if database_id != self.store.database_id:
+                # El índice es de otra base de datos (o de una versión sin identificador)
+                self.store.reset(database_id)
+            else:
+                await self._drop_replaced()
+            
+            while True:
+                async with self.session_factory() as db:
+                    rows = (await db.execute(
+                        select(Message.id, Message.conversation_id, Conversation.user_id, Message.content)
+                        .join(Conversation, Conversation.id == Message.conversation_id)
+                        .where(Message.id > self.store.last_message_id)
+                        .order_by(Message.id)
+                        .limit(self.batch_size)
+                    )).all()
+                if not rows:
+                    break
+                
+                # El embedding es CPU: fuera del event loop
+                vectors = await asyncio.to_thread(self.embedder, [row.content for row in rows])
+                self.store.add(
+                    vectors,
+                    user_ids=[row.user_id for row in rows],
+                    conversation_ids=[row.conversation_id for row in rows],
+                    message_ids=[row.id for row in rows],
+                    fingerprints=[fingerprint(row.content) for row in rows]
+                )
+                total += len(rows)
+        
+        self.indexed += total
+        return total
+    
+    async def related(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        text: str,
+        k: int,
+        min_score: float = 0.0,
+        exclude_conversation_id: Optional[int] = None
+    ) -> List[RelatedSnippet]:
+        """Mensajes del usuario más parecidos a `text`, de otras conversaciones"""
+        if not len(self.store):
+            return []
+        
+        # El embedding es CPU: fuera del event loop
+        query = (await asyncio.to_thread(self.embedder, [text]))[0]
+        # Margen por si algún mensaje indexado ya no existe
+        hits = [
+            (message_id, score)
+            for message_id, score in self.store.search(query, user_id, k * 2, exclude_conversation_id)
+            if score >= min_score
+        ]
+        if not hits:
+            return []
+        
+        rows = (await db.execute(
+            select(Message.id, Message.conversation_id, Message.role, Message.content, Conversation.title)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Message.id.in_([message_id for message_id, _ in hits]), Conversation.user_id == user_id)
+        )).all()
+        found = {row.id: row for row in rows}
+        
+        return [
+            RelatedSnippet(
+                message_id=message_id,
+                conversation_id=found[message_id].conversation_id,
+                conversation_title=found[message_id].title,
+                role=found[message_id].role,
+                content=found[message_id].content,
+                score=score
+            )
+            for message_id, score in hits if message_id in found
+        ][:k]
+    
+    async def shutdown(self):
+        """Detiene la tarea de indexado"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._loop = None
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "vectors": len(self.store),
+            "last_message_id": self.store.last_message_id,
+            "indexed": self.indexed
+        }
+
+
+def retrieval_context(snippets: Sequence[RelatedSnippet], max_chars: int) -> Optional[str]:
+    """Texto para el system prompt con los fragmentos recuperados"""
+    if not snippets:
+        return None
+    
+    lines = ["Fragmentos relacionados de conversaciones anteriores del usuario:"]
+    for snippet in snippets:
+        content = " ".join(snippet.content.split())
+        if len(content) > max_chars:
+            content = content[:max_chars - 3] + "..."
+        author = "Usuario" if snippet.role == "user" else "Asistente"
+        lines.append(f"- [{snippet.conversation_title}] {author}: {content}")
+    return "\n".join(lines)
+
+
+def notify_new_messages():
+    """Avisa al indexador de que se guardaron mensajes (no-op si está desactivado)"""
+    if semantic_index is not None:
+        semantic_index.notify()
+
+
+async def retrieve_context(
+    db: AsyncSession,
+    user_id: int,
+    text: str,
+    exclude_conversation_id: Optional[int] = None
+) -> Optional[str]:
+    """Contexto recuperado para un mensaje (None si la recuperación está desactivada)"""
+    if semantic_index is None:
+        return None
+    
+    snippets = await semantic_index.related(
+        db,
+        user_id,
+        text,
+        k=settings.RETRIEVAL_TOP_K,
+        min_score=settings.RETRIEVAL_MIN_SCORE,
+        exclude_conversation_id=exclude_conversation_id
+    )
+    return retrieval_context(snippets, settings.RETRIEVAL_SNIPPET_CHARS)
+
+
+# Instancia global (None si la recuperación semántica está desactivada)
+semantic_index: Optional[SemanticIndex] = None
+if settings.RETRIEVAL_ENABLED:
+    _embedder = HashingEmbedder(settings.VECTOR_INDEX_DIM)
+    semantic_index = SemanticIndex(
+        store=VectorStore(settings.VECTOR_INDEX_DIM, _embedder.name, directory=settings.VECTOR_INDEX_PATH or None),
+        embedder=_embedder,
+        batch_size=settings.VECTOR_INDEX_BATCH,
+        interval=settings.VECTOR_INDEX_INTERVAL
+    )
@@ -0,0 +1,108 @@
+"""
+Proveedor de IA falso compatible con la API de OpenAI (/v1/chat/completions)
+
+Envoltorio HTTP fino sobre backend.mock_provider.MockProvider: el contenido,
+la latencia, el ritmo de tokens y los fallos son los del proveedor simulado
+integrado y se configuran con las mismas variables MOCK_AI_*. Lo arranca
+benchmarks/load_test.py (--provider http) para que la app lo use como un
+proveedor real (OPENAI_BASE_URL) y se ejerciten el pool HTTP, el router y el
+streaming SSE; los fallos inyectados se devuelven como 503.
+
+Uso:
+    MOCK_AI_LATENCY_MS=300 python benchmarks/fake_provider.py --port 9100
+"""
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.mock_provider import MockProvider  # noqa: E402
+
+
+def create_app(provider: MockProvider) -> Starlette:
+    def split(payload: dict) -> tuple:
+        """System prompt y resto de la conversación, como los recibe MockProvider"""
+        system_prompt = "\n".join(msg["content"] for msg in payload["messages"] if msg["role"] == "system")
+        messages = [msg for msg in payload["messages"] if msg["role"] != "system"]
+        return messages, system_prompt
+    
+    def usage(payload: dict, completion_tokens: int) -> dict:
+        prompt_tokens = sum(len(message["content"].split()) for message in payload["messages"])
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+    
+    def error(e: Exception) -> JSONResponse:
+        return JSONResponse({"error": {"message": str(e)}}, status_code=503)
+    
+    async def completions(request: Request):
+        payload = await request.json()
+        messages, system_prompt = split(payload)
+        model = payload["model"]
+        
+        if not payload.get("stream"):
+            try:
+                content = await provider.generate(messages, system_prompt, model)
+            except Exception as e:
+                return error(e)
+            return JSONResponse({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(payload, len(content.split())),
+            })
+        
+        # Los fallos ocurren antes del primer token: esperarlo para poder responder 503
+        tokens = provider.stream(messages, system_prompt, model)
+        try:
+            first = await tokens.__anext__()
+        except Exception as e:
+            return error(e)
+        
+        async def events():
+            count = 0
+            async for token in _prepend(first, tokens):
+                count += 1
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield f"data: {json.dumps({'choices': [], 'usage': usage(payload, count)})}\n\n"
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    return Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+async def _prepend(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proveedor de IA falso compatible con OpenAI (MOCK_AI_* por entorno)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(create_app(MockProvider.from_settings()), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark: lectura y serialización de historiales largos
+
+Genera una base de datos SQLite migrada con una conversación de N mensajes
+(por defecto 10.000, una parte por encima de MESSAGE_BLOB_THRESHOLD) y mide,
+para el historial completo o una página, el camino anterior y el actual de
+GET /api/chat/history/{id}:
+
+- orm+pydantic: objetos del ORM, MessageResponse.from_orm por fila,
+  jsonable_encoder y json.dumps (JSONResponse)
+- filas+orjson: solo las columnas de MessageResponse, dicts y ORJSONResponse
+- filas+msgpack: las mismas filas en MessagePack (Accept: application/msgpack)
+
+Uso:
+    python benchmarks/history_serialization.py --messages 10000
+    python benchmarks/history_serialization.py --messages 10000 --limit 200
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from sqlalchemy import create_engine, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from backend import migrations  # noqa: E402
+from backend.database import configure_connections  # noqa: E402
+from backend.models import MESSAGE_RESPONSE_COLUMNS, Message  # noqa: E402
+from backend.responses import MsgPackResponse  # noqa: E402
+from backend.schemas import MessageResponse  # noqa: E402
+
+WORDS = (
+    "modelo datos entrenamiento validación red neuronal regresión árbol bosque gradiente "
+    "pérdida métrica precisión sesgo varianza embedding vector pandas numpy tensor capa "
+    "activación optimizador overfitting regularización dropout batch época aprendizaje"
+).split()
+
+
+def populate(path: str, args):
+    """Base de datos migrada con una conversación de args.messages mensajes"""
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine)
+    rng = random.Random(42)
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, username, hashed_password) VALUES (1, 'u@example.com', 'u', 'x')"
+        ))
+        conn.execute(text(
+            "INSERT INTO conversations (id, title, user_id, message_count) VALUES (1, 'Bench', 1, :count)"
+        ), {"count": args.messages})
+    
+    # Por el ORM, para que los mensajes grandes vayan a blobs como en la app
+    start = datetime(2024, 1, 1)
+    with Session(engine) as db:
+        for index in range(args.messages):
+            length = rng.randint(300, 600) if rng.random() < args.large else rng.randint(10, 120)
+            db.add(Message(
+                conversation_id=1,
+                role="user" if index % 2 == 0 else "assistant",
+                content=" ".join(rng.choices(WORDS, k=length)),
+                created_at=start + timedelta(seconds=index)
+            ))
+            if index % 2000 == 1999:
+                db.commit()
+        db.commit()
+    engine.dispose()
+
+
+def _page(stmt, limit: int):
+    stmt = stmt.where(Message.conversation_id == 1).order_by(Message.created_at.desc(), Message.id.desc())
+    return stmt.limit(limit) if limit else stmt
+
+
+async def orm_pydantic(db, limit: int):
+    messages = list(await db.scalars(_page(select(Message), limit)))
+    query_done = time.perf_counter()
+    payload = {
+        "conversation_id": 1,
+        "title": "Bench",
+        "messages": [MessageResponse.from_orm(msg) for msg in reversed(messages)],
+        "next_cursor": None
+    }
+    return query_done, JSONResponse(jsonable_encoder(payload)).body
+
+
+async def rows_payload(db, limit: int):
+    rows = (await db.execute(_page(select(*MESSAGE_RESPONSE_COLUMNS), limit))).all()
+    query_done = time.perf_counter()
+    return query_done, {
+        "conversation_id": 1,
+        "title": "Bench",
+        "messages": [row._asdict() for row in reversed(rows)],
+        "next_cursor": None
+    }
+
+
+async def rows_orjson(db, limit: int):
+    query_done, payload = await rows_payload(db, limit)
+    return query_done, ORJSONResponse(payload).body
+
+
+async def rows_msgpack(db, limit: int):
+    query_done, payload = await rows_payload(db, limit)
+    return query_done, MsgPackResponse(payload).body
+
+
+VARIANTS = {
+    "orm+pydantic": orm_pydantic,
+    "filas+orjson": rows_orjson,
+    "filas+msgpack": rows_msgpack,
+}
+
+
+async def measure(path: str, args) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    configure_connections(engine.sync_engine, read_only=True)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    results = {}
+    
+    for label, variant in VARIANTS.items():
+        totals, queries, serializations = [], [], []
+        for attempt in range(args.repeat + 1):
+            # Sesión nueva por petición, como en las rutas (sin identity map previo)
+            async with session_factory() as db:
+                start = time.perf_counter()
+                query_done, body = await variant(db, args.limit)
+                end = time.perf_counter()
+            if attempt == 0:
+                continue  # calentamiento
+            totals.append((end - start) * 1000)
+            queries.append((query_done - start) * 1000)
+            serializations.append((end - query_done) * 1000)
+        results[label] = {
+            "p50_ms": round(statistics.median(totals), 2),
+            "query_p50_ms": round(statistics.median(queries), 2),
+            "serialize_p50_ms": round(statistics.median(serializations), 2),
+            "bytes": len(body),
+        }
+    
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lectura y serialización de historiales largos")
+    parser.add_argument("--messages", type=int, default=10_000, help="Mensajes de la conversación")
+    parser.add_argument("--limit", type=int, default=0, help="Mensajes por página (0 = historial completo)")
+    parser.add_argument("--large", type=float, default=0.05, help="Proporción de mensajes grandes (en blobs)")
+    parser.add_argument("--repeat", type=int, default=20, help="Mediciones por variante")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="history-bench-")
+    path = os.path.join(workdir, "bench.db")
+    try:
+        populate(path, args)
+        results = asyncio.run(measure(path, args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    baseline = results["orm+pydantic"]["p50_ms"]
+    print(f"{args.messages} mensajes, página de {args.limit or args.messages}\n")
+    print(f"{'variante':<15}{'p50 ms':>9}{'consulta':>10}{'serializ.':>11}{'KB':>9}{'vs orm':>8}")
+    for label, result in results.items():
+        print(
+            f"{label:<15}{result['p50_ms']:>9}{result['query_p50_ms']:>10}"
+            f"{result['serialize_p50_ms']:>11}{result['bytes'] / 1024:>9.0f}"
+            f"{baseline / result['p50_ms']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
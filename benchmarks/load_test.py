@@ -0,0 +1,490 @@
+"""
+Prueba de carga: tráfico mixto contra la API completa con un proveedor de IA falso
+
+Arranca la app (uvicorn, base de datos SQLite temporal) en un subproceso con
+el proveedor simulado (backend/mock_provider.py) detrás de un servidor HTTP
+compatible con OpenAI (--provider http, benchmarks/fake_provider.py) o
+dentro de la propia app (--provider mock, AI_PROVIDER=mock), registra
+un grupo de usuarios y reparte durante --duration segundos peticiones de
+registro, login, listado, chat, streaming, historial y búsqueda entre
+--concurrency clientes concurrentes, según los pesos de --mix.
+
+Informa de peticiones por segundo y p50/p95/p99 por endpoint. Con --output
+guarda los resultados en JSON; con --compare los compara con una ejecución
+anterior y termina con código 1 si algún endpoint empeora más de
+--max-regression.
+
+Uso:
+    python benchmarks/load_test.py --concurrency 32 --duration 30 --output base.json
+    python benchmarks/load_test.py --concurrency 32 --duration 30 --compare base.json
+    python benchmarks/load_test.py --env GROUP_COMMIT_ENABLED=true --mix chat=1
+    python benchmarks/load_test.py --provider mock --ai-tokens-per-second 50
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = "list=30,history=25,chat=20,stream=5,search=10,login=8,register=2"
+
+PROMPTS = (
+    "¿Cómo evito el overfitting en una red neuronal pequeña?",
+    "Explícame la diferencia entre precisión y recall",
+    "¿Qué optimizador uso para entrenar un modelo de regresión?",
+    "Cómo leo un csv enorme con pandas sin quedarme sin memoria",
+    "¿Para qué sirve la validación cruzada estratificada?",
+)
+SEARCH_TERMS = ("modelo", "pandas", "red neuronal", "validación", "optimizador", "overfit")
+
+# Hashing Argon2 barato para que el registro no domine la prueba (--fast-hashing)
+FAST_HASHING_ENV = {"ARGON2_TIME_COST": "1", "ARGON2_MEMORY_COST": "8192", "ARGON2_PARALLELISM": "1"}
+
+
+@dataclass
+class VirtualUser:
+    email: str
+    password: str
+    token: str = ""
+    conversations: list = field(default_factory=list)
+    
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class Recorder:
+    """Latencias y errores por endpoint a partir del final del calentamiento"""
+    
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.start = None
+    
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool):
+        if self.start is None or time.perf_counter() < self.start:
+            return
+        self.samples.setdefault(endpoint, []).append(elapsed_ms)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.users = []
+        self.counter = 0
+    
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+    
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            if endpoint == "stream":
+                async with self.client.stream(method, url, **kwargs) as response:
+                    await response.aread()
+                ok = response.status_code < 400 and b"event: error" not in response.content
+            else:
+                response = await self.client.request(method, url, **kwargs)
+                ok = response.status_code < 400
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, (time.perf_counter() - start) * 1000, False)
+            return None
+        self.recorder.record(endpoint, (time.perf_counter() - start) * 1000, ok)
+        return response if ok else None
+    
+    def message(self) -> str:
+        return f"{self.rng.choice(PROMPTS)} (#{self.next_id()})"
+    
+    # ===== ACCIONES =====
+    
+    async def register(self, _user=None):
+        index = self.next_id()
+        user = VirtualUser(email=f"load{index}@example.com", password="load-test-password")
+        response = await self.request("register", "POST", "/api/auth/register", json={
+            "email": user.email, "username": f"load{index}", "password": user.password
+        })
+        if response is not None and await self.login(user):
+            self.users.append(user)
+    
+    async def login(self, user: VirtualUser) -> bool:
+        response = await self.request("login", "POST", "/api/auth/login", json={
+            "email": user.email, "password": user.password
+        })
+        if response is None:
+            return False
+        user.token = response.json()["access_token"]
+        return True
+    
+    async def list_conversations(self, user: VirtualUser):
+        await self.request("list", "GET", "/api/conversations/", headers=user.headers)
+    
+    async def chat(self, user: VirtualUser):
+        # Una de cada cinco veces abre una conversación nueva
+        conversation_id = None
+        if user.conversations and self.rng.random() > 0.2:
+            conversation_id = self.rng.choice(user.conversations)
+        response = await self.request("chat", "POST", "/api/chat/", headers=user.headers, json={
+            "message": self.message(), "conversation_id": conversation_id
+        })
+        if response is not None and conversation_id is None:
+            user.conversations.append(response.json()["conversation_id"])
+    
+    async def stream(self, user: VirtualUser):
+        conversation_id = self.rng.choice(user.conversations) if user.conversations else None
+        await self.request("stream", "POST", "/api/chat/stream", headers=user.headers, json={
+            "message": self.message(), "conversation_id": conversation_id
+        })
+    
+    async def history(self, user: VirtualUser):
+        if not user.conversations:
+            return await self.chat(user)
+        conversation_id = self.rng.choice(user.conversations)
+        await self.request("history", "GET", f"/api/chat/history/{conversation_id}", headers=user.headers)
+    
+    async def search(self, user: VirtualUser):
+        await self.request(
+            "search", "GET", "/api/search", headers=user.headers,
+            params={"q": self.rng.choice(SEARCH_TERMS)}
+        )
+    
+    # ===== EJECUCIÓN =====
+    
+    async def setup(self):
+        """Usuarios iniciales con una conversación cada uno (no se mide)"""
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        
+        async def prepare():
+            async with semaphore:
+                await self.register()
+        
+        await asyncio.gather(*(prepare() for _ in range(self.args.users)))
+        if not self.users:
+            raise RuntimeError("No se pudo registrar ningún usuario")
+        
+        async def first_chat(user):
+            async with semaphore:
+                await self.chat(user)
+        
+        await asyncio.gather(*(first_chat(user) for user in list(self.users)))
+    
+    async def run(self, mix: dict) -> float:
+        actions = {
+            "register": self.register,
+            "login": self.login,
+            "list": self.list_conversations,
+            "chat": self.chat,
+            "stream": self.stream,
+            "history": self.history,
+            "search": self.search,
+        }
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        now = time.perf_counter()
+        self.recorder.start = now + self.args.warmup
+        deadline = self.recorder.start + self.args.duration
+        
+        async def worker():
+            while time.perf_counter() < deadline:
+                action = self.rng.choices(names, weights)[0]
+                await actions[action](self.rng.choice(self.users))
+        
+        await asyncio.gather(*(worker() for _ in range(self.args.concurrency)))
+        return time.perf_counter() - self.recorder.start
+
+
+# ===== RESULTADOS =====
+
+def percentile(ordered: list, p: float) -> float:
+    """Percentil por rango más cercano de una lista ordenada"""
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(timings: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(timings)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "p50_ms": round(percentile(ordered, 50), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "p99_ms": round(percentile(ordered, 99), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def build_results(recorder: Recorder, elapsed: float, args) -> dict:
+    endpoints = {
+        endpoint: summarize(timings, recorder.errors.get(endpoint, 0), elapsed)
+        for endpoint, timings in sorted(recorder.samples.items())
+    }
+    all_timings = [t for timings in recorder.samples.values() for t in timings]
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "elapsed_seconds": round(elapsed, 2),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "total": summarize(all_timings, sum(recorder.errors.values()), elapsed) if all_timings else {},
+        "endpoints": endpoints,
+    }
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> list:
+    """Endpoints que empeoran (p95 o p99 más altos, o menos peticiones por segundo)"""
+    regressions = []
+    base_config = baseline.get("meta", {}).get("config", {})
+    changed = [
+        key for key, value in current["meta"]["config"].items()
+        if key in base_config and base_config[key] != value
+    ]
+    if changed:
+        print(f"\nAviso: la configuración difiere de la referencia ({', '.join(changed)})")
+    print(f"\n{'endpoint':<10}{'p95 base':>10}{'p95 ahora':>11}{'Δ':>8}{'rps base':>10}{'rps ahora':>11}{'Δ':>8}")
+    for endpoint, result in current["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base is None:
+            continue
+        p95_change = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        p99_change = result["p99_ms"] / base["p99_ms"] - 1 if base["p99_ms"] else 0.0
+        rps_change = result["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        print(
+            f"{endpoint:<10}{base['p95_ms']:>10}{result['p95_ms']:>11}{p95_change:>+8.0%}"
+            f"{base['rps']:>10}{result['rps']:>11}{rps_change:>+8.0%}"
+        )
+        if p95_change > max_regression:
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if p99_change > max_regression:
+            regressions.append(f"{endpoint}: p99 {base['p99_ms']} -> {result['p99_ms']} ms")
+        if rps_change < -max_regression:
+            regressions.append(f"{endpoint}: {base['rps']} -> {result['rps']} peticiones/s")
+    return regressions
+
+
+def print_results(results: dict):
+    meta = results["meta"]
+    print(f"\n{meta['elapsed_seconds']}s medidos (commit {meta['commit'] or '?'})\n")
+    print(f"{'endpoint':<10}{'peticiones':>11}{'errores':>9}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    rows = list(results["endpoints"].items())
+    if results["total"]:
+        rows.append(("total", results["total"]))
+    for endpoint, result in rows:
+        print(
+            f"{endpoint:<10}{result['requests']:>11}{result['errors']:>9}{result['rps']:>8}"
+            f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+        )
+
+
+# ===== PROCESOS =====
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"register", "login", "list", "chat", "stream", "history", "search"}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Acciones desconocidas en --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El proceso terminó al arrancar (código {process.returncode})")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} no responde tras {timeout}s")
+
+
+def provider_env(args) -> tuple:
+    """
+    Variables de entorno del proveedor de IA y, con --provider http, su proceso
+    
+    En los dos casos responde backend.mock_provider con los mismos MOCK_AI_*:
+    - http: benchmarks/fake_provider.py por HTTP (ejercita el pool y el SSE)
+    - mock: AI_PROVIDER=mock dentro de la app (sin proceso ni sockets extra)
+    """
+    mock_env = {
+        "MOCK_AI_LATENCY_MS": str(args.ai_latency_ms),
+        "MOCK_AI_LATENCY_DISTRIBUTION": "normal",
+        "MOCK_AI_LATENCY_SPREAD": str(args.ai_jitter_ms / args.ai_latency_ms if args.ai_latency_ms else 0),
+        "MOCK_AI_TOKENS_PER_SECOND": str(args.ai_tokens_per_second),
+        "MOCK_AI_MIN_TOKENS": str(max(1, args.ai_words // 2)),
+        "MOCK_AI_MAX_TOKENS": str(max(1, args.ai_words * 3 // 2)),
+        "MOCK_AI_ERROR_RATE": str(args.ai_error_rate),
+        "MOCK_AI_SEED": str(args.seed),
+    }
+    if args.provider == "mock":
+        return None, {"AI_PROVIDER": "mock", **mock_env}
+    
+    provider_port = free_port()
+    provider = subprocess.Popen([
+        sys.executable, str(ROOT / "benchmarks" / "fake_provider.py"),
+        "--port", str(provider_port),
+    ], env={**os.environ, **mock_env})
+    try:
+        wait_until_ready(f"http://127.0.0.1:{provider_port}/", provider)
+    except Exception:
+        stop_processes([provider])
+        raise
+    return provider, {
+        "AI_PROVIDER": "openai",
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{provider_port}",
+    }
+
+
+def start_processes(args, workdir: str) -> tuple:
+    """Proveedor de IA y app; devuelve los procesos y la URL base de la API"""
+    provider, ai_env = provider_env(args)
+    processes = [provider] if provider else []
+    
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "DB_AUTO_MIGRATE": "true",
+        "AI_PROVIDERS": "",
+        **ai_env,
+        "RATE_LIMIT_ENABLED": "false",
+        "VECTOR_INDEX_PATH": os.path.join(workdir, "vector_index"),
+        **(FAST_HASHING_ENV if args.fast_hashing else {}),
+    }
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    
+    app_port = free_port()
+    processes.append(subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "backend.main:app",
+        "--host", "127.0.0.1", "--port", str(app_port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ], cwd=ROOT, env=env))
+    
+    try:
+        wait_until_ready(f"http://127.0.0.1:{app_port}/health", processes[-1])
+    except Exception:
+        stop_processes(processes)
+        raise
+    return processes, f"http://127.0.0.1:{app_port}"
+
+
+def stop_processes(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def drive(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        load = LoadTest(client, args)
+        await load.setup()
+        elapsed = await load.run(args.mix)
+    return build_results(load.recorder, elapsed, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con tráfico mixto y proveedor de IA falso")
+    parser.add_argument("--concurrency", type=int, default=32, help="Clientes simultáneos")
+    parser.add_argument("--duration", type=float, default=30, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=5, help="Segundos de calentamiento (no se miden)")
+    parser.add_argument("--users", type=int, default=50, help="Usuarios registrados antes de empezar")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Pesos por acción ({DEFAULT_MIX})")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn")
+    parser.add_argument(
+        "--provider", choices=("http", "mock"), default="http",
+        help="http: proveedor simulado tras un servidor compatible con OpenAI; mock: AI_PROVIDER=mock en la app"
+    )
+    parser.add_argument("--ai-latency-ms", type=float, default=300, help="Latencia media del proveedor simulado")
+    parser.add_argument("--ai-jitter-ms", type=float, default=100, help="Desviación típica de esa latencia")
+    parser.add_argument("--ai-words", type=int, default=150, help="Palabras medias por respuesta")
+    parser.add_argument("--ai-tokens-per-second", type=float, default=0, help="Ritmo del streaming (0 = sin pausa)")
+    parser.add_argument("--ai-error-rate", type=float, default=0.0, help="Proporción de fallos del proveedor")
+    parser.add_argument("--fast-hashing", action="store_true", help="Argon2 barato para registro y login")
+    parser.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR", help="Ajuste extra de la app (repetible)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Guardar los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Empeoramiento tolerado (0.10 = 10%%)")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    try:
+        processes, base_url = start_processes(args, workdir)
+        try:
+            results = asyncio.run(drive(base_url, args))
+        finally:
+            stop_processes(processes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+    
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegresiones:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nSin regresiones")
+
+
+if __name__ == "__main__":
+    main()
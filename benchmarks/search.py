@@ -0,0 +1,157 @@
+"""
+Benchmark: latencia de la búsqueda de texto completo (GET /api/search)
+
+Genera una base de datos SQLite migrada con N mensajes repartidos entre
+varios usuarios y mide la consulta de backend.search para términos
+frecuentes, raros y prefijos.
+
+Uso:
+    python benchmarks/search.py --messages 1000000 --users 1000
+"""
+from itertools import accumulate
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from backend import migrations  # noqa: E402
+from backend.database import configure_connections  # noqa: E402
+from backend.search import search_messages  # noqa: E402
+
+# Palabras de contenido habituales a partir del rango 20 de una distribución de
+# Zipf sobre VOCABULARY_SIZE palabras (las 20 primeras hacen de stopwords)
+CONTENT_WORDS = (
+    "modelo datos entrenamiento validación red neuronal regresión árbol bosque "
+    "gradiente pérdida métrica precisión recall sesgo varianza clúster embedding "
+    "vector consulta python pandas numpy tensor capa activación función optimizador "
+    "overfitting underfitting regularización dropout batch época aprendizaje"
+).split()
+VOCABULARY_SIZE = 20_000
+VOCABULARY = [f"w{rank}" for rank in range(20)] + CONTENT_WORDS + [
+    f"t{rank}" for rank in range(20 + len(CONTENT_WORDS), VOCABULARY_SIZE)
+]
+CUM_WEIGHTS = list(accumulate(1 / rank ** 1.07 for rank in range(1, VOCABULARY_SIZE + 1)))
+RARE = "heterocedasticidad"
+
+QUERIES = {
+    "stopword": "w0",
+    "frecuente": "modelo",
+    "dos términos": "red neuronal",
+    "prefijo": "regulari",
+    "raro": RARE,
+}
+
+
+def populate(path: str, args):
+    """Base de datos migrada con los mensajes de prueba"""
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine)
+    rng = random.Random(42)
+    conversations = args.users * args.conversations
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, username, hashed_password, is_active) "
+            "VALUES (:id, :email, :username, 'x', 1)"
+        ), [{"id": u, "email": f"u{u}@example.com", "username": f"u{u}"} for u in range(1, args.users + 1)])
+        conn.execute(text(
+            "INSERT INTO conversations (id, title, user_id, message_count) VALUES (:id, 'Bench', :user_id, 0)"
+        ), [{"id": c, "user_id": (c - 1) % args.users + 1} for c in range(1, conversations + 1)])
+    
+    batch = []
+    with engine.begin() as conn:
+        for index in range(args.messages):
+            words = rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(8, 60))
+            if rng.random() < 0.001:
+                words.append(RARE)
+            batch.append({
+                "conversation_id": rng.randint(1, conversations),
+                "role": "user" if index % 2 == 0 else "assistant",
+                "content": " ".join(words),
+            })
+            if len(batch) == 10_000:
+                conn.execute(text(
+                    "INSERT INTO messages (conversation_id, role, content, created_at) "
+                    "VALUES (:conversation_id, :role, :content, CURRENT_TIMESTAMP)"
+                ), batch)
+                batch = []
+        if batch:
+            conn.execute(text(
+                "INSERT INTO messages (conversation_id, role, content, created_at) "
+                "VALUES (:conversation_id, :role, :content, CURRENT_TIMESTAMP)"
+            ), batch)
+        conn.execute(text("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')"))
+    engine.dispose()
+
+
+async def measure(path: str, args) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    configure_connections(engine.sync_engine, read_only=True)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    rng = random.Random(7)
+    results = {}
+    
+    async with session_factory() as db:
+        for label, query in QUERIES.items():
+            timings = []
+            for _ in range(args.repeat):
+                user_id = rng.randint(1, args.users)
+                start = time.perf_counter()
+                await search_messages(db, user_id, query, args.limit)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[label] = {
+                "query": query,
+                "p50_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+                "max_ms": round(timings[-1], 2),
+            }
+    
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de la búsqueda de texto completo")
+    parser.add_argument("--messages", type=int, default=200_000, help="Mensajes totales")
+    parser.add_argument("--users", type=int, default=1000, help="Usuarios")
+    parser.add_argument("--conversations", type=int, default=10, help="Conversaciones por usuario")
+    parser.add_argument("--limit", type=int, default=20, help="Resultados por búsqueda")
+    parser.add_argument("--repeat", type=int, default=200, help="Búsquedas por consulta")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix="search-bench-")
+    path = os.path.join(workdir, "bench.db")
+    try:
+        start = time.perf_counter()
+        populate(path, args)
+        build_seconds = time.perf_counter() - start
+        results = asyncio.run(measure(path, args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.json:
+        print(json.dumps({"build_seconds": round(build_seconds, 1), "queries": results}, indent=2))
+        return
+    
+    print(f"{args.messages} mensajes, {args.users} usuarios (carga + índice en {build_seconds:.1f}s)\n")
+    print(f"{'consulta':<14}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for label, result in results.items():
+        print(f"{label:<14}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['max_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark: lecturas de historial con escrituras de chat concurrentes en SQLite
+
+Compara el perfil "default" (journal de rollback, un solo pool) con el perfil
+"production" (WAL, pragmas y pool de solo lectura aparte) sobre una base de
+datos temporal con el esquema de las migraciones.
+
+Uso:
+    python benchmarks/sqlite_concurrency.py --writers 4 --readers 8 --duration 5
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from backend import migrations  # noqa: E402
+from backend.database import configure_connections  # noqa: E402
+
+HISTORY_QUERY = text(
+    "SELECT role, content FROM messages WHERE conversation_id = :cid "
+    "ORDER BY created_at DESC, id DESC LIMIT 50"
+)
+INSERT_MESSAGE = text(
+    "INSERT INTO messages (conversation_id, role, content, created_at) "
+    "VALUES (:cid, 'user', :content, :now)"
+)
+UPDATE_CONVERSATION = text(
+    "UPDATE conversations SET message_count = message_count + 1, "
+    "last_message_at = :now, updated_at = :now WHERE id = :cid"
+)
+
+
+def seed(path: str, conversations: int, messages: int):
+    """Crea el esquema y un historial inicial"""
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(engine)
+    now = datetime.utcnow()
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, username, hashed_password, is_active) "
+            "VALUES (1, 'bench@example.com', 'bench', 'x', 1)"
+        ))
+        conn.execute(
+            text("INSERT INTO conversations (id, title, user_id, created_at, updated_at, message_count) "
+                 "VALUES (:id, 'Bench', 1, :now, :now, 0)"),
+            [{"id": cid, "now": now} for cid in range(1, conversations + 1)]
+        )
+        conn.execute(INSERT_MESSAGE, [
+            {"cid": random.randint(1, conversations), "content": "x" * 200, "now": now}
+            for _ in range(messages)
+        ])
+    engine.dispose()
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def run_profile(profile: str, args) -> dict:
+    """Ejecuta lectores y escritores concurrentes durante args.duration segundos"""
+    workdir = tempfile.mkdtemp(prefix="sqlite-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seed(path, args.conversations, args.messages)
+    url = f"sqlite+aiosqlite:///{path}"
+    
+    write_engine = create_async_engine(url, pool_size=args.writers)
+    configure_connections(write_engine.sync_engine, profile=profile)
+    if profile == "production":
+        read_engine = create_async_engine(url, pool_size=args.readers)
+        configure_connections(read_engine.sync_engine, profile=profile, read_only=True)
+    else:
+        # Configuración anterior: un único pool para lecturas y escrituras
+        read_engine = write_engine
+    
+    stats = {"reads": 0, "writes": 0, "errors": 0}
+    read_latencies = []
+    deadline = time.perf_counter() + args.duration
+    
+    async def writer():
+        while time.perf_counter() < deadline:
+            now = datetime.utcnow()
+            cid = random.randint(1, args.conversations)
+            try:
+                async with write_engine.begin() as conn:
+                    await conn.execute(INSERT_MESSAGE, {"cid": cid, "content": "y" * 200, "now": now})
+                    await conn.execute(UPDATE_CONVERSATION, {"cid": cid, "now": now})
+                stats["writes"] += 1
+            except OperationalError:
+                stats["errors"] += 1
+    
+    async def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with read_engine.connect() as conn:
+                    await conn.execute(HISTORY_QUERY, {"cid": random.randint(1, args.conversations)})
+                read_latencies.append((time.perf_counter() - start) * 1000)
+                stats["reads"] += 1
+            except OperationalError:
+                stats["errors"] += 1
+    
+    await asyncio.gather(
+        *(writer() for _ in range(args.writers)),
+        *(reader() for _ in range(args.readers))
+    )
+    
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    
+    return {
+        "profile": profile,
+        "reads_per_s": round(stats["reads"] / args.duration, 1),
+        "writes_per_s": round(stats["writes"] / args.duration, 1),
+        "read_p50_ms": round(statistics.median(read_latencies), 2) if read_latencies else 0.0,
+        "read_p95_ms": round(percentile(read_latencies, 95), 2),
+        "errors": stats["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lecturas de SQLite bajo escrituras concurrentes")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="Segundos por perfil")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000, help="Mensajes iniciales")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    
+    results = [asyncio.run(run_profile(profile, args)) for profile in ("default", "production")]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    print(f"{args.writers} escritores, {args.readers} lectores, {args.duration:.0f} s por perfil\n")
+    print(f"{'perfil':<12}{'lecturas/s':>12}{'escrituras/s':>14}{'p50 ms':>10}{'p95 ms':>10}{'errores':>9}")
+    for result in results:
+        print(
+            f"{result['profile']:<12}{result['reads_per_s']:>12}{result['writes_per_s']:>14}"
+            f"{result['read_p50_ms']:>10}{result['read_p95_ms']:>10}{result['errors']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: turnos de chat escritos por segundo según la estrategia de commit
+
+- per-step: un commit por paso (conversación, mensaje del usuario, mensaje
+  del asistente y contadores), como antes de la unidad de trabajo
+- single: el turno completo en una transacción
+- group: unidades de trabajo agrupadas por GroupCommitWriter
+
+Uso:
+    python benchmarks/turn_writes.py --concurrency 32 --turns 20
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from backend import migrations  # noqa: E402
+from backend.config import settings  # noqa: E402
+from backend.database import configure_connections  # noqa: E402
+from backend.group_commit import GroupCommitWriter  # noqa: E402
+from backend.models import Conversation, Message  # noqa: E402
+from backend.routes.chat import _record_turn  # noqa: E402
+
+MODES = ("per-step", "single", "group")
+
+
+async def turn_per_step(session_factory, index: int):
+    async with session_factory() as db:
+        conversation = Conversation(title=f"Bench {index}", user_id=1)
+        db.add(conversation)
+        await db.commit()
+        
+        db.add(Message(conversation_id=conversation.id, role="user", content="Hola " * 40))
+        await db.commit()
+        
+        db.add(Message(conversation_id=conversation.id, role="assistant", content="Respuesta " * 80))
+        await db.commit()
+        
+        await db.execute(_record_turn(conversation.id, "Respuesta", datetime.utcnow()))
+        await db.commit()
+
+
+def turn_unit(index: int):
+    """Unidad de trabajo de un turno completo (sin commit)"""
+    async def work(db):
+        conversation = Conversation(title=f"Bench {index}", user_id=1)
+        db.add(conversation)
+        await db.flush()
+        db.add_all([
+            Message(conversation_id=conversation.id, role="user", content="Hola " * 40),
+            Message(conversation_id=conversation.id, role="assistant", content="Respuesta " * 80),
+        ])
+        await db.execute(_record_turn(conversation.id, "Respuesta", datetime.utcnow()))
+        return conversation.id
+    return work
+
+
+async def run_mode(mode: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="turn-bench-")
+    path = os.path.join(workdir, "bench.db")
+    
+    sync_engine = create_engine(f"sqlite:///{path}")
+    migrations.upgrade(sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, username, hashed_password, is_active) "
+            "VALUES (1, 'bench@example.com', 'bench', 'x', 1)"
+        ))
+    sync_engine.dispose()
+    
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.concurrency)
+    configure_connections(engine.sync_engine, profile=args.profile)
+    
+    session_factory = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+    writer = GroupCommitWriter(session_factory, max_batch=args.batch, max_delay=args.delay_ms / 1000)
+    
+    async def client(worker: int):
+        for turn in range(args.turns):
+            index = worker * args.turns + turn
+            if mode == "per-step":
+                await turn_per_step(session_factory, index)
+            elif mode == "single":
+                async with session_factory() as db:
+                    await turn_unit(index)(db)
+                    await db.commit()
+            else:
+                await writer.submit(turn_unit(index))
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(client(worker) for worker in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    
+    await writer.shutdown()
+    await engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    
+    turns = args.concurrency * args.turns
+    return {
+        "mode": mode,
+        "turns": turns,
+        "seconds": round(elapsed, 3),
+        "turns_per_s": round(turns / elapsed, 1),
+        "avg_batch": writer.stats()["avg_batch"] if mode == "group" else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turnos de chat escritos por segundo")
+    parser.add_argument("--concurrency", type=int, default=32, help="Turnos simultáneos")
+    parser.add_argument("--turns", type=int, default=20, help="Turnos por cliente")
+    parser.add_argument("--profile", default="production", choices=("default", "production"))
+    parser.add_argument("--synchronous", default="FULL", help="PRAGMA synchronous (FULL = fsync por commit)")
+    parser.add_argument("--batch", type=int, default=64, help="Máximo de turnos por lote (group)")
+    parser.add_argument("--delay-ms", type=float, default=2.0, help="Espera máxima del lote (group)")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    # Lo aplican los pragmas del perfil "production" en cada conexión
+    settings.SQLITE_SYNCHRONOUS = args.synchronous
+    
+    results = [asyncio.run(run_mode(mode, args)) for mode in MODES]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    baseline = results[0]["turns_per_s"]
+    print(f"{args.concurrency} clientes x {args.turns} turnos, perfil {args.profile}, synchronous={args.synchronous}\n")
+    print(f"{'modo':<10}{'turnos/s':>10}{'x':>7}{'lote medio':>12}")
+    for result in results:
+        speedup = result["turns_per_s"] / baseline if baseline else 0
+        print(f"{result['mode']:<10}{result['turns_per_s']:>10}{speedup:>7.1f}{result['avg_batch']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 -- Script SQL para PostgreSQL
--- Este archivo es opcional, SQLAlchemy crea las tablas automáticamente
--- Úsalo si prefieres crear las tablas manualmente
+-- Este archivo es opcional: el backend aplica sus migraciones al arrancar
+-- (python -m backend.migrations upgrade). Refleja el esquema de la versión 7.
+-- Si creas las tablas con este script, la primera ejecución de las
+-- migraciones las adopta sin modificarlas.
 
 -- Crear base de datos
 CREATE DATABASE ai_chatbot;
@@ -24,7 +26,13 @@ CREATE TABLE conversations (
     title VARCHAR(255) DEFAULT 'Nueva conversación',
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message_preview VARCHAR,
+    last_message_at TIMESTAMP,
+    -- Archivo en frío: fichero con los mensajes (NULL = en la tabla messages)
+    archive_file VARCHAR,
+    rehydrated_at TIMESTAMP
 );
 
 -- Tabla de mensajes
@@ -33,13 +41,37 @@ CREATE TABLE messages (
     conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
     role VARCHAR(50) NOT NULL CHECK (role IN ('user', 'assistant')),
     content TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    blob_hash VARCHAR(64)
+);
+
+-- Cuerpos grandes comprimidos y deduplicados (solo se usa con SQLite; en
+-- PostgreSQL el contenido va en línea y TOAST lo comprime)
+CREATE TABLE message_blobs (
+    hash VARCHAR(64) PRIMARY KEY,
+    codec VARCHAR(8) NOT NULL,
+    size INTEGER NOT NULL,
+    data BYTEA NOT NULL
+);
+
+-- Identificador aleatorio de la base de datos (lo usa el índice vectorial)
+CREATE TABLE database_instance (
+    id VARCHAR(32) PRIMARY KEY
 );
+INSERT INTO database_instance (id) VALUES (md5(random()::text));
 
 -- Índices para optimizar consultas
-CREATE INDEX idx_users_email ON users(email);
-CREATE INDEX idx_conversations_user_id ON conversations(user_id);
-CREATE INDEX idx_messages_conversation_id ON messages(conversation_id);
+CREATE INDEX ix_users_email ON users(email);
+CREATE INDEX ix_users_username ON users(username);
+-- Listado paginado de conversaciones de un usuario
+CREATE INDEX ix_conversations_user_updated ON conversations(user_id, updated_at DESC, id DESC);
+-- Historial de una conversación en orden cronológico
+CREATE INDEX ix_messages_conversation_created ON messages(conversation_id, created_at, id);
+CREATE INDEX ix_messages_blob_hash ON messages(blob_hash);
+-- Búsqueda de texto completo (GET /api/search)
+ALTER TABLE messages ADD COLUMN content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED;
+CREATE INDEX ix_messages_content_tsv ON messages USING GIN (content_tsv);
 
 -- Trigger para actualizar updated_at automáticamente
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -3,6 +3,9 @@ const API_URL = 'http://localhost:8000/api';
 let authToken = localStorage.getItem('authToken');
 let currentUser = null;
 let currentConversationId = null;
+let olderMessagesCursor = null;     // Cursor para cargar mensajes anteriores
+let moreConversationsCursor = null; // Cursor para cargar más conversaciones
+let loadingPage = false;
 
 // ===== ELEMENTOS DEL DOM =====
 const authPage = document.getElementById('auth-page');
@@ -49,6 +52,10 @@ function showToast(message, type = 'info') {
 }
 
 async function apiRequest(endpoint, options = {}) {
+    // withCursor: devolver también la cabecera X-Next-Cursor ({ data, nextCursor })
+    const { withCursor, ...fetchOptions } = options;
+    options = fetchOptions;
+    
     const defaultOptions = {
         headers: {
             'Content-Type': 'application/json',
@@ -78,7 +85,12 @@ async function apiRequest(endpoint, options = {}) {
             }
         }
         
-        return await response.json();
+        const data = await response.json();
+        
+        if (withCursor) {
+            return { data, nextCursor: response.headers.get('X-Next-Cursor') };
+        }
+        return data;
     } catch (error) {
         console.error('Error en apiRequest:', error);
         if (error.message.includes('Failed to fetch')) {
@@ -198,17 +210,31 @@ function showChatPage() {
 
 // ===== CONVERSACIONES =====
 
-async function loadConversations() {
+async function loadConversations(append = false) {
     try {
-        const conversations = await apiRequest('/conversations/');
-        renderConversations(conversations);
+        const query = append && moreConversationsCursor ? `?cursor=${encodeURIComponent(moreConversationsCursor)}` : '';
+        const { data, nextCursor } = await apiRequest(`/conversations/${query}`, { withCursor: true });
+        
+        moreConversationsCursor = nextCursor;
+        renderConversations(data, append);
     } catch (error) {
         showToast('Error al cargar conversaciones', 'error');
     }
 }
 
-function renderConversations(conversations) {
-    if (conversations.length === 0) {
+// Cargar más conversaciones al llegar al final de la barra lateral
+conversationsList.addEventListener('scroll', async () => {
+    const nearBottom = conversationsList.scrollTop + conversationsList.clientHeight >= conversationsList.scrollHeight - 50;
+    
+    if (nearBottom && moreConversationsCursor && !loadingPage) {
+        loadingPage = true;
+        await loadConversations(true);
+        loadingPage = false;
+    }
+});
+
+function renderConversations(conversations, append = false) {
+    if (conversations.length === 0 && !append) {
         conversationsList.innerHTML = `
             <div style="padding: 20px; text-align: center; color: var(--text-secondary);">
                 No hay conversaciones aún.<br>
@@ -218,20 +244,28 @@ function renderConversations(conversations) {
         return;
     }
     
-    conversationsList.innerHTML = conversations.map(conv => `
+    const html = conversations.map(conv => `
         <div class="conversation-item ${conv.id === currentConversationId ? 'active' : ''}" 
              data-id="${conv.id}">
             <div class="conversation-title">${conv.title}</div>
+            ${conv.last_message_preview ? `<div class="conversation-preview">${escapeHtml(conv.last_message_preview)}</div>` : ''}
             <div class="conversation-meta">
                 <span>${conv.message_count || 0} mensajes</span>
-                <span>${formatTime(conv.updated_at)}</span>
+                <span>${formatTime(conv.last_message_at || conv.updated_at)}</span>
             </div>
             <button class="conversation-delete" data-id="${conv.id}">×</button>
         </div>
     `).join('');
     
-    // Event listeners para conversaciones
-    document.querySelectorAll('.conversation-item').forEach(item => {
+    if (append) {
+        conversationsList.insertAdjacentHTML('beforeend', html);
+    } else {
+        conversationsList.innerHTML = html;
+    }
+    
+    // Event listeners para conversaciones (solo los elementos nuevos)
+    document.querySelectorAll('.conversation-item:not([data-bound])').forEach(item => {
+        item.dataset.bound = 'true';
         item.addEventListener('click', (e) => {
             if (!e.target.classList.contains('conversation-delete')) {
                 const convId = parseInt(item.dataset.id);
@@ -241,7 +275,8 @@ function renderConversations(conversations) {
     });
     
     // Event listeners para botones de eliminar
-    document.querySelectorAll('.conversation-delete').forEach(btn => {
+    document.querySelectorAll('.conversation-delete:not([data-bound])').forEach(btn => {
+        btn.dataset.bound = 'true';
         btn.addEventListener('click', async (e) => {
             e.stopPropagation();
             const convId = parseInt(btn.dataset.id);
@@ -274,6 +309,7 @@ async function loadConversation(convId) {
         const data = await apiRequest(`/chat/history/${convId}`);
         
         currentConversationId = convId;
+        olderMessagesCursor = data.next_cursor;
         renderMessages(data.messages);
         showChatInterface();
         
@@ -296,6 +332,7 @@ newChatBtn.addEventListener('click', () => {
 });
 
 function showWelcomeScreen() {
+    olderMessagesCursor = null;
     welcomeScreen.style.display = 'flex';
     chatMessages.style.display = 'none';
     chatMessages.innerHTML = '';
@@ -311,11 +348,8 @@ function showChatInterface() {
 
 // ===== MENSAJES =====
 
-function renderMessages(messages) {
-    welcomeScreen.style.display = 'none';
-    chatMessages.style.display = 'flex';
-    
-    chatMessages.innerHTML = messages.map(msg => `
+function messageHtml(msg) {
+    return `
         <div class="message ${msg.role}">
             <div class="message-avatar">
                 ${msg.role === 'user' ? '👤' : '🤖'}
@@ -325,11 +359,42 @@ function renderMessages(messages) {
                 <div class="message-time">${formatTime(msg.created_at)}</div>
             </div>
         </div>
-    `).join('');
+    `;
+}
+
+function renderMessages(messages) {
+    welcomeScreen.style.display = 'none';
+    chatMessages.style.display = 'flex';
+    
+    chatMessages.innerHTML = messages.map(messageHtml).join('');
     
     scrollToBottom();
 }
 
+// Cargar mensajes anteriores al llegar al principio del chat
+chatMessages.addEventListener('scroll', async () => {
+    if (chatMessages.scrollTop > 50 || !olderMessagesCursor || loadingPage) return;
+    
+    loadingPage = true;
+    const convId = currentConversationId;
+    
+    try {
+        const data = await apiRequest(`/chat/history/${convId}?cursor=${encodeURIComponent(olderMessagesCursor)}`);
+        if (convId !== currentConversationId) return;
+        
+        // Mantener la posición visible tras insertar arriba
+        const previousHeight = chatMessages.scrollHeight;
+        chatMessages.insertAdjacentHTML('afterbegin', data.messages.map(messageHtml).join(''));
+        chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+        
+        olderMessagesCursor = data.next_cursor;
+    } catch (error) {
+        showToast('Error al cargar mensajes anteriores', 'error');
+    } finally {
+        loadingPage = false;
+    }
+});
+
 function addMessage(role, content, createdAt = new Date().toISOString()) {
     const messageEl = document.createElement('div');
     messageEl.className = `message ${role}`;
@@ -345,6 +410,8 @@ function addMessage(role, content, createdAt = new Date().toISOString()) {
     
     chatMessages.appendChild(messageEl);
     scrollToBottom();
+    
+    return messageEl;
 }
 
 function showTypingIndicator() {
@@ -385,6 +452,56 @@ function escapeHtml(text) {
 
 // ===== ENVIAR MENSAJE =====
 
+async function streamChat(message, handlers) {
+    const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${authToken}`,
+        },
+        body: JSON.stringify({
+            message,
+            conversation_id: currentConversationId
+        }),
+    });
+    
+    if (!response.ok) {
+        let detail = `Error ${response.status}: ${response.statusText}`;
+        try {
+            detail = (await response.json()).detail || detail;
+        } catch (e) {}
+        throw new Error(detail);
+    }
+    
+    // Leer eventos SSE (separados por línea en blanco) según van llegando
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const rawEvent of events) {
+            let eventName = 'message';
+            let data = '';
+            
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            
+            if (handlers[eventName] && data) {
+                handlers[eventName](JSON.parse(data));
+            }
+        }
+    }
+}
+
 chatForm.addEventListener('submit', async (e) => {
     e.preventDefault();
     
@@ -410,22 +527,34 @@ chatForm.addEventListener('submit', async (e) => {
     showTypingIndicator();
     
     try {
-        const data = await apiRequest('/chat/', {
-            method: 'POST',
-            body: JSON.stringify({
-                message,
-                conversation_id: currentConversationId
-            }),
-        });
+        let assistantText = null;
         
-        // Actualizar ID de conversación si es nueva
-        if (!currentConversationId) {
-            currentConversationId = data.conversation_id;
-        }
-        
-        // Ocultar indicador y mostrar respuesta
-        hideTypingIndicator();
-        addMessage('assistant', data.assistant_message.content, data.assistant_message.created_at);
+        await streamChat(message, {
+            start: (data) => {
+                // Actualizar ID de conversación si es nueva
+                if (!currentConversationId) {
+                    currentConversationId = data.conversation_id;
+                }
+            },
+            delta: (data) => {
+                // Sustituir el indicador por el mensaje en cuanto llega el primer token
+                if (!assistantText) {
+                    hideTypingIndicator();
+                    assistantText = addMessage('assistant', '').querySelector('.message-text');
+                }
+                assistantText.textContent += data.content;
+                scrollToBottom();
+            },
+            done: (data) => {
+                hideTypingIndicator();
+                if (!assistantText) {
+                    addMessage('assistant', data.assistant_message.content, data.assistant_message.created_at);
+                }
+            },
+            error: (data) => {
+                throw new Error(data.detail);
+            },
+        });
         
         // Recargar lista de conversaciones
         loadConversations();